@@ -15,19 +15,124 @@ __maintainer__ = "Fabrice F."
 __email__ = ""
 __status__ = "Development"
 
-from flask import Flask, render_template, redirect, url_for, flash, get_flashed_messages, request
+from flask import Flask, render_template, redirect, url_for, flash, get_flashed_messages, request, Response, stream_with_context, send_file, abort, jsonify, g
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField
 from wtforms.validators import DataRequired
-import json, plotly
+import json, plotly, os, time, gzip, hashlib, threading
+import pandas as pd
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 import pyats
+from pyatsm.live import LiveView, LocalFeed, TICK_INTERVALS
+from pyatsm.coord import SINGLE_FLIGHT
+from pyatsm.prewarm import record_request
+from pyatsm.alerts import FileSink, QueuedSubscriber, DATA_EVENTS
+from pyatsm.signal_index import SignalIndex, SCREENS
+from pyatsm.symbol_store import SymbolStore
+from pyatsm.schema import read_last_date
+from pyatsm.image_store import get_image_store
+from pyatsm import lod, api
 
 
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'pyATS-secret-key'
+SIGNAL_INDEX = None # Index of the indicators, opened on first use (see get_signal_index)
+SIGNAL_INDEX_LOCK = threading.Lock()
+
+def get_signal_index():
+    global SIGNAL_INDEX
+    with SIGNAL_INDEX_LOCK:
+        if SIGNAL_INDEX == None:
+            SIGNAL_INDEX = SignalIndex(get_env=lambda symbol, intra: pyats.EnvATS(symbol,intra=intra,figure=False))
+    return SIGNAL_INDEX
+
+# Index refreshed in the background when a download changes the data of a symbol, not in the request
+INDEX_EVENTS = QueuedSubscriber(lambda: get_signal_index().on_event).subscribe(DATA_EVENTS)
+
+def add_timing(stage,start):
+    ''' Duration of a stage of the request since start, returned in the Server-Timing header (see loadtest) '''
+    g.setdefault('timings',[]).append([stage,time.time()-start])
+    return time.time()
+
+@app.after_request
+def server_timing(response):
+    timings = g.get('timings')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join([stage+';dur='+str(round(1000*dur,1)) for stage, dur in timings])
+    if request.path.startswith('/static/png/') and response.status_code in [200,304]:
+        # Names of the images include the date of the last bar: never modified
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+COMPRESSED = {} # Last payloads compressed: {etag with encoding: bytes}
+COMPRESSED_MAX = 64
+COMPRESSED_LOCK = threading.Lock()
+
+def get_view_etag(symbol,intra=False,**options):
+    ''' Strong ETag of the view of a symbol: last bar date and size of the data file, and options. None if no data '''
+    data_file = pyats.get_data_file(symbol,intra)
+    try:
+        size = os.path.getsize(data_file)
+        last_date = read_last_date(data_file)
+    except OSError:
+        return None
+    key = repr((symbol,intra,str(last_date),size,sorted(options.items())))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def get_encoding():
+    ''' Best compression accepted by the client: br (if brotli is installed), gzip, or None '''
+    if brotli != None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(key,body,encoding):
+    ''' Body compressed once for all the clients of the same payload '''
+    with COMPRESSED_LOCK:
+        if key in COMPRESSED:
+            return COMPRESSED[key]
+    if encoding == 'br':
+        payload = brotli.compress(body,quality=5)
+    else:
+        payload = gzip.compress(body,compresslevel=6)
+    with COMPRESSED_LOCK:
+        if len(COMPRESSED) >= COMPRESSED_MAX:
+            del COMPRESSED[next(iter(COMPRESSED))] # Oldest first
+        COMPRESSED[key] = payload
+    return payload
+
+def cached_response(etag,build,mimetype):
+    '''
+    Response validated by a strong ETag: 304 Not Modified if the client has it (build not called),
+    else the body returned by build(), compressed when the client accepts it (404 if None)
+    '''
+    encoding = get_encoding()
+    if encoding != None:
+        etag = etag+'-'+encoding # 1 representation per encoding
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = build()
+        if body == None:
+            abort(404)
+        if isinstance(body,str):
+            body = body.encode()
+        if encoding != None:
+            response = Response(compress(etag,body,encoding),mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = Response(body,mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache' # Revalidated at each visit: new bars give a new ETag
+    return response
 
 @app.route("/", methods=['GET', 'POST'])
 @app.route("/index")
@@ -35,6 +140,10 @@ def index():
     #return "<h1>Hello,</h1> World!"    
     return render_template('index.html')
 
+def build_graph(symbol,name):
+    ''' Figure of the AT.S view in JSON, None if no data (built once for concurrent requests of the symbol, cached until new data) '''
+    return pyats.get_view_json(symbol,name)
+
 @app.route('/ats', methods=['GET', 'POST'])
 @app.route('/ats/<symbol>', methods=['GET', 'POST'])
 def ats(symbol=None):
@@ -44,23 +153,253 @@ def ats(symbol=None):
 
     name = ""
 
+    record_request(symbol) # Most requested symbols are prewarmed first
+    start = time.time()
     ticker = pyats.Ticker(symbol)
     ticker.download_data_from_ticker()
+    start = add_timing('download',start)
     #Dowload data
     if symbol == 'DBA':
         name = "DBA"
 
-    #Generate AT.S view and save PNG 
-    s_env = pyats.EnvATS(symbol,name)
-    if s_env.get_status() == 1:
-        fig = s_env.create_ats_view()
-        img_path = "/static/"+s_env.get_img()
-        print(img_path)
-        graphJSON = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
-        return render_template('ats.html',symbol=symbol,img_path=img_path,graphJSON=graphJSON)
+    #AT.S view loaded by the page from ats_json, PNG is only rendered if requested (see ats_png)
+    live = request.args.get('live') != None
+    etag = get_view_etag(symbol,live=live)
+    if etag != None:
+        def build():
+            img_path = url_for('ats_png',symbol=symbol)
+            graph_url = url_for('ats_json',symbol=symbol)
+            return render_template('ats.html',symbol=symbol,img_path=img_path,graph_url=graph_url,live=live)
+        response = cached_response(etag,build,'text/html')
+        add_timing('render',start)
+        return response
 
     return render_template('index.html')   
 
+@app.route('/ats/<symbol>.json')
+def ats_json(symbol):
+    ''' Figure of the AT.S view in JSON, compressed and validated by its ETag (304 until a new bar) '''
+    name = ""
+    if symbol == 'DBA':
+        name = "DBA"
+    etag = get_view_etag(symbol)
+    if etag == None:
+        abort(404)
+    start = time.time()
+    response = cached_response(etag,lambda: SINGLE_FLIGHT.do(('view',symbol),build_graph,symbol,name),'application/json')
+    add_timing('view',start)
+    return response
+
+@app.route('/ats/<symbol>.png')
+def ats_png(symbol):
+    ''' PNG image of the AT.S view, rendered on first request then served from static/png/ '''
+    try:
+        last_date = read_last_date(pyats.get_data_file(symbol))
+    except OSError:
+        last_date = None
+    images = []
+    if last_date != None: # Image of the last bar already in the store: no data loaded
+        images = [row['path'] for row in get_image_store().find(symbol,str(last_date.date()),'view')
+                  if row['path'].startswith('static/')]
+    if len(images) > 0:
+        img_file = images[0]
+    else:
+        name = ""
+        if symbol == 'DBA':
+            name = "DBA"
+        s_env = pyats.EnvATS(symbol,name)
+        if s_env.get_status() != 1:
+            abort(404)
+        img_file = "static/"+s_env.get_img() # Name includes the last date: a new bar gives a new image
+        if not os.path.exists(img_file):
+            SINGLE_FLIGHT.do(('png',img_file),s_env.export_images,local=False,overwrite=False)
+    # Dated image served by the static route, cached by the browsers (see server_timing)
+    response = redirect(url_for('static',filename=img_file[len('static/'):]))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/ats/<symbol>/live')
+def ats_live(symbol):
+    ''' Server-Sent Events: changes of the AT.S view for each tick of the (local) feed '''
+    name = ""
+    if symbol == 'DBA':
+        name = "DBA"
+    try:
+        interval = float(request.args.get('interval',1))
+    except ValueError:
+        return Response('WARNING: interval must be a number',status=400)
+    if interval != interval: # NaN
+        return Response('WARNING: interval must be a number',status=400)
+    interval = max(TICK_INTERVALS[0],min(interval,TICK_INTERVALS[1]))
+    view = LiveView(pyats.EnvATS(symbol,name))
+    if view.get_status() != 1:
+        return Response('WARNING: no data for '+symbol,status=404)
+    feed = LocalFeed(view.get_data())
+
+    def stream():
+        for tick in feed.ticks(interval):
+            delta = view.update(tick)
+            yield 'data: '+json.dumps(delta, cls=plotly.utils.PlotlyJSONEncoder)+'\n\n'
+
+    return Response(stream_with_context(stream()),mimetype='text/event-stream',headers={'Cache-Control':'no-cache'})
+
+def get_pyramid(symbol,intra=False):
+    ''' Level of detail pyramid of the full history of the symbol, None if no data '''
+    data_file = pyats.get_data_file(symbol,intra)
+    if not os.path.exists(data_file):
+        return None
+    key = pyats.get_store_key(symbol,intra)
+    return lod.get_pyramid(key,SymbolStore().load(key,data_file))
+
+@app.route('/ats/<symbol>/history')
+def ats_history(symbol):
+    ''' Zoomable chart of the full history (WebGL), bars of the visible dates loaded from ats_lod '''
+    intra = request.args.get('intra') != None
+    start = time.time()
+    pyramid = get_pyramid(symbol,intra)
+    if pyramid == None:
+        abort(404)
+    start = add_timing('data',start)
+    level, df = pyramid.get_window()
+    fig = lod.get_figure(symbol+' - full history',df)
+    graphJSON = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    start = add_timing('view',start)
+    lod_url = url_for('ats_lod',symbol=symbol,intra=1) if intra else url_for('ats_lod',symbol=symbol)
+    page = render_template('history.html',symbol=symbol,graphJSON=graphJSON,lod_url=lod_url)
+    add_timing('render',start)
+    return page
+
+def get_invalid_dates(params,names):
+    ''' Names of the parameters which are not valid dates (parsed later with pd.Timestamp) '''
+    invalid = []
+    for name in names:
+        if params.get(name) != None:
+            try:
+                pd.Timestamp(params[name])
+            except (ValueError,TypeError):
+                invalid.append(name)
+    return invalid
+
+@app.route('/ats/<symbol>/lod')
+def ats_lod(symbol):
+    ''' Bars between start and end, at the finest level with at most max_bars bars (constant payload) '''
+    try:
+        max_bars = int(request.args.get('bars',lod.MAX_BARS))
+    except ValueError:
+        return Response('WARNING: bars must be an integer',status=400)
+    max_bars = max(1,min(max_bars,5000))
+    invalid = get_invalid_dates(request.args,['start','end'])
+    if len(invalid) > 0:
+        return Response('WARNING: invalid dates - '+','.join(invalid),status=400)
+    pyramid = get_pyramid(symbol,request.args.get('intra') != None)
+    if pyramid == None:
+        abort(404)
+    level, df = pyramid.get_window(request.args.get('start'),request.args.get('end'),max_bars)
+    return jsonify({'level':level,'bars':len(df),'traces':lod.get_traces(df)})
+
+def get_api_params():
+    ''' Parameters of the API requests, from the query string or a JSON body (batch of symbols) '''
+    params = request.get_json(silent=True)
+    if params == None:
+        params = request.args.to_dict()
+
+    def as_list(value):
+        if value == None or isinstance(value,list):
+            return value
+        return [v for v in str(value).split(',') if v != '']
+
+    return {'symbols':as_list(params.get('symbols',params.get('symbol'))),
+            'periods':as_list(params.get('periods')),
+            'columns':as_list(params.get('columns')),
+            'start':params.get('start'),
+            'end':params.get('end'),
+            'as_of':params.get('as_of'),
+            'format':params.get('format','json'),
+            }
+
+def iter_api_tables(params,get_table):
+    ''' Tables [symbol, period, arrays] of the request, computed symbol after symbol (local data, no Plotly figure) '''
+    for symbol in params['symbols']:
+        s_env = pyats.EnvATS(symbol,as_of=params['as_of'],figure=False)
+        if s_env.get_status() != 1:
+            print('WARNING: no data for '+symbol)
+            continue
+        periods = params['periods']
+        if periods == None:
+            periods = s_env.periods
+        for period in periods:
+            if period in s_env.periods:
+                yield [symbol,period,get_table(s_env,period)]
+
+def api_response(params,get_table):
+    ''' Response of the API in the requested format: json, arrow (streamed) or npz '''
+    if params['symbols'] == None:
+        return Response('WARNING: no symbols requested',status=400)
+    invalid = get_invalid_dates(params,['start','end','as_of'])
+    if len(invalid) > 0:
+        return Response('WARNING: invalid dates - '+','.join(invalid),status=400)
+    fmt = params['format']
+    if fmt not in api.FORMATS:
+        return Response('WARNING: format not supported - '+str(fmt),status=400)
+    tables = iter_api_tables(params,get_table)
+    if fmt == 'arrow':
+        if api.pa == None:
+            return Response('WARNING: pyarrow not installed, use format json or npz',status=501)
+        return Response(stream_with_context(api.iter_arrow(tables)),mimetype=api.FORMATS[fmt])
+    if fmt == 'npz':
+        return Response(api.to_npz(tables),mimetype=api.FORMATS[fmt])
+    return jsonify(api.to_json(tables))
+
+@app.route('/api/series', methods=['GET', 'POST'])
+def api_series():
+    ''' OHLC and indicators of each UT: symbols, periods, columns, start, end, as_of, format '''
+    params = get_api_params()
+    columns = params['columns']
+    if columns != None and len(set(columns)-set(api.SERIES_COLS)) > 0:
+        return Response('WARNING: unknown columns - '+','.join(sorted(set(columns)-set(api.SERIES_COLS))),status=400)
+    return api_response(params,lambda s_env, period: api.get_series(s_env,period,columns,params['start'],params['end']))
+
+@app.route('/api/signals', methods=['GET', 'POST'])
+def api_signals():
+    ''' Signals of each UT on the last bar (or as_of date): symbols, periods, as_of, format '''
+    params = get_api_params()
+    return api_response(params,lambda s_env, period: api.get_signal_table(s_env.get_ut_signals(s_env.get_ut(period),period)))
+
+@app.route('/alerts')
+def alerts():
+    ''' Last alerts on the AT.S signals, written by the alert engine (pyats.py --alerts) '''
+    try:
+        limit = int(request.args.get('limit',100))
+    except ValueError:
+        return Response('WARNING: limit must be an integer',status=400)
+    limit = max(1,min(limit,1000))
+    symbol = request.args.get('symbol')
+    records = FileSink().read(limit)
+    if symbol != None:
+        records = [record for record in records if record['symbol'] == symbol]
+    return render_template('alerts.html',alerts=records,symbol=symbol)
+
+@app.route('/api/screen')
+def api_screen():
+    ''' Symbols near an indicator, from the index: indicator, timeframe, max_dist, trend, side, limit '''
+    indicator = request.args.get('indicator','m20')
+    side = request.args.get('side','low')
+    if indicator not in SCREENS or side not in ['low','high']:
+        return Response('WARNING: unknown indicator or side - '+indicator+' '+side,status=400)
+    trend = request.args.get('trend')
+    if trend not in [None,'up','down']:
+        return Response('WARNING: unknown trend - '+trend,status=400)
+    try:
+        max_dist = float(request.args.get('max_dist',0.5))
+        limit = request.args.get('limit')
+        limit = None if limit == None else max(1,int(limit))
+    except ValueError:
+        return Response('WARNING: max_dist must be a number and limit an integer',status=400)
+    if not max_dist >= 0: # Negative or NaN
+        return Response('WARNING: max_dist must be positive',status=400)
+    rows = get_signal_index().screen(indicator,request.args.get('timeframe'),max_dist,trend,side,limit)
+    return jsonify(rows)
+
 @app.route("/bonjour", methods=['POST'])
 def bonjour():
     print("bonjour 234")
@@ -20,17 +20,34 @@ __status__ = "Development"
 ##############################################################################
 ### IMPORT SECTION
 ##############################################################################
-import argparse, os, time,datetime
+import argparse, os, time,datetime, json
 import pandas as pd
 import numpy as np
 from datetime import datetime,timedelta,date
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+import plotly
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 
 from pyatsm.price_data import AlphaVantageData, Darwinex, StockYFdata
-from pyatsm.taindic import TAindicators
+from pyatsm.taindic import IndicatorGraph
+from pyatsm.ind_cache import IndicatorCache
+from pyatsm.sessions import aggregate_session, get_exchange, get_rangebreaks, resample_ohlc
+from pyatsm.symbol_store import SymbolStore
+from pyatsm.signals import SignalEngine, LINES, LABELS
+from pyatsm.coord import SINGLE_FLIGHT, FileLock
+from pyatsm.schema import read_prices, PRICE_COLS
+from pyatsm.chunked import ChunkedHistory, use_chunks, CHUNK_BUDGET, INTRA_PERIODS
+from pyatsm.native_bars import NativeBars, INTERVAL_SUFFIXES, NATIVE_INTERVALS, NATIVE_PERIODS, NATIVE_DISTANCES
+from pyatsm.asof import AsOfData
+from pyatsm.fast_fig import FastFigure
+from pyatsm.prewarm import ViewCache, PrewarmScheduler, LocalClock, read_watchlist
+from pyatsm.alerts import DATA_EVENTS, DataEvent, AlertEngine, FileSink, PrintSink, WebhookSink
+from pyatsm.signal_index import SignalIndex
+from pyatsm.image_store import get_image_store
 
 
 
@@ -49,6 +66,52 @@ def print_duration():
         string_dur = " --- %s seconds ---" % (round(dur,2))
     return string_dur
 
+def get_data_file(symbol,intra=False,interval='1d'):
+    """
+    :return: CSV data file of the symbol (intraday data in <symbol>_intra.csv,
+             weekly / monthly bars of the provider in <symbol>_weekly.csv / <symbol>_monthly.csv)
+    """
+    data_folder = "./data/"
+    CURRENT_PATH=os.getcwd()
+    if CURRENT_PATH.find('pyatsm')>0:
+        data_folder = "../data/"
+    if intra == True:
+        return data_folder+symbol+'_intra.csv'
+    return data_folder+symbol+INTERVAL_SUFFIXES[interval]+'.csv'
+
+def get_store_key(symbol,intra=False):
+    """
+    :return: Key of the symbol in the store (see pyatsm.symbol_store)
+    """
+    if symbol != "" and intra == True:
+        return symbol+'_intra'
+    return symbol
+
+def get_view_json(symbol,name="",rebuild=False):
+    """
+    :return: Figure of the AT.S view in JSON, None if no data
+             Read from the view cache while the data file did not change (see pyatsm.prewarm)
+    """
+    data_file = get_data_file(symbol)
+    views = ViewCache()
+    if not rebuild:
+        graph = views.load(symbol,data_file)
+        if graph != None:
+            return graph
+    s_env = EnvATS(symbol,name)
+    if s_env.get_status() != 1:
+        return None
+    graph = json.dumps(s_env.build_ats_view(),cls=plotly.utils.PlotlyJSONEncoder)
+    views.save(symbol,data_file,graph)
+    return graph
+
+TRACE_TYPES = {go.Ohlc:'ohlc',go.Scatter:'scatter'} # Types of the trace specs (see get_ut_traces)
+
+# Result of the compute stage of 1 UT (see EnvATS.compute_uts): bars, traces and signals, not modified afterwards
+UtView = namedtuple('UtView',['period','data','traces','signals'])
+UT_WORKERS = min(6,os.cpu_count() or 1) # 1 thread per UT at most
+UT_POOL = ThreadPoolExecutor(max_workers=UT_WORKERS,thread_name_prefix='ut') # Shared by the views of the process
+
 ##############################################################################
 ### CLASSES SECTION
 ##############################################################################
@@ -57,7 +120,7 @@ class EnvATS():
     """ 
     Class managing the Graphical Environment of asset with AT.S indicators
     """
-    def __init__(self,symbol="", name="", pur=False,ut=None,date_sig=None,intra=False,filename=None):
+    def __init__(self,symbol="", name="", pur=False,ut=None,date_sig=None,intra=False,filename=None,cache=True,store=True,as_of=None,figure=True,fast=True,workers=UT_WORKERS,chunked=None,budget=CHUNK_BUDGET,native=False):
         self.status = 1
         self.symbol = symbol
         self.name = name
@@ -76,57 +139,109 @@ class EnvATS():
         elif symbol in ['DBA', 'KWCBO', 'JTL']:
             dw = True
 
-        data_folder = "./data/"
-        CURRENT_PATH=os.getcwd()
-        if CURRENT_PATH.find('pyatsm')>0:
-            data_folder = "../data/"
         if filename != None:
             data_file = filename
         else:
-            data_file = data_folder+symbol+'.csv'
+            data_file = get_data_file(symbol,intra)
 
-        if os.path.exists(data_file):
+        if chunked == None: # Intraday histories larger than the memory budget are streamed
+            chunked = intra == True and as_of == None and use_chunks(data_file,budget)
+        self.chunked = None # Last bars of each UT, when the data file is streamed in chunks
+        self.native = None # Weekly / monthly bars of the provider, for the higher UTs (see pyatsm.native_bars)
+        if native == True and intra == False and as_of == None and symbol != "":
+            self.native = NativeBars(get_data_file(symbol,interval='1wk'),get_data_file(symbol,interval='1mo'))
+            if self.native.get_status() != 1:
+                self.native = None
+        if os.path.exists(data_file) and chunked == True:
+            print('INFO: Streaming data file: '+data_file)
+            self.chunked = ChunkedHistory(data_file,get_exchange(symbol),INTRA_PERIODS,budget=budget).run()
+            data = self.chunked.data # Last intraday bars only
+            if len(data) == 0:
+                print('WARNING: no data in '+data_file)
+                self.status = 0
+                return
+            self.data = data
+            last_date = str(data.tail(1).index.item().date())
+        elif os.path.exists(data_file) and store == True:
+            # OHLC arrays mapped from the store shared by all processes, the CSV is parsed only when it changes
+            data = SymbolStore().load(get_store_key(symbol,intra),data_file)
+            self.data = data
+            last_date = data.tail(1).index.item()
+            last_date = str(last_date.date())
+        elif os.path.exists(data_file):
             print('INFO: Reading data file: '+data_file)
-            data = pd.read_csv(data_file,index_col='Date',parse_dates=['Date'])
+            data = read_prices(data_file)[PRICE_COLS] # Same columns and dtypes whatever the source
             data['Date'] = data.index
-            try:
-                data = data.drop('Volume',axis=1)
-            except:
-                print('WARNING: no column Volume')
-            self.data = data.copy()
+            self.data = data
             last_date = data.tail(1).index.item()
             last_date = str(last_date.date())       
+        elif self.native != None:
+            # No daily data: higher UTs only, no figure (e.g. screens of the index, API)
+            print('INFO: no daily data, higher UTs from the weekly / monthly bars of '+symbol)
+            data = self.native.get_ut('W')
+            self.data = data
+            last_date = str(self.native.last_date.date())
+            figure = False
         else:
             print('WARNING: file does not exist: '+data_file)
             self.status = 0
             return
+        self.history = None # Full history, when the view is as of a past date
+        if as_of != None:
+            self.history = AsOfData(data)
+            data = self.history.get_data(as_of)
+            if len(data) == 0:
+                print('WARNING: no data before '+str(as_of)+' in '+data_file)
+                self.status = 0
+                return
+            self.data = data
+            last_date = str(data.tail(1).index.item().date())
         self.last_date = last_date
+        self.img_name = symbol # Images of a data file without symbol named after the file
+        if symbol == "":
+            self.img_name = os.path.splitext(os.path.basename(data_file))[0]
         self.ut = ''
+        self.workers = workers # Threads computing the UTs of the view, 1 for a sequential computation
+        self.fast = fast # Figure built from dicts, without plotly validation (see pyatsm.fast_fig)
+        self.fig = None # No figure for data only (figure=False, e.g. API)
         if ut != None:
-            self.img_file = "png/"+symbol+'_'+last_date+"_"+ut+".png"
-            self.fig = self.__initiate_fig_ut(ut)
+            if figure:
+                self.fig = self.__initiate_fig_ut(ut)
             self.ut = ut
         elif intra == True:
-            self.img_file = "png/"+symbol+'_intra_'+last_date+".png"
             self.intraday = True
-            self.periods = ['5min','15min','30min','1H','3H','D']
-            self.fig = self.__initiate_fig()  
+            self.periods = INTRA_PERIODS
+            self.distances = [1,1,1,1,1,1]
+            if figure:
+                self.fig = self.__initiate_fig()
         else:
-            self.img_file = "png/"+symbol+'_'+last_date+".png"
-            self.fig = self.__initiate_fig()
+            if self.native != None and not os.path.exists(data_file):
+                self.periods = NATIVE_PERIODS
+                self.distances = NATIVE_DISTANCES
+            if figure:
+                self.fig = self.__initiate_fig()
+        self.img_file = self.__get_img_file()
         self.pur = pur # Ensure that there are no annotations on graphs
         self.date_sig = ''
         if date_sig != None:
             self.date_sig = date_sig
+        self.cache = None # Persistent cache of indicators
+        self.cache_key = get_store_key(symbol,intra) # Intraday UTs include 'D': not the same bars as the daily UT
+        if symbol == "":
+            self.cache_key = os.path.abspath(data_file)
+        if self.native != None:
+            self.cache_key = symbol+'_native' # Not the same bars as the resampled UTs
+        if cache == True and self.history == None:
+            # Not for views as of a past date: they would replace the entries of the last date
+            self.cache = IndicatorCache()
+        self.exchange = get_exchange(symbol)
+        self.ut_data = {} # Data aggregated for each UT (intraday)
+        if self.chunked != None:
+            self.ut_data = dict(self.chunked.uts)
+        self.signals = {} # Signals of each UT, evaluated on the last bar
+        self.built = False # Figure built (see build_ats_view)
         return
     
-    def __set_data_file(self):
-        ''' TODO '''
-        data_file = ""
-        symbol = self.symbol
-
-        return data_file
-
     def __initiate_fig(self):
         """ 
         Initialize a Plotly figure with 6 subplots 
@@ -138,14 +253,19 @@ class EnvATS():
         for period in self.periods:
             subtitles.append(symbol+' -'+period)
         
+        subplot_titles = (subtitles[0],subtitles[1],subtitles[2],subtitles[5],subtitles[4],subtitles[3])
+        if self.fast:
+            return FastFigure(rows=2,cols=3,subplot_titles=subplot_titles,horizontal_spacing=0.05,vertical_spacing=0.1)
         fig = make_subplots(rows=2, cols=3,
-                subplot_titles=(subtitles[0],subtitles[1],subtitles[2],subtitles[5],subtitles[4],subtitles[3]),
+                subplot_titles=subplot_titles,
                 horizontal_spacing = 0.05,vertical_spacing = 0.1)       
         return fig
     
     def __initiate_fig_ut(self,ut):
         """ Initialize a Plotly figure with 1 subplot """
         symbol = self.symbol
+        if self.fast:
+            return FastFigure(rows=1,cols=1,subplot_titles=[symbol+' -'+ut])
         fig = make_subplots(rows=1, cols=1,
             subplot_titles=[symbol+' -'+ut])
         return fig
@@ -153,13 +273,10 @@ class EnvATS():
     def __get_row_col_ids(self,period="D"):
         """ Return row and column ID depending on period """
         row_col = [1,1,0.3]
-        UTs = pd.DataFrame({'Period':self.periods,
-                            'Row':[1,1,1,2,2,2],
-                            'Col':[1,2,3,3,2,1],
-                            'Dist':self.distances,
-                            }).set_index('Period')
-        if period in UTs.index:
-            row_col = [UTs['Row'].loc[period],UTs['Col'].loc[period],UTs['Dist'].loc[period]]     
+        cells = [[1,1],[1,2],[1,3],[2,3],[2,2],[2,1]] # Cell of each period, in the order of self.periods
+        if period in self.periods:
+            i = self.periods.index(period)
+            row_col = cells[i]+[self.distances[i]]
         return row_col
 
     def get_fig(self):
@@ -170,36 +287,159 @@ class EnvATS():
         """ Return data class attribute for external access """
         return self.data
 
+    def __get_img_file(self):
+        """ :return: image of the view in png/, dated with the last bar """
+        if self.ut != '':
+            return "png/"+self.img_name+'_'+self.last_date+"_"+self.ut+".png"
+        elif self.intraday:
+            return "png/"+self.img_name+'_intra_'+self.last_date+".png"
+        return "png/"+self.img_name+'_'+self.last_date+".png"
+
     def get_img(self):
         return self.img_file
 
+    def get_img_kind(self):
+        """ :return: kind of the view in the image store: UT of a single UT view, 'intra' or 'view' """
+        if self.ut != '':
+            return self.ut
+        return 'intra' if self.intraday else 'view'
+
     def get_status(self):
         """ Return status class attribute for external access """
         return self.status
+
+    def get_signals(self):
+        """ Return signals of all UTs, once the view is created """
+        signals = []
+        for period in self.periods:
+            signals = signals+self.signals.get(period,[])
+        return signals
+        
+    def set_as_of(self,as_of,fig=True):
+        """
+        Move the view to another date of the history (e.g. replay), UTs, signals and figure will be computed again
+
+        :param fig: False when only the signals are needed (no new figure)
+        """
+        if self.history == None:
+            self.history = AsOfData(self.data)
+            self.cache = None # Indicators of the UTs are computed on the bars of the date
+        self.set_data(self.history.get_data(as_of))
+        self.last_date = str(self.data.tail(1).index.item().date())
+        self.built = False
+        if not fig:
+            return
+        self.img_file = self.__get_img_file()
+        if self.ut != '':
+            self.fig = self.__initiate_fig_ut(self.ut)
+        else:
+            self.fig = self.__initiate_fig()
+        return
+
+    def replay(self,start,nb_days,export=True):
+        """
+        Replay the view over nb_days consecutive bars from start
+        Buckets of the UTs are computed once for the history, each day is a slice and its partial buckets
+
+        :param export: True to save the PNG image of each day, False to compute the signals only
+        :return: dict {date: list of signals of all UTs}
+        """
+        if self.history == None:
+            self.set_as_of(self.data.index[-1])
+        replay = {}
+        for day in self.history.get_dates(start,nb_days):
+            self.set_as_of(day,fig=export)
+            if export:
+                self.export_images(web=False) # Figure built for the day
+            else:
+                self.compute_signals()
+            replay[self.last_date] = [signal for period in self.periods for signal in self.signals.get(period,[])]
+        return replay
+
+    def compute_signals(self):
+        """ Evaluate the signals of all UTs, without building the figure """
+        periods = [period for period in self.periods if period not in self.signals]
+        self.__map(lambda period: self.get_ut_signals(self.get_ut(period),period),periods)
+        return self.signals
+
+    def compute_ut(self,period):
+        """
+        Compute stage of 1 UT: aggregated bars, indicators, traces and signals
+        Only reads the data of the view, so UTs can be computed in parallel
+
+        :return: UtView, None if not enough data (intraday)
+        """
+        df = self.get_ut(period)
+        if self.intraday and len(df) < 2:
+            return None
+        traces = tuple(self.get_ut_traces(df,period))
+        return UtView(period,df,traces,tuple(self.signals[period]))
+
+    def compute_uts(self):
+        """
+        Compute the UTs of the view concurrently: they are independent until placed on the figure
+
+        :return: list of UtView (or None), in the order of the periods
+        """
+        return self.__map(self.compute_ut,self.periods)
+
+    def __map(self,fn,periods):
+        """ Apply fn to each period, in the pool of threads of the UTs (results in the order of the periods) """
+        if self.workers <= 1 or len(periods) < 2:
+            return [fn(period) for period in periods]
+        if self.workers == UT_WORKERS:
+            return list(UT_POOL.map(fn,periods))
+        with ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix='ut') as pool:
+            return list(pool.map(fn,periods))
+
+    def set_data(self,data):
+        """
+        Replace data (e.g. new tick of a live feed), UTs and signals will be computed again
+        (from the new data only: UTs of a streamed history are not kept)
+        """
+        self.data = data
+        self.ut_data = {}
+        self.signals = {}
+        return
+
+    def get_ut(self,period):
+        """ Return OHLC data of 1 UT, aggregated from the data file """
+        if self.intraday:
+            return self.__get_session_ut(period)
+        if self.history != None and period != 'D':
+            # Complete buckets of the history and partial bucket at the date, no resampling
+            return self.history.get_ut(period,self.data.index[-1])
+        if self.native != None and self.native.covers(self.data.index[-1],period):
+            # Bars of the provider, when not older than the daily data
+            return self.native.get_ut(period)
+        # Other timeframes than the data file: OHLC of the buckets, same as resample (closed and labelled right)
+        if period == 'D':
+            return self.data.copy()
+        df = resample_ohlc(self.data,period)
+        # if period != 'W': # TO REMOVE - bug later in the graph creation
+        #     df.index = df.index.to_period('M')
+        df['Date'] = df.index
+        return df
         
     def create_ats_view(self):
-        """ Create the full AT.S view for 1 symbol, using CSV data """
+        """ Create the full AT.S view for 1 symbol, using CSV data, and save PNG images """
+        fig = self.build_ats_view()
+        self.export_images()
+        return fig
+
+    def build_ats_view(self):
+        """ Build the figure of the full AT.S view for 1 symbol, using CSV data (no image export) """
+        if self.built:
+            return self.fig
         fig = self.fig
 
-        # Logic to create other timeframes, than the data file
-        logic = {'Open'  : 'first',
-                 'High'  : 'max',
-                 'Low'   : 'min',
-                 'Close' : 'last'} 
-        # Create the UTs for each period
-        for period in self.periods:
-            df = self.data.copy()
-            if period != 'D':
-                df = df.resample(period,convention='end',closed='right',label='right').apply(logic)
-                # if period != 'W': # TO REMOVE - bug later in the graph creation
-                #     df.index = df.index.to_period('M')
-                df['Date'] = df.index
-                #print(df.tail(10))
-            fig = self.__create_ut(df,period)
-            if period == 'D':
+        # Create the UTs for each period: computed in parallel, then placed on the figure in order
+        for view in self.compute_uts():
+            fig = self.__create_ut(view)
+            if view.period == 'D':
                 fig.update_xaxes(rangebreaks=[dict(bounds=["sat", "mon"])],rangeslider_visible=False,row=1,col=1)       
             if self.pur == False:
-                fig = self.__create_annotations(df,period)
+                fig = self.__create_annotations(view.data,view.period)
         
         last_date = self.data.tail(1).index.item()
         last_date = str(last_date.date())
@@ -208,66 +448,135 @@ class EnvATS():
             height=800, width=1200,
             #yaxis_title='Price',
         )
-               
-        fig.write_image(self.img_file,width=1200,height=800)
-        fig.write_image("static/"+self.img_file,width=1200,height=675) #For Flask
-        print("Image saved for static/"+self.img_file+print_duration())
-        
+        self.built = True
         return fig
 
+    def export_images(self,local=True,web=True,overwrite=True):
+        """
+        Export the figure in PNG images (slowest stage), the figure is built if needed
+
+        :param local: image in png/ (1200x800)
+        :param web: image in static/png/ for Flask (1200x675)
+        :param overwrite: False to keep the images already rendered (e.g. by another worker)
+        :return: list of the images saved
+        """
+        fig = self.fig
+        if not self.built:
+            if self.intraday:
+                fig = self.build_ats_view_intraday()
+            else:
+                fig = self.build_ats_view()
+        # Images are links to the objects of the store: a figure already rendered is not encoded again
+        store = get_image_store()
+        spec = json.dumps(fig.to_plotly_json(),cls=plotly.utils.PlotlyJSONEncoder,sort_keys=True)
+        images = []
+        targets = []
+        if local:
+            targets.append([self.img_file,1200,800])
+        if web:
+            targets.append(["static/"+self.img_file,1200,675]) #For Flask
+        for img_file, width, height in targets:
+            if overwrite or not os.path.exists(img_file):
+                store.put(img_file,self.img_name,self.last_date,self.get_img_kind(),fig,spec,width,height)
+                images.append(img_file)
+        print("Image saved for "+", ".join(images)+print_duration())
+        return images
+
     def create_ats_view_intraday(self):
+        """ Create the full AT.S view for 1 symbol, using intraday CSV data, and save PNG image """
+        fig = self.build_ats_view_intraday()
+        self.export_images(web=False)
+        return fig
+
+    def build_ats_view_intraday(self):
+        """ Build the figure of the full AT.S view for 1 symbol, using intraday CSV data aggregated within exchange sessions """
+        if self.built:
+            return self.fig
         fig = self.fig
-        
-        #M5 timeframe        
-        df_m5 = self.data.copy()         
-        fig = self.__create_ut(df_m5,1,1)
-                
-        # Other timeframes
-        logic = {'Open'  : 'first',
-                 'High'  : 'max',
-                 'Low'   : 'min',
-                 'Close' : 'last'}
-        UTs = pd.DataFrame({'Period':['15min','30min','1H','3H','D'],
-                            'Row':[1,1,2,2,2],
-                            'Col':[2,3,3,2,1],
-                            })
-        UTs = UTs.set_index('Period')
-        
-        for period in UTs.index:
-            df = self.data.copy()
-            df = df.resample(period,convention='start').apply(logic)
-            df['Date'] = df.index
-            fig = self.__create_ut(df,UTs['Row'].loc[period],UTs['Col'].loc[period])
+
+        for period, view in zip(self.periods,self.compute_uts()):
+            if view == None:
+                print('WARNING: not enough data for period '+period)
+                continue
+            fig = self.__create_ut(view)
+            row_col = self.__get_row_col_ids(period)
+            fig.update_xaxes(rangebreaks=get_rangebreaks(self.exchange,period!='D'),row=row_col[0],col=row_col[1])
             if self.pur == False:
-                fig = self.__create_annotations(df,UTs['Row'].loc[period],UTs['Col'].loc[period],distance=1)
+                fig = self.__create_annotations(view.data,period)
         
         last_date = self.data.tail(1).index.item()
         last_date = str(last_date.date())
         fig.update_layout(
             title=self.symbol+' - '+self.name+' - '+last_date,
+            height=800, width=1200,
             #yaxis_title='Price',
         )
-     
-        fig.write_image(self.img_file,width=1200,height=800)
-        print("Image saved for "+self.symbol)
-        
+        self.built = True
         return fig
-    
-    def __create_ut(self,data,period):
-        """ Create ATS UT view for 1 symbol """
-        fig = self.fig
+
+    def __get_session_ut(self,period):
+        """
+        Return intraday data aggregated for the period, within the sessions of the exchange
+        Each UT is computed once, and kept in the persistent cache until the data changes
+        """
+        if period in self.ut_data:
+            return self.ut_data[period]
+        compute = lambda df: aggregate_session(df,period,self.exchange)
+        if self.cache != None:
+            df = self.cache.get(self.cache_key,period,'session_ohlc',(self.exchange,),self.data,compute)
+        else:
+            df = compute(self.data)
+        self.ut_data[period] = df
+        return df
+
+    def get_indicators(self,data,period):
+        """
+        Return the indicators of 1 UT: M7, M20, Bollinger and PSAR (None if not available)
+        Indicators are read from the persistent cache when the bars did not change
+        Indicators computed on the same bars share the intermediates of their graph (see IndicatorGraph)
+        """
+        graphs = [] # [bars, IndicatorGraph] of the bars computed (full UT, or tails for cache updates)
+        def evaluate(df,node):
+            for bars, graph in graphs:
+                if bars is df:
+                    return graph.get(node)
+            graph = IndicatorGraph(df)
+            graphs.append([df,graph])
+            return graph.get(node)
+
+        indicators = {
+            'm7':['sma',(7,),lambda df: evaluate(df,('sma',7)),7+7],
+            'm20':['sma',(20,),lambda df: evaluate(df,('sma',20)),20+7],
+            'boll':['bollinger',(20,2.0),lambda df: evaluate(df,('bollinger',20,2.0)),20+3],
+            'psar':['psar',(0.02,0.2),lambda df: evaluate(df,('psar',0.02,0.2)),None],
+        }
+        ind = {}
+        for name in indicators:
+            indicator, params, compute, lookback = indicators[name]
+            try:
+                if self.cache != None:
+                    ind[name] = self.cache.get(self.cache_key,period,indicator,params,data,compute,lookback)
+                else:
+                    ind[name] = compute(data)
+            except Exception:
+                if name != 'psar':
+                    raise
+                ind[name] = None # Not enough periods for SAR
+        return ind
+
+    def get_ut_traces(self,data,period):
+        """
+        Return the traces of 1 UT (25 last periods), without annotations: list of [key, trace class, properties]
+        Signals of the UT are evaluated on the last bar at the same time
+        """
         df_d = data.copy()
-        ta = TAindicators(df_d)
+        ind = self.get_indicators(df_d,period)
         #print(period)
-        m7d = ta.get_sma(7).tail(25)
-        #m7d = ta.get_sma(7)
-        md = ta.get_sma(20).tail(25)
-        boll_d = ta.get_bollinger().tail(25)
+        m7d = ind['m7'].tail(25)
+        md = ind['m20'].tail(25)
+        boll_d = ind['boll'].tail(25)
         df_d = df_d.tail(25)
           
-        row_col = self.__get_row_col_ids(period)
-        i_row = row_col[0]
-        i_col = row_col[1]
         boll_trace = pd.DataFrame({
                     'Col':['U','Uup','Udn','UupRev','UdnRev','L','Lup','Ldn','LupRev','LdnRev'],
                     'Color':['black','green','red','green','red','black','green','red','green','red'],
@@ -279,126 +588,112 @@ class EnvATS():
                     'Color':['black','green','red','green','red'],
                     'Width':[1,2,2,2,2],
                     }).set_index('Col')            
-        fig = fig.add_trace(go.Ohlc(x=df_d.index,open=df_d['Open'],high=df_d['High'],low=df_d['Low'],close=df_d['Close'],increasing_line_color= 'black', decreasing_line_color= 'black',showlegend=False),row=i_row,col=i_col)
+        traces = [['ohlc',go.Ohlc,dict(x=df_d.index,open=df_d['Open'],high=df_d['High'],low=df_d['Low'],close=df_d['Close'],increasing_line_color= 'black', decreasing_line_color= 'black',showlegend=False)]]
         for col in sma_trace.index:
-            fig.add_trace(go.Scatter(x=df_d.index,y=m7d[col],mode='lines',line=dict(color=sma_trace['Color'].loc[col],width=sma_trace['Width'].loc[col]),
-                showlegend=False),row=i_row,col=i_col)
-            #fig.add_trace(go.Scatter(x=df_d.index,y=m7d[col],mode='markers',marker_color=sma_trace['Color'].loc[col],
-            #    showlegend=False),row=i_row,col=i_col)
-            fig.add_trace(go.Scatter(x=df_d.index,y=md[col],mode='lines',line=dict(color=sma_trace['Color'].loc[col],width=sma_trace['Width'].loc[col]),
-                showlegend=False),row=i_row,col=i_col)       
+            traces.append(['m7:'+col,go.Scatter,dict(x=df_d.index,y=m7d[col],mode='lines',line=dict(color=sma_trace['Color'].loc[col],width=sma_trace['Width'].loc[col]),
+                showlegend=False)])
+            traces.append(['m20:'+col,go.Scatter,dict(x=df_d.index,y=md[col],mode='lines',line=dict(color=sma_trace['Color'].loc[col],width=sma_trace['Width'].loc[col]),
+                showlegend=False)])
         for col in boll_trace.index:
-            fig.add_trace(go.Scatter(x=df_d.index,y=boll_d[col],mode='lines',line=dict(color=boll_trace['Color'].loc[col],width=boll_trace['Width'].loc[col]),
-                showlegend=False),row=i_row,col=i_col)
+            traces.append(['boll:'+col,go.Scatter,dict(x=df_d.index,y=boll_d[col],mode='lines',line=dict(color=boll_trace['Color'].loc[col],width=boll_trace['Width'].loc[col]),
+                showlegend=False)])
 
         #if sar_ok == True:
         try:
-            psar_d = ta.get_psar().tail(25)
-            fig.add_trace(go.Scatter(x=df_d.index,y=psar_d['psarbull-1'],mode='markers',marker_color='green',showlegend=False),row=i_row,col=i_col)
-            fig.add_trace(go.Scatter(x=df_d.index,y=psar_d['psarbear-1'],mode='markers',marker_color='red',showlegend=False),row=i_row,col=i_col)
-            #if period == '2Q':
-            #    print('SAR for: '+period)
-            #    print(df_d)
-            #    print(psar_d.tail(30))
+            psar_d = ind['psar'].tail(25)
+            traces.append(['psar:psarbull-1',go.Scatter,dict(x=df_d.index,y=psar_d['psarbull-1'],mode='markers',marker_color='green',showlegend=False)])
+            traces.append(['psar:psarbear-1',go.Scatter,dict(x=df_d.index,y=psar_d['psarbear-1'],mode='markers',marker_color='red',showlegend=False)])
         except:
             print('WARNING: issue with SAR on period '+period)
-        
 
-        # DEBUG 
-        #if period == 'W':
-            #print(m7d)
-            #print(md)
-            #print(boll_d)
-        #    print(psar_d)
+        self.get_ut_signals(data,period,ind)
+        return traces
+
+    def get_ut_signals(self,data,period,ind=None):
+        """
+        Evaluate the signals of 1 UT on the last bar, from its indicators (computed if not given)
+
+        :return: list of Signal (see pyatsm.signals)
+        """
+        if ind == None:
+            ind = self.get_indicators(data,period)
+        row_col = self.__get_row_col_ids(period)
+        engine = SignalEngine(period,row_col[2])
+        self.signals[period] = engine.evaluate(data,ind['m7'],ind['m20'],ind['psar'])
+        return self.signals[period]
+
+    def __create_ut(self,view):
+        """ Create ATS UT view for 1 symbol, from the UT computed by compute_ut """
+        fig = self.fig
+        data = view.data
+        period = view.period
+        df_d = data.tail(25)
+        row_col = self.__get_row_col_ids(period)
+        i_row = row_col[0]
+        i_col = row_col[1]
+        for key, trace, props in view.traces:
+            fig = fig.add_trace(dict(type=TRACE_TYPES[trace],**props),row=i_row,col=i_col)
 
         # Annotations
         if not self.pur:
-            extra = EnvATSextraUT(fig,df_d,row_col)
+            extra = EnvATSextraUT(fig,df_d,row_col,view.signals)
             fig = extra.create_annotations()
 
 
         fig.update_xaxes(rangeslider_visible=False,row=i_row,col=i_col)
-        for period in [8,21]:
-            if df_d.index.size>period:
-                fig.add_vline(x=df_d.index[-period], line_width=2, line_dash="dash", line_color="black",row=i_row,col=i_col)
+        for shape in self.get_ut_shapes(data,period):
+            fig.add_shape(**shape)
 
         return fig
         
-    def __create_annotations(self,data,period="D"):
-        """ Add annotations (supports / resistance etc...) to graph, for 1 UT """
-        fig_a = self.fig
-        df_d = data.copy()        
-        ta = TAindicators(df_d)
-        m7d = ta.get_sma(7)
-        md = ta.get_sma(20)
-        boll_d = ta.get_bollinger()
-        try:
-            psar_d = ta.get_psar()
-            psar_d = psar_d.tail(1)
-            sar_ok = True
-        except:
-            #print('WARNING: issue with SAR on period '+period)
-            sar_ok= False
-        df_d = df_d.tail(25)
-        m7d = m7d.tail(1)
-        md = md.tail(1)
-        boll_d = boll_d.tail(2)
-        #print(psar_d)
-        
-        #print(df_d)
-        last = df_d['Close'].tail(1).iloc[0]
-        high = df_d['High'].tail(1).iloc[0]
-        low = df_d['Low'].tail(1).iloc[0]
-        jack = df_d['Close'].tail(21).iloc[0]
-        df_d["Jack"] = jack
-        #print(oggy)
-               
+    def get_ut_axes(self,period):
+        """ Return x and y axis references of the subplot of 1 UT """
+        row_col = self.__get_row_col_ids(period)
+        i_axis = (row_col[0]-1)*3+row_col[1]
+        if i_axis == 1:
+            return ['x','y']
+        return ['x'+str(i_axis),'y'+str(i_axis)]
+
+    def get_ut_shapes(self,data,period):
+        """ Return the vertical lines of 1 UT (8 and 21 periods ago) """
+        shapes = []
+        df_d = data.tail(25)
+        xref, yref = self.get_ut_axes(period)
+        for period in [8,21]:
+            if df_d.index.size>period:
+                shapes.append(dict(type='line',x0=df_d.index[-period],x1=df_d.index[-period],xref=xref,y0=0,y1=1,yref=yref+' domain',
+                    line=dict(color="black",dash="dash",width=2)))
+        return shapes
+
+    def get_ut_annotations(self,period):
+        """ Return the annotations (supports / resistance etc...) of 1 UT, from its signals """
+        annotations = []
         row_col = self.__get_row_col_ids(period)                        
         distance = row_col[2]
-        nb_sup = 0
-        nb_res = 0
-        
-        ### M7 ###
-        if m7d['up'].iloc[0]>0 and abs(m7d['distLow'].iloc[0])<distance: #Support
-            print('M7 support on period '+period)
-            nb_sup = nb_sup+1
-            if nb_sup < 2:
-                fig_a.add_annotation(x=m7d["Date"].iloc[0], y=m7d['sma'].iloc[0]*(1-distance/100),
+        xref, yref = self.get_ut_axes(period)
+        for signal in self.signals.get(period,[]):
+            if signal.kind == 'PSAR_SUP':
+                annotations.append(dict(x=signal.date, y=signal.level*(1-distance/100),
+                    text="P "+str(round(signal.distance,1))+"%", showarrow=True,ax=0,ay=20,arrowwidth=2,
+                    arrowhead=1,xref=xref,yref=yref))
+            elif signal.kind in ['M7_SUP','M20_SUP']:
+                annotations.append(dict(x=signal.date, y=signal.level*(1-distance/100),
                     showarrow=True,ax=0,ay=20,arrowwidth=2,arrowhead=1,arrowcolor="green",
-                    row=row_col[0],col=row_col[1])  
-        
-        if m7d['dn'].iloc[0]>0 and abs(m7d['distHigh'].iloc[0])<distance: #Resistance
-            print('M7 resistance on period '+period)
-            nb_res = nb_res+1
-            if nb_res < 2:
-                fig_a.add_annotation(x=m7d["Date"].iloc[0], y=m7d['sma'].iloc[0]*(1+distance/100),
+                    xref=xref,yref=yref))
+            elif signal.kind in ['M7_RES','M20_RES']:
+                annotations.append(dict(x=signal.date, y=signal.level*(1+distance/100),
                     showarrow=True,ax=0,ay=-20,arrowwidth=2,arrowhead=1,arrowcolor="red",
-                    row=row_col[0],col=row_col[1]) 
-        
-        ### M ###
-        if md['up'].iloc[0]>0 and abs(md['distLow'].iloc[0])<distance: #Support
-            print('M support on period '+period) 
-            fig_a.add_annotation(x=md["Date"].iloc[0], y=md['sma'].iloc[0]*(1-distance/100),
-                showarrow=True,ax=0,ay=20,arrowwidth=2,arrowhead=1,arrowcolor="green",
-                row=row_col[0],col=row_col[1]) 
-                
-        if md['dn'].iloc[0]>0 and abs(md['distHigh'].iloc[0])<distance: #Resistance
-            print('M resistance on period '+period)
-            fig_a.add_annotation(x=md["Date"].iloc[0], y=md['sma'].iloc[0]*(1+distance/100),
-                showarrow=True,ax=0,ay=-20,arrowwidth=2,arrowhead=1,arrowcolor="red",
-                row=row_col[0],col=row_col[1])
-
-
-
-        #### Supports
-        if sar_ok == True:
-            if psar_d['psarbull-1'].iloc[0]>0 and abs(psar_d['distPSAR'].iloc[0])<distance:
-                print('P support on period '+period)
-                fig_a.add_annotation(x=psar_d.index.item(), y=psar_d['psarbull-1'].iloc[0]*(1-distance/100),
-                    text="P "+str(round(psar_d['distPSAR'].iloc[0],1))+"%", showarrow=True,ax=0,ay=20,arrowwidth=2,
-                    arrowhead=1,row=row_col[0],col=row_col[1])
-                
-        ### Resistances
+                    xref=xref,yref=yref))
+        return annotations
+
+    def __create_annotations(self,data,period="D"):
+        """ Add annotations (supports / resistance etc...) to graph, for 1 UT """
+        fig_a = self.fig
+        for signal in self.signals.get(period,[]):
+            if signal.kind in ['M7_SUP','M7_RES','M20_SUP','M20_RES','PSAR_SUP']:
+                print(LABELS[signal.kind]+' on period '+period)
+        for annotation in self.get_ut_annotations(period):
+            fig_a.add_annotation(**annotation)
         
         return fig_a
     
@@ -458,13 +753,14 @@ class EnvATS():
         return fig_a
 
 class EnvATSextraUT():
-    ''' TODO add annotations in a UT (Timeframe in French) '''
-    def __init__(self,fig,df,row_col):
+    ''' Add annotations in a UT (Timeframe in French), rendering the signals of the UT '''
+    def __init__(self,fig,df,row_col,signals=None):
         self.fig = fig # Global plotly figure
         self.row_col = row_col # Row and Column of UT in figure
         self.i_row = row_col[0]
         self.i_col = row_col[1]
-        self.df = df.copy() # Data history OHLC of the UT
+        self.index = df.index # Dates of the UT
+        self.signals = signals if signals != None else [] # Signals of the UT (see pyatsm.signals)
         self.nb_sup = 0 # Number of supports on the graph
         self.nb_res = 0 # Number of resistances on the graph
         return
@@ -474,46 +770,25 @@ class EnvATSextraUT():
         fig = self.__jack_in_between()
         return fig
 
-    def __oggy_in_between(self):
-        ''' Print O,O+1,O+2 if last is in between '''
-        df_d = self.df.copy()
-        last = df_d['Close'].tail(1).iloc[0]
-        oggy = df_d['Close'].tail(8).iloc[0]
-        oggy_1 = df_d['Close'].tail(7).iloc[0]
-        oggy_2 = df_d['Close'].tail(6).iloc[0]
-        df_d["Oggy"] = oggy
-        df_d["Oggy_1"] = oggy_1
-        df_d["Oggy_2"] = oggy_2
-
-        if min(oggy,oggy_1) < last < max(oggy,oggy_1):
-            self.fig.add_trace(go.Scatter(x=df_d.tail(8).index,y=df_d['Oggy'].tail(8),mode='lines',line=dict(color="blue",width=2),
-                showlegend=False),row=self.row_col[0],col=self.row_col[1])
-            self.fig.add_trace(go.Scatter(x=df_d.tail(7).index,y=df_d['Oggy_1'].tail(7),mode='lines',line=dict(color="blue",width=2),
-                showlegend=False),row=self.row_col[0],col=self.row_col[1])
-            #self.fig.add_trace(go.Scatter(x=df_d.tail(6).index,y=df_d['Oggy_2'].tail(6),mode='lines',line=dict(color="blue",width=2),
-            #    showlegend=False),row=self.row_col[0],col=self.row_col[1])      
+    def __add_line(self,kind,color):
+        ''' Horizontal line from the signal date until the last period '''
+        for signal in self.signals:
+            if signal.kind == kind:
+                x = self.index[-min(LINES[kind],self.index.size):]
+                self.fig.add_trace(dict(type='scatter',x=x,y=np.full(x.size,signal.level),mode='lines',line=dict(color=color,width=2),
+                    showlegend=False),row=self.i_row,col=self.i_col)
+        return self.fig
 
+    def __oggy_in_between(self):
+        ''' Print O,O+1 if last is in between '''
+        self.__add_line('OGGY',"blue")
+        self.__add_line('OGGY_1',"blue")
         return self.fig
 
     def __jack_in_between(self):
-        ''' Print J,J+1,J+2 if last is in between '''
-        df_d = self.df.copy()
-        last = df_d['Close'].tail(1).iloc[0]
-        jack = df_d['Close'].tail(21).iloc[0]
-        jack_1 = df_d['Close'].tail(20).iloc[0]
-        jack_2 = df_d['Close'].tail(19).iloc[0]
-        df_d["Jack"] = jack
-        df_d["Jack_1"] = jack_1
-        df_d["Jack_2"] = jack_2
-
-        if min(jack,jack_1) < last < max(jack,jack_1):
-            self.fig.add_trace(go.Scatter(x=df_d.tail(21).index,y=df_d['Jack'].tail(21),mode='lines',line=dict(color="green",width=2),
-                showlegend=False),row=self.row_col[0],col=self.row_col[1])
-            self.fig.add_trace(go.Scatter(x=df_d.tail(20).index,y=df_d['Jack_1'].tail(20),mode='lines',line=dict(color="green",width=2),
-                showlegend=False),row=self.row_col[0],col=self.row_col[1])
-            #self.fig.add_trace(go.Scatter(x=df_d.tail(18).index,y=df_d['Jack_2'].tail(18),mode='lines',line=dict(color="green",width=2),
-            #    showlegend=False),row=self.row_col[0],col=self.row_col[1])      
-
+        ''' Print J,J+1 if last is in between '''
+        self.__add_line('JACK',"green")
+        self.__add_line('JACK_1',"green")
         return self.fig
        
 
@@ -526,12 +801,36 @@ class Ticker():
         self.type_ticker = type_ticker
         return
 
-    def download_data_from_ticker(self,no_download=False):
+    def download_data_from_ticker(self,no_download=False,intra=False):
         ''' Download price data if needed, from different sources: Darwinex, YahooFinance, Alphavantage
         Generates stats (technical indicators)
+        Concurrent requests of the same symbol download once (threads), one process at a time (lock file)
         '''
+        name = 'download_'+self.symbol
+        if intra == True:
+            name = name+'_intra'
+        return SINGLE_FLIGHT.do((name,no_download),self.__download_locked,name,no_download,intra)
+
+    def __download_locked(self,name,no_download,intra):
+        ''' Download under the lock file: the next process finds the fresh file and skips the download '''
+        with FileLock(name):
+            status = self.__download(no_download,intra)
+        self.publish_data(intra) # Alerts evaluated on the fresh data (see pyatsm.alerts)
+        return status
+
+    def publish_data(self,intra=False):
+        ''' Notify the subscribers of the process that the data of the symbol was refreshed '''
+        DATA_EVENTS.publish(DataEvent(self.symbol,intra,get_data_file(self.symbol,intra)))
+        return
+
+    def __download(self,no_download=False,intra=False):
         status = -1
         symbol = self.symbol
+        if intra == True: # Intraday data (5min) only available from Alphavantage
+            stock_av = AlphaVantageData(symbol,intra=True)
+            if no_download == False:
+                stock_av.av_intraday_download()
+            return 0
         if symbol == 'DBA':
             dba = Darwinex()
             dba.download_dba(symbol)
@@ -562,10 +861,45 @@ class Ticker():
         #     print('WARNING: symbol not accepted - '+symbol)
         return status
 
-    def launch_ats_view(self,pur=False):
-        s_env = EnvATS(self.symbol,self.name,pur)
+    def download_native_bars(self,no_download=False):
+        '''
+        Download the weekly and monthly bars of the provider (YahooFinance, Alphavantage) for the higher UTs,
+        without the daily history (Darwinex symbols: daily data only)
+        '''
+        symbol = self.symbol
+        if symbol in ['DBA','JTL','KWCBO']:
+            return self.download_data_from_ticker(no_download)
+        av = symbol.find('.')>0 and symbol.split('.')[1] in ['PAR','BRU','AMS','BSE']
+        for interval in NATIVE_INTERVALS.values():
+            with FileLock(symbol+'_'+interval):
+                if no_download == True:
+                    continue
+                if av:
+                    AlphaVantageData(symbol,interval=interval).av_daily_download()
+                else:
+                    print(f'Downloading {symbol} {interval} from YahooFinance')
+                    StockYFdata(symbol,interval=interval).web_open_yf(wait=0)
+        DATA_EVENTS.publish(DataEvent(symbol,False,get_data_file(symbol,interval='1wk')))
+        return 0
+
+    def prewarm(self,no_download=False):
+        ''' Refresh the data, then the indicators, signals and figure of the view in the caches (no image) '''
+        if not no_download:
+            self.download_data_from_ticker()
+        else:
+            self.publish_data() # Local data, possibly refreshed by another process
+        graph = get_view_json(self.symbol,self.name,rebuild=True)
+        if graph == None:
+            print('WARNING: no data to prewarm for '+self.symbol)
+        return graph
+
+    def launch_ats_view(self,pur=False,intra=False,as_of=None,budget=CHUNK_BUDGET,native=False):
+        s_env = EnvATS(self.symbol,self.name,pur,intra=intra,as_of=as_of,budget=budget,native=native)
         if s_env.get_status() == 1:
-            fig = s_env.create_ats_view()            
+            if intra == True:
+                fig = s_env.create_ats_view_intraday()
+            else:
+                fig = s_env.create_ats_view()            
             fig.show()
 
         self.s_env = s_env
@@ -584,6 +918,20 @@ if __name__ == '__main__':
     extras.add_argument("--name",dest='name', help="Add the name of the asset")
     extras.add_argument("--no_download",dest='no_download', action='store_true', help="Directly use local data without downloading fresh one")  
     extras.add_argument("--pur",dest='pur', action='store_true', help="Ensure that there are no annotations on graph")
+    extras.add_argument("--intra",dest='intra', action='store_true', help="Generates the intraday AT.S view (5min to D), from <ticker>_intra.csv")
+    extras.add_argument("--as_of",dest='as_of', help="Generates the AT.S view as of a past date (YYYY-MM-DD)")
+    extras.add_argument("--replay",dest='replay', type=int, help="Replay the AT.S view over N days from --as_of date (PNG images)")
+    extras.add_argument("--signals",dest='signals', action='store_true', help="With --replay, only print the signals of each day (no image)")
+    extras.add_argument("--prewarm",dest='prewarm', action='store_true', help="Refresh data and views after each close of the exchanges, for -t symbols (comma separated) or --watchlist")
+    extras.add_argument("--watchlist",dest='watchlist', help="With --prewarm, file of the symbols (1 per line, SYMBOL,name), data files by default")
+    extras.add_argument("--clock",dest='clock', help="With --prewarm, simulated clock from this date (UTC), no wait between closes")
+    extras.add_argument("--until",dest='until', help="With --prewarm, stop after this date (UTC)")
+    extras.add_argument("--alerts",dest='alerts', action='store_true', help="Evaluate the alerts of -t symbols (comma separated) after their download, or after each prewarm")
+    extras.add_argument("--index",dest='index', action='store_true', help="Refresh the index of the indicators (see pyatsm.signal_index) for -t symbols, or after each prewarm")
+    extras.add_argument("--webhook",dest='webhook', help="With --alerts, also post the alerts to this URL")
+    extras.add_argument("--budget",dest='budget', type=float, default=CHUNK_BUDGET/1024/1024, help="With --intra, memory budget (MB): larger data files are streamed in chunks (see pyatsm.chunked)")
+    extras.add_argument("--native",dest='native', action='store_true', help="Weekly / monthly bars of the provider for the higher UTs (with --alerts / --index: no daily data downloaded)")
+    extras.add_argument("--bench",dest='bench', type=int, help="Compare the build time of N AT.S views, plotly graph_objects vs fast figure (no image)")
       
         
     args = parser.parse_args()
@@ -593,18 +941,89 @@ if __name__ == '__main__':
     name = ""
     if args.name != None:
         name = args.name
+    ### --alerts: new signals of the refreshed symbols, sent to the alerts file (and webhook)
+    if args.alerts:
+        sinks = [FileSink(),PrintSink()]
+        if args.webhook != None:
+            sinks.append(WebhookSink(args.webhook))
+        AlertEngine(lambda symbol, intra: EnvATS(symbol,intra=intra,figure=False,native=args.native),sinks).subscribe()
+    ### --index: distances to the indicators of the refreshed symbols, for the screens
+    if args.index:
+        SignalIndex(get_env=lambda symbol, intra: EnvATS(symbol,intra=intra,figure=False,native=args.native)).subscribe(DATA_EVENTS)
+
+    ### --bench N: build time of the figure only, the indicators are cached by a first view
+    if args.bench != None:
+        for fast in [False,True]:
+            durations = []
+            for i in range(args.bench+1):
+                start = time.time()
+                if args.ticker != None:
+                    s_env = EnvATS(args.ticker,name,args.pur,intra=args.intra,fast=fast)
+                else:
+                    s_env = EnvATS(name=name,filename=args.file,pur=args.pur,intra=args.intra,fast=fast)
+                if s_env.get_status() != 1:
+                    break
+                if args.intra:
+                    s_env.build_ats_view_intraday()
+                else:
+                    s_env.build_ats_view()
+                durations.append(time.time()-start)
+            if len(durations) > 1:
+                builder = 'fast figure' if fast else 'graph_objects'
+                print('INFO: '+builder+': %s ms per view (%s views)' % (round(1000*np.mean(durations[1:]),1),len(durations)-1))
+
+    ### --prewarm: warm the caches after each close, most requested symbols first
+    elif args.prewarm:
+        if args.ticker != None:
+            watchlist = [[symbol,name] for symbol in args.ticker.split(',')]
+        else:
+            watchlist = read_watchlist(args.watchlist)
+        clock = None
+        if args.clock != None:
+            clock = LocalClock(args.clock)
+        scheduler = PrewarmScheduler(watchlist,lambda symbol, name: Ticker(symbol,name).prewarm(args.no_download),clock)
+        scheduler.run(args.until)
+
+    ### --alerts / --index without --prewarm: download (or reload) the -t symbols once, processed by the subscribers
+    elif (args.alerts or args.index) and args.ticker != None:
+        for symbol in args.ticker.split(','):
+            ticker = Ticker(symbol,name=name)
+            if args.native and not args.intra:
+                ticker.download_native_bars(args.no_download)
+            elif not args.no_download:
+                ticker.download_data_from_ticker(intra=args.intra)
+            else:
+                ticker.publish_data(args.intra)
+
+    ### --replay N: AT.S views of N consecutive days from --as_of, with -t or -f (local data)
+    elif args.replay != None:
+        if args.ticker != None:
+            s_env = EnvATS(args.ticker,name,args.pur,intra=args.intra,as_of=args.as_of)
+        else:
+            s_env = EnvATS(name=name,filename=args.file,pur=args.pur,intra=args.intra,as_of=args.as_of)
+        if s_env.get_status() == 1:
+            replay = s_env.replay(args.as_of,args.replay,export=not args.signals)
+            for day in replay:
+                print(day+': '+', '.join([signal.timeframe+' '+signal.kind for signal in replay[day]]))
+            print('INFO: replay of '+str(len(replay))+' days'+print_duration())
+
     ### -t <YFticker> or <AVticker>
-    if args.ticker!=None:
+    elif args.ticker!=None:
         ticker = Ticker(args.ticker,name=name)
         if not args.no_download:
             #print('TEST')
-            ticker.download_data_from_ticker()
-        ticker.launch_ats_view(args.pur) #Generate AT.S view and save PNG 
+            ticker.download_data_from_ticker(intra=args.intra)
+        if args.native and not args.intra:
+            ticker.download_native_bars(args.no_download)
+        ticker.launch_ats_view(args.pur,args.intra,args.as_of,int(args.budget*1024*1024),args.native) #Generate AT.S view and save PNG 
 
     elif args.file != None:
-        s_env = EnvATS(name=name,filename=args.file,pur=args.pur)
+        s_env = EnvATS(name=name,filename=args.file,pur=args.pur,intra=args.intra,as_of=args.as_of,budget=int(args.budget*1024*1024))
         if s_env.get_status() == 1:
-            fig = s_env.create_ats_view()            
+            if args.intra:
+                fig = s_env.create_ats_view_intraday()
+            else:
+                fig = s_env.create_ats_view()            
             fig.show()
 
 
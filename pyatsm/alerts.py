@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+"""
+File name *alerts.py*
+
+Alerts on the AT.S signals, evaluated after each refresh of the data:
+- Data events published by the downloaders (see Ticker.download_data_from_ticker)
+- Incremental evaluation: symbols whose data file did not change are skipped,
+  and UTs whose bars did not change are not evaluated again
+- Alerts deduplicated: a signal already present at the previous evaluation is not alerted again
+- Pluggable sinks: file (read by the /alerts page of the web application), webhook,
+  and a local webhook stub for tests
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, json, threading, queue
+import pandas as pd
+import requests
+from collections import namedtuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from pyatsm.ind_cache import get_row_hashes, hash_rows
+from pyatsm.coord import FileLock, atomic_write_text, get_cache_folder
+from pyatsm.signals import LABELS
+
+
+# Data file of a symbol refreshed (downloaded or reloaded)
+DataEvent = namedtuple('DataEvent',['symbol','intra','data_file'])
+# New signal of a symbol, date: date of the signal, time: time of the evaluation
+Alert = namedtuple('Alert',['symbol','kind','timeframe','level','distance','date','time'])
+
+
+def to_record(alert):
+    """ :return: dict of the alert, JSON compatible """
+    record = alert._asdict()
+    record['level'] = float(alert.level)
+    record['distance'] = float(alert.distance)
+    record['date'] = str(alert.date)
+    record['label'] = LABELS.get(alert.kind,alert.kind)
+    return record
+
+
+class EventBus():
+    """
+    Class dispatching events to the subscribers of the process, in the thread of the publisher
+    """
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+        return
+
+    def subscribe(self,fn):
+        with self.lock:
+            self.subscribers = self.subscribers+[fn]
+        return fn
+
+    def unsubscribe(self,fn):
+        with self.lock:
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber != fn]
+        return
+
+    def publish(self,event):
+        for fn in self.subscribers:
+            try:
+                fn(event)
+            except Exception as e: # A subscriber never breaks the downloader
+                print('WARNING: event not processed - '+repr(e))
+        return
+
+
+DATA_EVENTS = EventBus() # Data refreshed by the downloaders of the process
+
+
+class QueuedSubscriber():
+    """
+    Class running a subscriber in a background thread: the publisher (e.g. a download in a request) only queues the event
+
+    :param get_fn: function returning the subscriber, called on the first event (built lazily)
+    """
+    def __init__(self,get_fn):
+        self.get_fn = get_fn
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        return
+
+    def subscribe(self,bus=DATA_EVENTS):
+        bus.subscribe(self.on_event)
+        return self
+
+    def on_event(self,event):
+        with self.lock:
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.__run,daemon=True,name='subscriber')
+                self.thread.start()
+        self.queue.put(event)
+        return
+
+    def __run(self):
+        fn = None
+        while True:
+            event = self.queue.get()
+            try:
+                if fn == None:
+                    fn = self.get_fn()
+                fn(event)
+            except Exception as e:
+                print('WARNING: event not processed - '+repr(e))
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        """ Wait for the events queued (tests) """
+        self.queue.join()
+        return
+
+
+### Subscribers
+def get_fingerprint(data_file):
+    """ :return: fingerprint of the data file [mtime (ns), size], None if it does not exist """
+    try:
+        st = os.stat(data_file)
+    except OSError:
+        return None
+    return [st.st_mtime_ns,st.st_size]
+
+
+def get_changed_uts(env,get_hash):
+    """
+    UTs of the symbol whose bars changed since the last refresh of a subscriber
+
+    :param get_hash: function(period) returning the hash of the bars at the last refresh (None if never)
+    :return: list of [period, bars, hash of the bars]
+    """
+    changed = []
+    for period in env.periods:
+        data = env.get_ut(period)
+        if len(data) < 2:
+            continue
+        digest = hash_rows(get_row_hashes(data))
+        if get_hash(period) != digest:
+            changed.append([period,data,digest])
+    return changed
+
+
+def get_changed_view(event,known,get_env,get_hash):
+    """
+    Refresh skeleton shared by the subscribers of the data events (alerts, signal index):
+    data file fingerprint, then EnvATS of the symbol, then its UTs whose bars changed
+
+    :param known: fingerprint of the data file at the last refresh (None if never)
+    :return: fingerprint, EnvATS and changed UTs (see get_changed_uts), None if nothing to refresh
+    """
+    fp = get_fingerprint(event.data_file)
+    if fp == None or fp == known:
+        return None # Data file not changed since the last refresh
+    env = get_env(event.symbol,event.intra)
+    if env.get_status() != 1:
+        return None
+    return [fp,env,get_changed_uts(env,get_hash)]
+
+
+### Sinks
+class FileSink():
+    """
+    Class appending the alerts to a file, 1 JSON per line
+    """
+    def __init__(self,path=None):
+        if path == None:
+            path = get_cache_folder('alerts')+'alerts.jsonl'
+        self.path = path
+        return
+
+    def send(self,alerts):
+        os.makedirs(os.path.dirname(self.path),exist_ok=True)
+        with open(self.path,'a') as f:
+            f.write(''.join([json.dumps(to_record(alert))+'\n' for alert in alerts]))
+        return
+
+    def read(self,limit=100):
+        """ :return: last alerts (records), newest first """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            lines = f.readlines()[-limit:]
+        return [json.loads(line) for line in reversed(lines)]
+
+
+class PrintSink():
+    """
+    Class printing the alerts (CLI)
+    """
+    def send(self,alerts):
+        for alert in alerts:
+            print('ALERT: '+alert.symbol+' - '+LABELS.get(alert.kind,alert.kind)+' on period '+alert.timeframe)
+        return
+
+
+class WebhookSink():
+    """
+    Class posting the alerts in JSON to a webhook
+    """
+    def __init__(self,url,timeout=5):
+        self.url = url
+        self.timeout = timeout
+        return
+
+    def send(self,alerts):
+        try:
+            requests.post(self.url,json={'alerts':[to_record(alert) for alert in alerts]},timeout=self.timeout)
+        except requests.RequestException as e:
+            print('WARNING: alerts not posted to '+self.url+' - '+str(e))
+        return
+
+
+class WebhookStub():
+    """
+    Class receiving the alerts of a WebhookSink on a local HTTP server, for tests
+    """
+    def __init__(self,port=0,verbose=False):
+        self.received = [] # Alerts received (records)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length',0)))
+                alerts = json.loads(body).get('alerts',[])
+                stub.received.extend(alerts)
+                if verbose:
+                    for alert in alerts:
+                        print(alert['symbol']+' - '+alert['label']+' on period '+alert['timeframe'])
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self,*args):
+                return
+
+        self.server = ThreadingHTTPServer(('127.0.0.1',port),Handler)
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        return
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+
+### Engine
+class AlertEngine():
+    """
+    Class evaluating the signals of the symbols refreshed, and sending the new ones to the sinks
+    The state (fingerprints and signals of each UT) is kept in a file shared by the processes
+
+    :param get_env: function(symbol, intra) returning the EnvATS of the symbol (no figure needed)
+    """
+    def __init__(self,get_env,sinks=None,state_file=None):
+        self.get_env = get_env
+        self.sinks = sinks if sinks != None else []
+        if state_file == None:
+            state_file = get_cache_folder('alerts')+'state.json'
+        self.state_file = state_file
+        return
+
+    def subscribe(self,bus=DATA_EVENTS):
+        bus.subscribe(self.on_event)
+        return self
+
+    def __read_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return {'files':{},'uts':{}}
+
+    def on_event(self,event):
+        """
+        Evaluate the UTs of the symbol whose bars changed, and send the new signals
+
+        :return: list of Alert sent
+        """
+        name = event.symbol+('_intra' if event.intra else '')
+        with FileLock('alerts_state'):
+            state = self.__read_state()
+            view = get_changed_view(event,state['files'].get(name),self.get_env,
+                                    lambda period: state['uts'].get(name+'|'+period,{}).get('hash'))
+            if view == None:
+                return []
+            fp, env, changed = view
+            now = str(pd.Timestamp.now().floor('s'))
+            alerts = []
+            for period, data, digest in changed: # Same bars, same signals: other UTs skipped
+                key = name+'|'+period
+                previous = state['uts'].get(key,{'hash':None,'signals':[]})
+                signals = env.get_ut_signals(data,period)
+                for signal in signals:
+                    if signal.kind not in previous['signals']:
+                        alerts.append(Alert(event.symbol,signal.kind,signal.timeframe,signal.level,signal.distance,signal.date,now))
+                state['uts'][key] = {'hash':digest,'signals':sorted(set([signal.kind for signal in signals]))}
+            state['files'][name] = fp
+            atomic_write_text(self.state_file,json.dumps(state))
+        if len(alerts) > 0:
+            for sink in self.sinks:
+                sink.send(alerts)
+        return alerts
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--webhook_stub",dest='port', type=int, help="Run a local webhook stub on the port, printing the alerts received")
+    parser.add_argument("--last",dest='last', type=int, help="Print the last alerts of the alerts file")
+    args = parser.parse_args()
+
+    if args.port != None:
+        stub = WebhookStub(args.port,verbose=True)
+        print('INFO: webhook stub on '+stub.url)
+        try:
+            stub.server.serve_forever()
+        except KeyboardInterrupt:
+            stub.server.server_close()
+    elif args.last != None:
+        for record in FileSink().read(args.last):
+            print(record['time']+' - '+record['symbol']+' - '+record['label']+' on period '+record['timeframe'])
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+File name *api.py*
+
+Data of the AT.S views for machine consumers, without Plotly:
+- Series of each UT: OHLC and indicators (M7, M20, Bollinger, PSAR), with column projection and date range
+- Signals of each UT, as records
+- Tables of several symbols / UTs serialized in JSON, Arrow IPC stream (pyarrow optional) or NumPy npz
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import io
+import pandas as pd
+import numpy as np
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from pyatsm.live import to_list
+
+
+# Columns of the series: OHLC, then <indicator>:<column> (same keys as the traces of the figure)
+PRICE_COLS = ['Open','High','Low','Close']
+INDICATOR_COLS = {
+    'm7':['sma','up','dn','upRev','dnRev','distLow','distHigh'],
+    'm20':['sma','up','dn','upRev','dnRev','distLow','distHigh'],
+    'boll':['U','Uup','Udn','UupRev','UdnRev','L','Lup','Ldn','LupRev','LdnRev'],
+    'psar':['psar','psarbull-1','psarbear-1','distPSAR'],
+    }
+SERIES_COLS = PRICE_COLS+[name+':'+col for name in INDICATOR_COLS for col in INDICATOR_COLS[name]]
+FORMATS = {'json':'application/json',
+           'arrow':'application/vnd.apache.arrow.stream',
+           'npz':'application/octet-stream'}
+
+
+def get_series(env,period,columns=None,start=None,end=None):
+    """
+    Series of 1 UT: indicators are computed on the full UT, then the dates are sliced
+
+    :param env: EnvATS of the symbol (figure not needed)
+    :param columns: list of SERIES_COLS to return (all by default)
+    :return: dict of numpy arrays {'Date':..., column:...}
+    """
+    if columns == None:
+        columns = SERIES_COLS
+    data = env.get_ut(period)
+    ind = {}
+    if any([col.find(':') > 0 for col in columns]):
+        ind = env.get_indicators(data,period)
+    series = {'Date':data.index.values}
+    for col in columns:
+        if col in PRICE_COLS:
+            series[col] = data[col].values
+            continue
+        name, ind_col = col.split(':',1)
+        values = np.full(len(data),np.nan)
+        df = ind.get(name)
+        if df is not None and ind_col in df.columns and len(df) > 0:
+            # Indicators are computed on the last periods of the UT (see TAindicators limit)
+            values[len(data)-len(df):] = df[ind_col].values
+        series[col] = values
+
+    first = 0
+    last = len(data)
+    if start != None:
+        first = np.searchsorted(series['Date'],np.datetime64(pd.Timestamp(start),'ns'),side='left')
+    if end != None:
+        last = np.searchsorted(series['Date'],np.datetime64(pd.Timestamp(end),'ns'),side='right')
+    return {col:series[col][first:last] for col in series}
+
+
+def get_signal_table(signals):
+    """
+    :return: dict of numpy arrays, one per field of Signal
+    """
+    return {'kind':np.array([signal.kind for signal in signals],dtype='U'),
+            'timeframe':np.array([signal.timeframe for signal in signals],dtype='U'),
+            'level':np.array([signal.level for signal in signals],dtype='float64'),
+            'distance':np.array([signal.distance for signal in signals],dtype='float64'),
+            'date':np.array([signal.date for signal in signals],dtype='datetime64[ns]'),
+            }
+
+
+def to_json(tables):
+    """
+    :param tables: iterable of [symbol, period, dict of numpy arrays]
+    :return: dict {symbol: {period: {column: list}}}, JSON compatible
+    """
+    result = {}
+    for symbol, period, table in tables:
+        columns = {}
+        for col, values in table.items():
+            if values.dtype.kind == 'M':
+                columns[col] = to_list(pd.DatetimeIndex(values))
+            elif values.dtype.kind in 'fi':
+                columns[col] = to_list(values)
+            else:
+                columns[col] = values.tolist()
+        result.setdefault(symbol,{})[period] = columns
+    return result
+
+
+def iter_arrow(tables):
+    """
+    Arrow IPC stream of the tables, one record batch per symbol / UT (Symbol and Period columns added)
+    Bytes are yielded after each batch, so the response is streamed while the next symbols are computed
+
+    :return: generator of bytes
+    """
+    sink = io.BytesIO()
+    writer = None
+    for symbol, period, table in tables:
+        n = len(next(iter(table.values())))
+        arrays = [pa.array(np.full(n,symbol)),pa.array(np.full(n,period))]
+        arrays = arrays+[pa.array(values) for values in table.values()] # Numeric arrays without copy
+        batch = pa.RecordBatch.from_arrays(arrays,names=['Symbol','Period']+list(table.keys()))
+        if writer == None:
+            writer = pa.ipc.new_stream(sink,batch.schema)
+        writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer != None:
+        writer.close()
+        yield sink.getvalue()
+    return
+
+
+def to_npz(tables):
+    """
+    :return: bytes of a NumPy npz archive, one array per <symbol>/<period>/<column> (np.load without pickle)
+    """
+    arrays = {}
+    for symbol, period, table in tables:
+        for col, values in table.items():
+            arrays[symbol+'/'+period+'/'+col] = values
+    buf = io.BytesIO()
+    np.savez(buf,**arrays)
+    return buf.getvalue()
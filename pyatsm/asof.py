@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+File name *asof.py*
+
+Price data of a symbol as of a past date (historical AT.S views, replay):
+- Daily bars sliced by binary search on the sorted dates
+- UTs (W, 1M, Q, 2Q, Y) from the buckets of the full history, already complete before the date,
+  and the state of the partial bucket at the date (open, running high / low, close)
+- Computed once for the whole history, each date is then a slice
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import pandas as pd
+import numpy as np
+
+from pyatsm.sessions import resample_ohlc # Same buckets as EnvATS.get_ut
+
+
+class AsOfData():
+    """
+    Class giving the daily bars and the UTs of a symbol as of any date of its history
+    """
+    def __init__(self,data):
+        self.data = data # Full history, sorted by date
+        self.dates = data.index.values.astype('datetime64[ns]')
+        self.uts = {} # State of each UT: {period: dict}
+        return
+
+    def get_position(self,as_of):
+        """
+        :return: number of daily bars until as_of (included), by binary search
+        """
+        return int(np.searchsorted(self.dates,np.datetime64(pd.Timestamp(as_of),'ns'),side='right'))
+
+    def get_dates(self,start=None,nb_days=None):
+        """
+        :return: DatetimeIndex of nb_days consecutive bars from start (all bars by default)
+        """
+        first = 0
+        if start != None:
+            first = int(np.searchsorted(self.dates,np.datetime64(pd.Timestamp(start),'ns'),side='left'))
+        last = len(self.dates)
+        if nb_days != None:
+            last = min(last,first+nb_days)
+        return self.data.index[first:last]
+
+    def get_data(self,as_of):
+        """
+        :return: daily bars until as_of (included), without copy
+        """
+        return self.data.iloc[:self.get_position(as_of)]
+
+    def get_ut(self,period,as_of):
+        """
+        Return the UT as of a date: identical to the resampling of the bars until as_of,
+        the last bucket is the partial bucket at the date (labelled with the end of the period)
+
+        :return: DataFrame OHLC with a Date column
+        """
+        state = self.__get_state(period)
+        pos = self.get_position(as_of)
+        ut = state['ut']
+        if pos == 0:
+            df = ut.iloc[:0].copy()
+            df['Date'] = df.index
+            return df
+        i = pos-1
+        bucket = state['bucket'][i]
+        partial = pd.DataFrame({'Open':[state['open'][i]],'High':[state['high'][i]],
+                                'Low':[state['low'][i]],'Close':[self.data['Close'].values[i]]},
+                               index=pd.DatetimeIndex([ut.index[bucket]],name=ut.index.name))
+        df = pd.concat([ut.iloc[:bucket],partial])
+        df['Date'] = df.index
+        return df
+
+    def __get_state(self,period):
+        """
+        Buckets of the full history, bucket of each daily bar, and state of the partial bucket at each bar:
+        open of the bucket, running high and low since the start of the bucket
+        """
+        if period in self.uts:
+            return self.uts[period]
+        ut = resample_ohlc(self.data,period)
+        # Buckets are (previous label, label]: the bucket of a bar is the first label >= its date
+        bucket = np.searchsorted(ut.index.values.astype('datetime64[ns]'),self.dates,side='left')
+        group = np.cumsum(np.append(True,bucket[1:] != bucket[:-1]))-1
+        starts = np.flatnonzero(np.append(True,bucket[1:] != bucket[:-1]))
+        self.uts[period] = {
+            'ut':ut,
+            'bucket':bucket,
+            'open':self.data['Open'].values[starts[group]],
+            'high':pd.Series(self.data['High'].values).groupby(group).cummax().values,
+            'low':pd.Series(self.data['Low'].values).groupby(group).cummin().values,
+            }
+        return self.uts[period]
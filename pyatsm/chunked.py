@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+File name *chunked.py*
+
+Out-of-core processing of the intraday histories (years of 1min / 5min bars):
+- CSV file streamed in chunks of dates, sized from a memory budget
+- Buckets of all the intraday UTs aggregated in one pass: the bars of the last bucket,
+  possibly incomplete, are carried to the next chunk (same buckets as aggregate_session)
+- Only the last bars of each UT are kept: the indicators of the view are computed on
+  the last 400 bars at most (see IndicatorGraph), so the view is identical to the in-memory one
+
+Usage: python -m pyatsm.chunked -f data/TEST_intra.csv --budget 16
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, time, tracemalloc
+import numpy as np
+import pandas as pd
+
+from pyatsm.schema import normalize, PRICE_COLS
+from pyatsm.sessions import get_session_labels, aggregate_labels, aggregate_session
+
+
+CHUNK_BUDGET = 128*1024*1024 # Memory budget of the processing (bytes), files larger than it are streamed
+ROW_BYTES = 512 # Peak memory per row of a chunk: parsed strings, dates and normalized arrays
+KEEP_BARS = 500 # Bars kept for each UT, and intraday bars: more than the 400 bars of the indicators
+INTRA_PERIODS = ['5min','15min','30min','1H','3H','D']
+
+
+def use_chunks(data_file,budget=CHUNK_BUDGET):
+    """
+    :return: True if the data file is too large to be processed in memory within the budget
+    """
+    try:
+        return os.path.getsize(data_file) > budget
+    except OSError:
+        return False
+
+
+def get_chunk_rows(budget=CHUNK_BUDGET):
+    """ :return: number of rows of each chunk for the budget (half of it, the other half for the state) """
+    return max(1000,int(budget/2/ROW_BYTES))
+
+
+def iter_chunks(data_file,chunk_rows):
+    """
+    Bars of the CSV file, normalized chunk by chunk (sorted dates expected, as written by the downloaders)
+
+    :return: generator of DataFrames (PRICE_COLS), indexed by Date
+    """
+    for chunk in pd.read_csv(data_file,chunksize=chunk_rows):
+        yield normalize(chunk)[PRICE_COLS]
+
+
+class SessionAggregator():
+    """
+    Class aggregating the bars of 1 UT chunk by chunk, within the sessions of the exchange
+    State carried between chunks: bars of the last bucket (may continue in the next chunk),
+    and last buckets completed
+    """
+    def __init__(self,period,exchange='US',keep=KEEP_BARS):
+        self.period = period
+        self.exchange = exchange
+        self.keep = keep
+        self.carry = None # Bars of the last bucket, not complete yet
+        self.carry_labels = np.array([],dtype='datetime64[ns]')
+        self.buckets = aggregate_labels(None,[])
+        return
+
+    def add(self,bars):
+        """ Add the next bars (after the bars already added) """
+        keep, labels = get_session_labels(bars.index.values,self.period,self.exchange)
+        bars = bars[keep]
+        if self.carry is not None and len(self.carry) > 0:
+            bars = pd.concat([self.carry,bars])
+            labels = np.concatenate([self.carry_labels,labels])
+        if len(labels) == 0:
+            return
+        last = np.searchsorted(labels,labels[-1]) # Labels are sorted: the last bucket is at the end
+        if last > 0:
+            self.__append(aggregate_labels(bars.iloc[:last],labels[:last]))
+        self.carry = bars.iloc[last:]
+        self.carry_labels = labels[last:]
+        return
+
+    def __append(self,df):
+        if len(self.buckets) == 0:
+            self.buckets = df.tail(self.keep)
+        else:
+            self.buckets = pd.concat([self.buckets,df]).tail(self.keep)
+        return
+
+    def get_data(self):
+        """ :return: last buckets, including the last one (possibly incomplete) """
+        if self.carry is not None and len(self.carry) > 0:
+            self.__append(aggregate_labels(self.carry,self.carry_labels))
+            self.carry = None
+            self.carry_labels = self.carry_labels[:0]
+        return self.buckets
+
+
+class ChunkedHistory():
+    """
+    Class streaming an intraday data file, and aggregating all the UTs in one pass
+    Duplicated dates at the border of 2 chunks keep the last bar, as in memory (see schema.normalize)
+
+    :param budget: memory budget (bytes), sets the number of rows of each chunk
+    """
+    def __init__(self,data_file,exchange='US',periods=INTRA_PERIODS,keep=KEEP_BARS,budget=CHUNK_BUDGET):
+        self.data_file = data_file
+        self.exchange = exchange
+        self.periods = periods
+        self.keep = keep
+        self.budget = budget
+        self.data = None # Last intraday bars
+        self.uts = {} # Last bars of each UT
+        self.nb_bars = 0
+        self.nb_chunks = 0
+        return
+
+    def run(self):
+        """
+        Stream the file and aggregate the UTs
+
+        :return: self, with data and uts
+        """
+        aggregators = [SessionAggregator(period,self.exchange,self.keep) for period in self.periods]
+        pending = None # Last bar read, replaced if the next chunk starts with the same date
+        tail = []
+        for chunk in iter_chunks(self.data_file,get_chunk_rows(self.budget)):
+            if len(chunk) == 0:
+                continue
+            self.nb_chunks += 1
+            if pending is not None:
+                if chunk.index[0] < pending.index[-1]:
+                    raise ValueError('dates not sorted in '+self.data_file)
+                if chunk.index[0] > pending.index[-1]:
+                    chunk = pd.concat([pending,chunk])
+            bars = chunk.iloc[:-1]
+            pending = chunk.iloc[-1:]
+            for aggregator in aggregators:
+                aggregator.add(bars)
+            tail = [pd.concat(tail+[bars]).tail(self.keep)] if len(bars) > 0 else tail
+            self.nb_bars += len(bars)
+        if pending is not None:
+            for aggregator in aggregators:
+                aggregator.add(pending)
+            tail = [pd.concat(tail+[pending]).tail(self.keep)]
+            self.nb_bars += len(pending)
+        if len(tail) == 0:
+            self.data = pd.DataFrame(columns=PRICE_COLS,index=pd.DatetimeIndex([],name='Date'),dtype='float64')
+        else:
+            self.data = tail[0].copy()
+        self.data['Date'] = self.data.index
+        self.uts = {aggregator.period:aggregator.get_data() for aggregator in aggregators}
+        return self
+
+    def get_ut(self,period):
+        return self.uts[period]
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f",dest='file', help="Intraday CSV file")
+    parser.add_argument("--exchange",dest='exchange', default='US', help="Exchange of the sessions (PAR, BRU, AMS, BSE, US, FX)")
+    parser.add_argument("--budget",dest='budget', type=float, default=CHUNK_BUDGET/1024/1024, help="Memory budget (MB)")
+    parser.add_argument("--check",dest='check', action='store_true', help="Compare with the aggregation in memory")
+    args = parser.parse_args()
+
+    if args.file != None:
+        budget = int(args.budget*1024*1024)
+        tracemalloc.start()
+        start = time.time()
+        history = ChunkedHistory(args.file,args.exchange,budget=budget).run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('INFO: %s bars in %s chunks, %s s, peak memory %s MB (budget %s MB)'
+              % (history.nb_bars,history.nb_chunks,round(time.time()-start,2),round(peak/1024/1024,1),args.budget))
+        if args.check:
+            tracemalloc.start()
+            data = normalize(pd.read_csv(args.file))[PRICE_COLS]
+            for period in history.periods:
+                same = aggregate_session(data,period,args.exchange).tail(history.keep).equals(history.get_ut(period))
+                print('INFO: UT '+period+(' identical' if same else ' DIFFERENT')+' to the aggregation in memory')
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('INFO: peak memory in memory %s MB' % round(peak/1024/1024,1))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""
+File name *coord.py*
+
+Coordination of downloads and computations between threads and processes:
+- SingleFlight: in-process deduplication, concurrent calls with the same key run only once
+- FileLock: cross-process advisory lock (Flask workers, cron job, CLI)
+- atomic_save: write in a temporary file then rename, readers never see a partial file
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import os, re, time, tempfile, threading
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+def get_umask():
+    """ :return: umask of the process (read at import: os.umask changes it while reading it) """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+UMASK = get_umask()
+
+
+def get_cache_folder(name):
+    """
+    :return: Folder of the cache name (indicators, locks, http etc...), consistent with the data folder
+    """
+    cache_folder = "./cache/"
+    CURRENT_PATH=os.getcwd()
+    if CURRENT_PATH.find('pyatsm')>0:
+        cache_folder = "../cache/"
+    return cache_folder+name+"/"
+
+
+class SingleFlight():
+    """
+    Class deduplicating concurrent calls in the process: the first call with a key runs,
+    the calls with the same key arriving meanwhile wait and get the same result
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {} # Calls in flight: {key: {'event','result','error'}}
+        return
+
+    def do(self,key,fn,*args,**kwargs):
+        """
+        :return: result of fn(*args,**kwargs), computed once for all concurrent callers of key
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call == None
+            if leader:
+                call = {'event':threading.Event(),'result':None,'error':None}
+                self.calls[key] = call
+        if not leader:
+            call['event'].wait()
+            if isinstance(call['error'],Exception):
+                raise call['error']
+            if call['error'] != None: # Leader interrupted (KeyboardInterrupt, SystemExit...)
+                raise RuntimeError('call of '+repr(key)+' interrupted') from call['error']
+            return call['result']
+        try:
+            call['result'] = fn(*args,**kwargs)
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['event'].set()
+        return call['result']
+
+
+SINGLE_FLIGHT = SingleFlight() # Shared by the whole process
+
+
+class FileLock():
+    """
+    Class managing an exclusive advisory lock on a file, between processes (and threads)
+
+    Usage: with FileLock('download_MC.PA'): ...
+    """
+    def __init__(self,name,lock_folder=None):
+        if lock_folder == None:
+            lock_folder = get_cache_folder('locks')
+        self.lock_folder = lock_folder
+        self.path = lock_folder+re.sub(r'[^\w.-]','_',name)+'.lock'
+        self.file = None
+        return
+
+    def acquire(self):
+        os.makedirs(self.lock_folder,exist_ok=True)
+        self.file = open(self.path,'a+')
+        if fcntl != None:
+            fcntl.flock(self.file.fileno(),fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(),msvcrt.LK_LOCK,1)
+                    break
+                except OSError: # LK_LOCK gives up after 10 seconds
+                    time.sleep(0.1)
+        return self
+
+    def release(self):
+        if self.file == None:
+            return
+        if fcntl != None:
+            fcntl.flock(self.file.fileno(),fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(),msvcrt.LK_UNLCK,1)
+        self.file.close()
+        self.file = None
+        return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self,*exc):
+        self.release()
+        return False
+
+
+def atomic_save(path,save):
+    """
+    Save a file atomically: save(tmp_path) writes a temporary file in the same folder,
+    which then replaces path, with the mode of path (or of a new file, umask applied)
+
+    :param save: function writing the file, with the temporary path as argument
+    """
+    folder = os.path.dirname(path)
+    if folder == '':
+        folder = '.'
+    os.makedirs(folder,exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder,prefix='.'+os.path.basename(path)+'.',suffix='.tmp')
+    os.close(fd)
+    try:
+        save(tmp_path)
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~UMASK
+        os.chmod(tmp_path,mode) # Not the 0600 of mkstemp
+        os.replace(tmp_path,path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def atomic_write_text(path,text):
+    """ Write a text file atomically """
+    def save(tmp_path):
+        with open(tmp_path,'w') as f:
+            f.write(text)
+    return atomic_save(path,save)
+
+
+def atomic_to_csv(df,path,**kwargs):
+    """ DataFrame.to_csv, written atomically """
+    return atomic_save(path,lambda tmp_path: df.to_csv(tmp_path,**kwargs))
+
+
+def atomic_write_image(fig,path,**kwargs):
+    """ Plotly write_image, written atomically (format from the extension of path) """
+    img_format = os.path.splitext(path)[1][1:]
+    return atomic_save(path,lambda tmp_path: fig.write_image(tmp_path,format=img_format,**kwargs))
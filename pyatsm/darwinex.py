@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+File name *darwinex.py*
+
+Ingestion of the daily candles of the Darwinex products (DBA, JTL etc...):
+- Candles of each product kept in a binary store (cache/darwinex/<product>.npz): the seed history
+  (dba_init.csv, ALL and 1Y candle sets) is read or downloaded once only
+- Then only the candles since the last ones stored are requested (from / to range of the API)
+- Candle JSON parsed directly into arrays, no DataFrame for each response
+- Products refreshed in 1 batch, on the pooled session of the HTTP cache (see http_cache.py)
+- Data file <product>.csv written from the store, as read by EnvATS
+
+Usage: python -m pyatsm.darwinex -p DBA JTL
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, json, time
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pyatsm.coord import FileLock, atomic_save, atomic_to_csv, get_cache_folder
+except ImportError: # Run as a script from pyatsm/ (e.g. price_data.py)
+    from coord import FileLock, atomic_save, atomic_to_csv, get_cache_folder
+
+
+URL_DARWINEX = os.environ.get('PYATS_URL_DARWINEX','https://api.darwinex.com')
+CANDLE_COLS = ['Open','High','Low','Close']
+SEED_FILES = {'DBA':'dba_init.csv'} # History before the candles of the API, in the data folder
+SEED_SETS = {'JTL':['ALL','1Y']} # Candle sets of the first download, the last set wins (default: range of SEED_YEARS)
+SEED_YEARS = 25
+FEED_WORKERS = 4 # Concurrent requests of a batch
+
+
+def get_range_end():
+    """ :return: end timestamp (str) of the requests, tomorrow at midnight: same URL during the day (cached) """
+    return str(int(datetime.timestamp(datetime.combine(date.today()+timedelta(days=1),datetime.min.time()))))
+
+
+def parse_candles(body):
+    """
+    Candles of a response of the API, the first one is skipped (as the previous downloads)
+    Each candle is dated with the day after its timestamp
+
+    :return: dates (datetime64[ns], sorted) and prices (array n x 4, CANDLE_COLS)
+    """
+    candles = json.loads(body)['candles'][1:]
+    timestamps = np.fromiter((candle['timestamp'] for candle in candles),dtype='int64',count=len(candles))
+    prices = np.array([[candle['candle']['open'],candle['candle']['high'],candle['candle']['low'],candle['candle']['close']]
+                       for candle in candles],dtype='float64').reshape(-1,4)
+    dates = (timestamps.astype('datetime64[s]').astype('datetime64[D]')+np.timedelta64(1,'D')).astype('datetime64[ns]')
+    order = np.argsort(dates,kind='stable')
+    return [dates[order],prices[order]]
+
+
+def merge_candles(dates,prices,new_dates,new_prices):
+    """ :return: candles of both, sorted, the new ones replacing the candles of the same date """
+    dates = np.concatenate([dates,new_dates])
+    prices = np.concatenate([prices,new_prices])
+    order = np.argsort(dates,kind='stable')
+    dates = dates[order]
+    if len(dates) == 0:
+        return [dates,prices]
+    keep = np.append(dates[1:] != dates[:-1],True)
+    return [dates[keep],prices[order][keep]]
+
+
+def read_seed_file(seed_file):
+    """ :return: candles of a seed CSV file (Date, Open, High, Low, Close) """
+    if not os.path.exists(seed_file):
+        print('WARNING: seed file does not exist: '+seed_file)
+        return [np.array([],dtype='datetime64[ns]'),np.zeros((0,4))]
+    df = pd.read_csv(seed_file,delimiter=',',on_bad_lines='skip')
+    dates = pd.to_datetime(df['Date']).dt.normalize().values.astype('datetime64[ns]')
+    return merge_candles(np.array([],dtype='datetime64[ns]'),np.zeros((0,4)),dates,df[CANDLE_COLS].values.astype('float64'))
+
+
+class CandleStore():
+    """
+    Class keeping the candles of the products in binary files (dates and prices arrays)
+    """
+    def __init__(self,folder=None):
+        if folder == None:
+            folder = get_cache_folder('darwinex')
+        self.folder = folder
+        return
+
+    def __get_path(self,product):
+        return self.folder+product+'.npz'
+
+    def load(self,product):
+        """ :return: dates and prices of the product, None if not stored """
+        try:
+            with np.load(self.__get_path(product)) as f:
+                return [f['dates'],f['prices']]
+        except (OSError,ValueError,KeyError):
+            return None
+
+    def save(self,product,dates,prices):
+        def save(tmp_path):
+            with open(tmp_path,'wb') as f:
+                np.savez(f,dates=dates,prices=prices)
+        atomic_save(self.__get_path(product),save)
+        return
+
+
+class DarwinexFeed():
+    """
+    Class refreshing the candles of Darwinex products: seed history once, then the new candles only
+
+    :param http: HttpCache of the requests (pooled session, conditional requests)
+    """
+    def __init__(self,http,token,data_folder="./data/",store=None,workers=FEED_WORKERS,url=URL_DARWINEX):
+        self.http = http
+        self.token = token
+        self.url = url
+        self.data_folder = data_folder
+        self.store = store if store != None else CandleStore()
+        self.workers = workers
+        return
+
+    def __get_candles(self,url):
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": "Bearer "+self.token,
+        }
+        print(url)
+        return parse_candles(self.http.get(url,headers=headers))
+
+    def __get_range(self,product,start):
+        """ :return: candles since the timestamp start (str) """
+        url = self.url+f'/darwininfo/2.1/products/{product}/candles?resolution=1d&from='+start+'&to='+get_range_end()
+        return self.__get_candles(url)
+
+    def __get_seed(self,product):
+        """ :return: seed history of the product: seed file and candle sets, or range of SEED_YEARS """
+        dates, prices = [np.array([],dtype='datetime64[ns]'),np.zeros((0,4))]
+        if product in SEED_FILES:
+            dates, prices = read_seed_file(self.data_folder+SEED_FILES[product])
+        if product in SEED_SETS:
+            for dur in SEED_SETS[product]:
+                url = self.url+f'/darwininfo/2.1/products/{product}/candles/{dur}?resolution=1d'
+                dates, prices = merge_candles(dates,prices,*self.__get_candles(url))
+        else:
+            start = datetime.combine(date.today()+timedelta(days=1),datetime.min.time())-timedelta(days=SEED_YEARS*365+30)
+            dates, prices = merge_candles(dates,prices,*self.__get_range(product,str(int(datetime.timestamp(start)))))
+        return [dates,prices]
+
+    def refresh(self,product):
+        """
+        Refresh the candles of the product and write its data file
+
+        :return: number of candles added
+        """
+        with FileLock('darwinex_'+product):
+            stored = self.store.load(product)
+            if stored == None or len(stored[0]) < 2:
+                dates, prices = self.__get_seed(product)
+                added = len(dates)
+            else:
+                dates, prices = stored
+                # From the candle before the last one: skipped, the last one (possibly partial) is replaced
+                start = int(((dates[-2]-np.timedelta64(1,'D'))-np.datetime64(0,'s')).astype('timedelta64[s]').astype('int64'))
+                new_dates, new_prices = self.__get_range(product,str(start))
+                dates, prices = merge_candles(dates,prices,new_dates,new_prices)
+                added = len(dates)-len(stored[0])
+            self.store.save(product,dates,prices)
+            df = pd.DataFrame(prices,columns=CANDLE_COLS,index=pd.DatetimeIndex(dates,name='Date'))
+            atomic_to_csv(df,self.data_folder+product+'.csv',date_format='%Y-%m-%d')
+        return added
+
+    def refresh_all(self,products):
+        """
+        Refresh several products in 1 batch, errors of a product do not stop the others
+
+        :return: dict {product: number of candles added, None if failed}
+        """
+        def refresh(product):
+            try:
+                return self.refresh(product)
+            except Exception as e:
+                print('WARNING: candles of '+product+' not refreshed - '+str(e))
+                return None
+        with ThreadPoolExecutor(max_workers=max(1,min(self.workers,len(products)))) as pool:
+            return dict(zip(products,pool.map(refresh,products)))
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p",dest='products', nargs='+', default=['DBA','JTL'], help="Darwinex products")
+    parser.add_argument("--token",dest='token', default='', help="API token")
+    args = parser.parse_args()
+
+    try:
+        from pyatsm.http_cache import HTTP_CACHE
+    except ImportError:
+        from http_cache import HTTP_CACHE
+    data_folder = "../data/" if os.getcwd().find('pyatsm')>0 else "./data/"
+    start = time.time()
+    added = DarwinexFeed(HTTP_CACHE,args.token,data_folder).refresh_all(args.products)
+    for product in added:
+        print('INFO: %s candles added for %s' % (added[product],product))
+    print('INFO: %s s, %s' % (round(time.time()-start,2),dict(HTTP_CACHE.stats)))
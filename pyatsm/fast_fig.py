@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+File name *fast_fig.py*
+
+Fast Plotly figure, built from raw dict specs without graph_objects validation:
+- Layout of the subplots (make_subplots) built once per grid, then copied for each figure
+- Traces, shapes and annotations appended as dicts, in the same structure as graph_objects
+- Same methods as the plotly Figure used by EnvATS (add_trace, update_xaxes, add_shape,
+  add_annotation, update_layout, write_image, show, to_plotly_json)
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from plotly.subplots import make_subplots
+try:
+    from _plotly_utils.utils import to_typed_array_spec # Base64 typed arrays (plotly >= 6)
+except ImportError:
+    to_typed_array_spec = None
+
+
+LAYOUTS = {} # Layouts of the grids already built: {(rows, cols, spacing): [layout, axes of each cell]}
+
+
+def set_nested(props,key,value):
+    """
+    Set a property with plotly magic underscores (e.g. rangeslider_visible), copying the nested dicts
+    (layouts share their nested dicts with the template)
+    """
+    names = key.split('_')
+    for name in names[:-1]:
+        props[name] = dict(props.get(name,{}))
+        props = props[name]
+    props[names[-1]] = value
+    return
+
+
+def to_spec(value):
+    """
+    Value of a trace property as plotly would serialize it: numeric arrays as typed arrays
+    when plotly supports them, dates and strings kept (encoded by PlotlyJSONEncoder)
+    """
+    if isinstance(value,(pd.Series,pd.Index)):
+        value = value.values
+    if not isinstance(value,np.ndarray):
+        return value
+    if value.dtype.kind in 'fiu' and to_typed_array_spec != None:
+        return to_typed_array_spec(value)
+    return value
+
+
+def get_layout(rows,cols,horizontal_spacing=None,vertical_spacing=None):
+    """
+    :return: layout of the grid (JSON of make_subplots, titles as placeholders) and axes of each cell
+    """
+    key = (rows,cols,horizontal_spacing,vertical_spacing)
+    if key not in LAYOUTS:
+        titles = ['{'+str(i)+'}' for i in range(rows*cols)]
+        fig = make_subplots(rows=rows,cols=cols,subplot_titles=titles,
+                            horizontal_spacing=horizontal_spacing,vertical_spacing=vertical_spacing)
+        axes = {}
+        for row in range(1,rows+1):
+            for col in range(1,cols+1):
+                ref = fig.get_subplot(row,col) # xaxis2 / yaxis2 in the layout, x2 / y2 in the traces
+                axes[(row,col)] = [ref.xaxis.plotly_name.replace('axis',''),ref.yaxis.plotly_name.replace('axis','')]
+        LAYOUTS[key] = [fig.to_plotly_json()['layout'],axes]
+    return LAYOUTS[key]
+
+
+class FastFigure():
+    """
+    Class building a figure of subplots from dicts, as plotly would serialize it
+    """
+    def __init__(self,rows=1,cols=1,subplot_titles=None,horizontal_spacing=None,vertical_spacing=None):
+        layout, self.axes = get_layout(rows,cols,horizontal_spacing,vertical_spacing)
+        self.data = []
+        self.layout = dict(layout) # Nested dicts are shared with the template, copied before update
+        # Shapes and annotations appended to lists of the figure, set in the layout by to_plotly_json
+        self.shapes = list(self.layout.pop('shapes',[]))
+        self.annotations = []
+        subplot_titles = subplot_titles if subplot_titles != None else []
+        for i, annotation in enumerate(self.layout.pop('annotations',[])):
+            if i < len(subplot_titles):
+                self.annotations.append(dict(annotation,text=subplot_titles[i]))
+        return
+
+    def add_trace(self,trace,row=None,col=None):
+        """ Add a trace spec (dict with type, magic underscores allowed), in the subplot of row / col """
+        spec = {}
+        for key, value in trace.items():
+            set_nested(spec,key,to_spec(value))
+        trace = spec
+        if row != None and col != None:
+            trace['xaxis'], trace['yaxis'] = self.axes[(row,col)]
+        self.data.append(trace)
+        return self
+
+    def update_xaxes(self,row=None,col=None,**props):
+        """ Update the x axis of the subplot of row / col (all x axes by default) """
+        if row != None and col != None:
+            names = [self.axes[(row,col)][0].replace('x','xaxis',1)]
+        else:
+            names = [name for name in self.layout if name.startswith('xaxis')]
+        for name in names:
+            axis = dict(self.layout.get(name,{}))
+            for key, value in props.items():
+                set_nested(axis,key,value)
+            self.layout[name] = axis
+        return self
+
+    def add_shape(self,**shape):
+        self.shapes.append(shape)
+        return self
+
+    def add_annotation(self,**annotation):
+        self.annotations.append(annotation)
+        return self
+
+    def update_layout(self,**props):
+        for key, value in props.items():
+            if key == 'title' and isinstance(value,str):
+                value = dict(text=value) # As plotly
+            if key in ['shapes','annotations']:
+                setattr(self,key,list(value))
+                continue
+            set_nested(self.layout,key,value)
+        return self
+
+    def to_plotly_json(self):
+        layout = dict(self.layout,annotations=self.annotations)
+        if len(self.shapes) > 0:
+            layout['shapes'] = self.shapes
+        return {'data':self.data,'layout':layout}
+
+    def to_dict(self):
+        return self.to_plotly_json()
+
+    def write_image(self,*args,**kwargs):
+        return pio.write_image(self.to_plotly_json(),*args,validate=False,**kwargs)
+
+    def show(self,*args,**kwargs):
+        return pio.show(self.to_plotly_json(),*args,validate=False,**kwargs)
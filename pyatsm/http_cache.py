@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+File name *http_cache.py*
+
+Cache of the responses of the providers (YahooFinance, Alphavantage, Darwinex), on disk:
+- Key: URL normalized (sorted parameters), without the API keys, so they never reach the disk,
+  and without the bounds of the range (rolling each day): the entry of a symbol and interval is revalidated across the days
+- Fresh until the next close of the exchange (daily bars), or a few minutes (intraday bars):
+  no request at all while the data cannot have changed
+- Then conditional requests (ETag / Last-Modified): 304 Not Modified, no body transferred
+- Offline mode (PYATS_HTTP_OFFLINE=1): cached bodies served without network, e.g. benchmarks
+- Retention by age and total size of the bodies
+
+Usage: python -m pyatsm.http_cache --list --prune
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, json, hashlib, threading, time
+import pandas as pd
+import requests
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+try:
+    from pyatsm.coord import atomic_save, atomic_write_text, get_cache_folder
+    from pyatsm.sessions import get_next_close, PUBLISH_DELAY
+except ImportError: # Run as a script from pyatsm/ (e.g. price_data.py)
+    from coord import atomic_save, atomic_write_text, get_cache_folder
+    from sessions import get_next_close, PUBLISH_DELAY
+
+
+SECRET_PARAMS = ['apikey','api_key','token','access_token'] # Parameters removed from the keys
+RANGE_PARAMS = ['period1','period2','from','to'] # Bounds of the range (YahooFinance, Darwinex), removed from the keys
+INTRA_TTL = pd.Timedelta(minutes=5) # Intraday bars: 1 new bar every 5 minutes at most
+HTTP_TIMEOUT = 30
+HTTP_MAX_AGE = 30 # Days of retention of the responses not fetched again
+HTTP_MAX_BYTES = 256*1024*1024 # Total size of the bodies
+HTTP_PRUNE_EVERY = 50 # Downloads between 2 prunes
+
+
+class OfflineError(Exception):
+    """ Response not in the cache, in offline mode """
+
+
+def normalize_url(url,removed=SECRET_PARAMS):
+    """
+    :return: URL without the secret parameters (or the parameters removed), with sorted parameters
+    """
+    parts = urlsplit(url)
+    params = [(key,value) for key, value in parse_qsl(parts.query,keep_blank_values=True)
+              if key.lower() not in removed]
+    return urlunsplit((parts.scheme,parts.netloc.lower(),parts.path,urlencode(sorted(params)),''))
+
+
+def get_key(url):
+    """ :return: key of the response: URL normalized, without the secret parameters and the bounds of the range """
+    return normalize_url(url,SECRET_PARAMS+RANGE_PARAMS)
+
+
+def get_expiry(fetched,exchange='US',intra=False):
+    """
+    :return: end of freshness of a response fetched at the date (UTC): next close of the exchange,
+    plus the delay of the providers to publish the last bar
+    """
+    expiry = get_next_close(exchange,fetched-PUBLISH_DELAY)
+    expiry = expiry+PUBLISH_DELAY if expiry != None else fetched
+    if intra:
+        expiry = min(expiry,fetched+INTRA_TTL)
+    return expiry
+
+
+class HttpCache():
+    """
+    Class getting the responses of the providers through the cache
+    Entries: <key>.body (body of the last 200 response) and <key>.json (URL, validators, fetch date)
+    The body of a previous range is served while fresh: the downloaders merge the bars (see darwinex.merge_candles)
+
+    :param offline: serve the cached bodies only, never the network (default: PYATS_HTTP_OFFLINE)
+    """
+    def __init__(self,cache_folder=None,offline=None,session=None,max_age=HTTP_MAX_AGE,max_bytes=HTTP_MAX_BYTES):
+        if cache_folder == None:
+            cache_folder = get_cache_folder('http')
+        self.cache_folder = cache_folder
+        if offline == None:
+            offline = os.environ.get('PYATS_HTTP_OFFLINE','') not in ['','0']
+        self.offline = offline
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.session = session if session != None else requests.Session()
+        self.stats = Counter() # Responses fresh, not_modified, downloaded, stale, offline, and transfers / bytes on the network
+        self.lock = threading.Lock()
+        return
+
+    def __get_path(self,url):
+        return self.cache_folder+hashlib.sha1(get_key(url).encode()).hexdigest()[:20]
+
+    def __read(self,path):
+        try:
+            with open(path+'.json') as f:
+                meta = json.load(f)
+            with open(path+'.body','rb') as f:
+                return [meta,f.read()]
+        except (OSError,ValueError):
+            return [None,None]
+
+    def __count(self,name,nb_bytes=0):
+        with self.lock:
+            self.stats[name] += 1
+            self.stats['bytes'] += nb_bytes
+        return
+
+    def get(self,url,headers=None,exchange='US',intra=False,valid=None):
+        """
+        Body of the response to a GET, from the cache when fresh or not modified
+
+        :param valid: function(body) returning False for errors answered with a 200 (not cached)
+        :return: body (bytes)
+        """
+        path = self.__get_path(url)
+        meta, body = self.__read(path)
+        if self.offline:
+            if body == None:
+                raise OfflineError('response not cached for '+normalize_url(url))
+            self.__count('offline')
+            return body
+        now = pd.Timestamp.now(tz='UTC')
+        if body != None and now < pd.Timestamp(meta['expiry']):
+            self.__count('fresh')
+            return body
+
+        request_headers = dict(headers or {})
+        if body != None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            response = self.session.get(url,headers=request_headers,timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            if body == None:
+                raise
+            print('WARNING: provider not available, cached response used - '+str(e))
+            self.__count('stale')
+            return body
+        self.__count('transfers',len(response.content))
+        if response.status_code == 304 and body != None:
+            self.__count('not_modified')
+        elif response.status_code == 200:
+            body = response.content
+            if valid != None and not valid(body):
+                return body
+            meta = {'url':normalize_url(url),
+                    'etag':response.headers.get('ETag'),
+                    'last_modified':response.headers.get('Last-Modified')}
+            self.__count('downloaded')
+            def save(tmp_path):
+                with open(tmp_path,'wb') as f:
+                    f.write(body)
+            atomic_save(path+'.body',save)
+            if self.stats['downloaded'] % HTTP_PRUNE_EVERY == 0:
+                self.prune()
+        elif response.status_code >= 400 and body != None:
+            print('WARNING: provider error %s, cached response used' % response.status_code)
+            self.__count('stale')
+            return body
+        else:
+            response.raise_for_status()
+            return response.content # Other statuses are not cached
+        meta['fetched'] = str(now)
+        meta['expiry'] = str(get_expiry(now,exchange,intra))
+        atomic_write_text(path+'.json',json.dumps(meta))
+        return body
+
+    def get_entries(self):
+        """ :return: DataFrame of the cached responses (URL, validators, fetch and expiry dates, size) """
+        rows = []
+        if os.path.exists(self.cache_folder):
+            for file in sorted(os.listdir(self.cache_folder)):
+                if file.endswith('.json'):
+                    meta, body = self.__read(self.cache_folder+file[:-5])
+                    if meta != None:
+                        rows.append(dict(meta,size=len(body)))
+        return pd.DataFrame(rows,columns=['url','etag','last_modified','fetched','expiry','size'])
+
+    def prune(self,max_age=None,max_bytes=None):
+        """
+        Remove the responses older than max_age (days), then the oldest ones until the bodies fit in max_bytes
+
+        :return: number of responses removed
+        """
+        max_age = self.max_age if max_age == None else max_age
+        max_bytes = self.max_bytes if max_bytes == None else max_bytes
+        entries = [] # [last fetch (modification of the .json, also on 304), size of the body, path]
+        try:
+            files = os.listdir(self.cache_folder)
+        except OSError:
+            return 0
+        for file in files:
+            if file.endswith('.body'):
+                path = self.cache_folder+file[:-5]
+                try:
+                    entries.append([os.path.getmtime(path+'.json'),os.path.getsize(path+'.body'),path])
+                except OSError:
+                    continue # Removed by another process
+        entries.sort()
+        total = sum([entry[1] for entry in entries])
+        limit = time.time()-max_age*86400
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= limit and total <= max_bytes:
+                break
+            for ext in ['.json','.body']:
+                try:
+                    os.remove(path+ext)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+
+HTTP_CACHE = HttpCache() # Shared by the downloaders of the process
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list",dest='list', action='store_true', help="Print the cached responses")
+    parser.add_argument("--prune",dest='prune', action='store_true', help="Remove the responses beyond the retention")
+    args = parser.parse_args()
+
+    if args.prune:
+        print('INFO: %s responses removed' % HTTP_CACHE.prune())
+    if args.list:
+        entries = HTTP_CACHE.get_entries()
+        print(entries.to_string())
+        print('INFO: %s responses, %s bytes' % (len(entries),entries['size'].sum()))
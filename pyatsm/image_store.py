@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+File name *image_store.py*
+
+Store of the PNG images of the AT.S views:
+- Each image rendered once, under the hash of its figure and size (cache/images/objects/):
+  the same figure is never encoded again, whatever the number of exports
+- Images of png/ (1200x800) and static/png/ (1200x675, Flask) are links to the objects
+- Index in SQLite (cache/images/index.db), for fast lookup by symbol and date
+- Retention by age and total size: oldest images removed with their links
+
+Usage: python -m pyatsm.image_store --prune --max_age 30 --max_mb 512
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, time, hashlib, shutil, sqlite3, threading, uuid
+from contextlib import contextmanager
+import pandas as pd
+
+from pyatsm.coord import FileLock, atomic_write_image, get_cache_folder
+
+
+IMAGES_MAX_AGE = 30 # Days of retention of the images
+IMAGES_MAX_BYTES = 512*1024*1024 # Total size of the objects
+
+
+def get_figure_hash(spec,width,height):
+    """ :return: hash of the image: figure in JSON and size """
+    return hashlib.sha1((spec+'|%dx%d' % (width,height)).encode()).hexdigest()
+
+
+def link_file(source,path):
+    """ Link path to source (hard link, copy if not supported), replacing path atomically """
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder,exist_ok=True)
+    if os.path.exists(path) and os.path.samefile(source,path):
+        return path # Already linked (a rename between links of the same file would do nothing)
+    for attempt in range(10):
+        # Name unique to this call: workers linking the same image never share a temporary file
+        tmp_path = os.path.join(folder,'.'+os.path.basename(path)+'.'+uuid.uuid4().hex+'.tmp')
+        try:
+            os.link(source,tmp_path)
+        except FileExistsError:
+            continue
+        except OSError: # File system without hard links
+            try:
+                with open(source,'rb') as src, open(tmp_path,'xb') as dst:
+                    shutil.copyfileobj(src,dst)
+            except FileExistsError:
+                continue
+        os.replace(tmp_path,path)
+        return path
+    raise FileExistsError('no temporary name available for '+path)
+
+
+class ImageStore():
+    """
+    Class managing the PNG images of the views, content-addressed, with an index and a retention
+    """
+    def __init__(self,folder=None,max_age=IMAGES_MAX_AGE,max_bytes=IMAGES_MAX_BYTES):
+        if folder == None:
+            folder = get_cache_folder('images')
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(folder,exist_ok=True)
+        with self.__connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # kind: 'view' (6 UTs), 'intra' (intraday UTs) or the UT of a single UT view
+            conn.execute('CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, symbol TEXT, date TEXT, kind TEXT, '
+                         'width INTEGER, height INTEGER, hash TEXT, size INTEGER, created REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol ON images (symbol, date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_hash ON images (hash)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_created ON images (created)')
+        return
+
+    @contextmanager
+    def __connect(self):
+        """ Connection in a transaction (committed at the end), then closed """
+        conn = sqlite3.connect(self.folder+'index.db',timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_object(self,digest):
+        return self.folder+'objects/'+digest[:2]+'/'+digest+'.png'
+
+    def put(self,path,symbol,date,kind,fig,spec,width,height):
+        """
+        Image of the figure at path (link to the object), rendered only if this figure was never rendered at this size
+
+        :param spec: figure in JSON, hashed with the size
+        :return: True if the image was rendered, False if the object already existed
+        """
+        digest = get_figure_hash(spec,width,height)
+        obj = self.get_object(digest)
+        rendered = False
+        with FileLock('img_'+digest): # Rendered once for concurrent exports
+            if not os.path.exists(obj):
+                os.makedirs(os.path.dirname(obj),exist_ok=True)
+                atomic_write_image(fig,obj,width=width,height=height)
+                rendered = True
+        link_file(obj,path)
+        with self.__connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (path,symbol,date,kind,width,height,digest,os.path.getsize(obj),time.time()))
+        if rendered:
+            self.prune()
+        return rendered
+
+    def find(self,symbol,date=None,kind=None):
+        """
+        :return: images of the symbol (dict of the index), last date first; of the date / kind if given
+        """
+        where = ['symbol = ?']
+        params = [symbol]
+        if date != None:
+            where.append('date = ?')
+            params.append(str(date))
+        if kind != None:
+            where.append('kind = ?')
+            params.append(kind)
+        query = 'SELECT * FROM images WHERE '+' AND '.join(where)+' ORDER BY date DESC, created DESC'
+        with self.__connect() as conn:
+            rows = [dict(row) for row in conn.execute(query,params).fetchall()]
+        return [row for row in rows if os.path.exists(row['path'])]
+
+    def __remove(self,conn,rows):
+        """ Remove images (links, index entries) and the objects no longer linked """
+        for row in rows:
+            conn.execute('DELETE FROM images WHERE path = ?',(row['path'],))
+            try:
+                if os.path.exists(row['path']) and os.path.samefile(row['path'],self.get_object(row['hash'])):
+                    os.remove(row['path'])
+            except OSError:
+                pass # Already removed or replaced
+        for digest in set([row['hash'] for row in rows]):
+            if conn.execute('SELECT 1 FROM images WHERE hash = ? LIMIT 1',(digest,)).fetchone() == None:
+                try:
+                    os.remove(self.get_object(digest))
+                except OSError:
+                    pass
+        return
+
+    def prune(self,max_age=None,max_bytes=None):
+        """
+        Remove the images older than max_age (days), then the oldest ones until the objects fit in max_bytes
+
+        :return: number of images removed
+        """
+        max_age = self.max_age if max_age == None else max_age
+        max_bytes = self.max_bytes if max_bytes == None else max_bytes
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT * FROM images WHERE created < ?',(time.time()-max_age*86400,)).fetchall()
+            self.__remove(conn,rows)
+            removed = len(rows)
+            # Size of the objects (shared by several links): from the oldest image of each object
+            objects = conn.execute('SELECT hash, MAX(size) AS size, MAX(created) AS created FROM images '
+                                   'GROUP BY hash ORDER BY created').fetchall()
+            total = sum([row['size'] for row in objects])
+            for obj in objects:
+                if total <= max_bytes:
+                    break
+                rows = conn.execute('SELECT * FROM images WHERE hash = ?',(obj['hash'],)).fetchall()
+                self.__remove(conn,rows)
+                removed += len(rows)
+                total -= obj['size']
+        return removed
+
+    def get_stats(self):
+        """ :return: number of images, of objects and size of the objects (bytes) """
+        with self.__connect() as conn:
+            row = conn.execute('SELECT COUNT(*) AS images, COUNT(DISTINCT hash) AS objects FROM images').fetchone()
+            size = conn.execute('SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM images GROUP BY hash)').fetchone()[0]
+        return [row['images'],row['objects'],size or 0]
+
+
+IMAGE_STORE = None # Store of the process, opened on first use (see get_image_store)
+IMAGE_STORE_LOCK = threading.Lock()
+
+def get_image_store():
+    """ :return: ImageStore shared by the views of the process """
+    global IMAGE_STORE
+    with IMAGE_STORE_LOCK:
+        if IMAGE_STORE == None:
+            IMAGE_STORE = ImageStore()
+    return IMAGE_STORE
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prune",dest='prune', action='store_true', help="Remove the images beyond the retention")
+    parser.add_argument("--max_age",dest='max_age', type=float, default=IMAGES_MAX_AGE, help="Retention of the images (days)")
+    parser.add_argument("--max_mb",dest='max_mb', type=float, default=IMAGES_MAX_BYTES/1024/1024, help="Total size of the images (MB)")
+    parser.add_argument("--symbol",dest='symbol', help="Print the images of a symbol")
+    args = parser.parse_args()
+
+    store = ImageStore(max_age=args.max_age,max_bytes=int(args.max_mb*1024*1024))
+    if args.prune:
+        print('INFO: %s images removed' % store.prune())
+    if args.symbol != None:
+        print(pd.DataFrame(store.find(args.symbol),columns=['path','date','kind','width','height','hash','size']).to_string())
+    images, objects, size = store.get_stats()
+    print('INFO: %s images, %s objects, %s MB' % (images,objects,round(size/1024/1024,1)))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+File name *ind_cache.py*
+
+Persistent cache of the Technical Analysis Indicators (TAindicators):
+- Stored on disk, one file per symbol / UT / indicator / parameters
+- Invalidated by a fingerprint of the bars (last date, number of rows, content hash)
+- Only the tail is recomputed when bars are appended or the last bar changes
+- Size-bounded, the least recently used entries are evicted first
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import os, pickle, hashlib, threading
+import pandas as pd
+
+from pyatsm.coord import atomic_save, get_cache_folder
+
+
+CACHE_MAX_SIZE = 200*1024*1024 # 200 MB on disk by default
+FINGERPRINT_COLS = ['Open','High','Low','Close']
+# Size of each cache folder: from the last scan, plus the writes of the process since then (overwrites counted too)
+# The folder is scanned for eviction only when this size goes above the maximum
+FOLDER_SIZES = {}
+FOLDER_SIZES_LOCK = threading.Lock()
+
+
+def get_row_hashes(data):
+    """
+    :return: numpy array with one hash per bar (date and OHLC values)
+    """
+    cols = [col for col in FINGERPRINT_COLS if col in data.columns]
+    return pd.util.hash_pandas_object(data[cols],index=True).values
+
+
+def hash_rows(row_hashes):
+    """
+    :return: Digest of an array of row hashes
+    """
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+def get_fingerprint(data,row_hashes=None):
+    """
+    Fingerprint of bars: last date, number of rows, content hash
+    The hash without the last bar is kept to detect an update of the last bar only
+
+    :return: dict with the fingerprint
+    """
+    if row_hashes is None:
+        row_hashes = get_row_hashes(data)
+    last_date = ''
+    if len(data)>0:
+        last_date = str(data.index[-1])
+    return {'last_date':last_date,
+            'rows':len(data),
+            'hash':hash_rows(row_hashes),
+            'hash_head':hash_rows(row_hashes[:-1]),
+            }
+
+
+class IndicatorCache():
+    """
+    Class managing a persistent cache of indicators, shared by CLI runs and Flask workers
+    """
+    def __init__(self,cache_folder=None,max_size=CACHE_MAX_SIZE,persist=True):
+        if cache_folder == None:
+            cache_folder = get_cache_folder('indicators')
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        self.persist = persist # False to keep entries in memory only (e.g. simulated live data)
+        self.memo = {} # In-memory copy of the entries already read or written by this instance
+        if persist:
+            os.makedirs(self.cache_folder,exist_ok=True)
+        return
+
+    def get(self,symbol,period,indicator,params,data,compute,lookback=None):
+        """
+        Return the indicator computed on data, from the cache if the bars did not change
+
+        :param compute: function returning the indicator DataFrame from a DataFrame of bars
+        :param lookback: number of bars needed to recompute one bar of the indicator,
+                         None if the indicator has to be fully recomputed when bars change
+        :return: DataFrame of the indicator
+        """
+        key = (symbol,period,indicator,tuple(params))
+        row_hashes = get_row_hashes(data)
+        fp = get_fingerprint(data,row_hashes)
+
+        entry = self.__read(key)
+        if entry != None and entry['fp']['hash'] == fp['hash']:
+            return entry['data']
+
+        ind = None
+        if entry != None and lookback != None:
+            ind = self.__update_tail(entry,data,row_hashes,compute,lookback)
+        if ind is None:
+            ind = compute(data)
+        self.__write(key,{'key':key,'fp':fp,'data':ind})
+        return ind
+
+    def __update_tail(self,entry,data,row_hashes,compute,lookback):
+        """
+        Recompute only the last bars, when the cached bars are still the head of data
+
+        :return: DataFrame of the indicator, None if a full computation is needed
+        """
+        old_rows = entry['fp']['rows']
+        if old_rows < 2 or len(data) < old_rows:
+            return None
+        if hash_rows(row_hashes[:old_rows-1]) != entry['fp']['hash_head']:
+            return None
+        cached = entry['data']
+        # First modified bar, the bar before is recomputed too (indicators look 1 bar ahead for reversals)
+        first = old_rows-1
+        nb_new = len(data)-first+1
+        tail = compute(data.tail(lookback+nb_new))
+        if len(tail) < nb_new or len(cached) < 1:
+            return None
+        tail = tail.tail(nb_new)
+        head = cached[cached.index < tail.index[0]]
+        ind = pd.concat([head,tail])
+        if len(cached) < old_rows: # Indicator limited to the last periods (see TAindicators limit)
+            ind = ind.tail(len(cached))
+        return ind
+
+    def __get_path(self,key):
+        return self.cache_folder+hashlib.sha1(repr(key).encode()).hexdigest()+'.pkl'
+
+    def __read(self,key):
+        """ Return the entry of the key, None if not in cache """
+        if key in self.memo:
+            return self.memo[key]
+        if not self.persist:
+            return None
+        path = self.__get_path(key)
+        try:
+            with open(path,'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path) # Keep track of the last use for eviction
+        except (OSError,EOFError,pickle.UnpicklingError):
+            return None
+        if entry.get('key') != key:
+            return None
+        self.memo[key] = entry
+        return entry
+
+    def __write(self,key,entry):
+        """ Write the entry in a temporary file then rename it, readers never see a partial file """
+        self.memo[key] = entry
+        if not self.persist:
+            return
+        def save(tmp_path):
+            with open(tmp_path,'wb') as f:
+                pickle.dump(entry,f,protocol=pickle.HIGHEST_PROTOCOL)
+        path = self.__get_path(key)
+        try:
+            atomic_save(path,save)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print('WARNING: indicator cache not written - '+str(e))
+            return
+        with FOLDER_SIZES_LOCK:
+            total = FOLDER_SIZES.get(self.cache_folder)
+            if total != None:
+                FOLDER_SIZES[self.cache_folder] = total+size
+                if total+size <= self.max_size:
+                    return # No scan of the folder
+        self.__evict()
+        return
+
+    def __evict(self):
+        """ Remove the least recently used entries when the cache is above max_size """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_folder):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                st = os.stat(self.cache_folder+name)
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,name))
+            total = total+st.st_size
+        if total > self.max_size:
+            for mtime, size, name in sorted(entries):
+                try:
+                    os.remove(self.cache_folder+name)
+                except OSError:
+                    continue # Already evicted by another worker, or still opened
+                total = total-size
+                if total <= self.max_size:
+                    break
+        with FOLDER_SIZES_LOCK:
+            FOLDER_SIZES[self.cache_folder] = total
+        return
+
+    def clear(self):
+        """ Remove all entries of the cache """
+        self.memo = {}
+        if not self.persist:
+            return
+        with FOLDER_SIZES_LOCK:
+            FOLDER_SIZES[self.cache_folder] = 0
+        for name in os.listdir(self.cache_folder):
+            if name.endswith('.pkl'):
+                try:
+                    os.remove(self.cache_folder+name)
+                except OSError:
+                    pass
+        return
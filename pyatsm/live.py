@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+"""
+File name *live.py*
+
+Live update of the AT.S view of a symbol:
+- LocalFeed: local stand-in of a price feed (ticks)
+- LiveView: applies ticks to the data and computes only the changes of the Plotly figure
+  (points of the traces of the last periods, annotations, vertical lines), pushed to the browser:
+  changed points restyled, new bars appended with extendTraces
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import time
+import pandas as pd
+import numpy as np
+
+from pyatsm.ind_cache import IndicatorCache
+from pyatsm.signals import LINES
+
+
+TRACE_ARRAYS = ['x','y','open','high','low','close'] # Properties of the traces updated by the browser
+LINE_COLORS = {'OGGY':'blue','OGGY_1':'blue','JACK':'green','JACK_1':'green'} # As drawn by EnvATSextraUT
+TICK_INTERVALS = [0.5,60] # Seconds between 2 ticks of a stream (min, max): a stream holds a worker
+
+
+def diff_points(old,new):
+    """
+    Changes of the arrays of 1 trace (window of the last bars): points added at the end,
+    then points changed in the window moved by these new points
+
+    :return: [number of new points, list of [position, {name: value}]], None if the window is not the same
+    """
+    if sorted(old.keys()) != sorted(new.keys()) or 'x' not in new:
+        return None
+    n_old = len(old['x'])
+    n = len(new['x'])
+    for nb_new in range(0,n+1):
+        kept = n-nb_new # Points of the old window still in the new one
+        if kept <= n_old and new['x'][:kept] == old['x'][n_old-kept:]:
+            break
+    else:
+        return None
+    points = []
+    for pos in range(kept):
+        changes = {name:new[name][pos] for name in new if new[name][pos] != old[name][n_old-kept+pos]}
+        if len(changes) > 0:
+            points.append([pos,changes])
+    return [nb_new,points]
+
+
+def to_list(values):
+    """
+    :return: JSON compatible list of dates or prices (NaN as None)
+    """
+    if isinstance(values,pd.DatetimeIndex):
+        return [str(ts.isoformat()) for ts in values]
+    values = np.asarray(values,dtype='float64')
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+class LocalFeed():
+    """
+    Local stand-in of a price feed: random walk from the last close, with a new bar every nb_ticks ticks
+    """
+    def __init__(self,data,nb_ticks=10,volatility=0.002,seed=None):
+        self.last_date = data.index[-1]
+        self.price = float(data['Close'].iloc[-1])
+        self.nb_ticks = nb_ticks
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        return
+
+    def next_tick(self):
+        """
+        :return: dict with date of the bar and last price
+        """
+        self.count = self.count+1
+        if self.count % self.nb_ticks == 0:
+            self.last_date = self.last_date+pd.offsets.BDay(1)
+        self.price = self.price*(1+self.rng.normal(0,self.volatility))
+        return {'date':self.last_date,'price':self.price}
+
+    def ticks(self,interval=1.0,limit=None):
+        """ Generator of ticks, every interval seconds """
+        nb = 0
+        while limit == None or nb < limit:
+            yield self.next_tick()
+            nb = nb+1
+            time.sleep(interval)
+        return
+
+
+class LiveView():
+    """
+    Class computing the changes of the AT.S view of 1 symbol, tick after tick
+    The view (EnvATS) is built with the same traces as the page, so trace indexes match
+    """
+    def __init__(self,env):
+        self.env = env
+        self.status = env.get_status()
+        if self.status != 1:
+            return
+        self.data = env.get_data().copy()
+        self.titles = [dict(annotation) for annotation in env.get_fig().to_plotly_json()['layout']['annotations']]
+        self.title = env.symbol+' - '+env.name+' - '
+
+        state = self.__compute()
+        # Ticks are simulated: indicators of the next ticks are kept in memory only
+        cache = IndicatorCache(persist=False)
+        if env.cache != None:
+            cache.memo = dict(env.cache.memo)
+        env.cache = cache
+        self.__save(state)
+        return
+
+    def get_status(self):
+        """ Return status class attribute for external access """
+        return self.status
+
+    def get_data(self):
+        """ Return data class attribute for external access """
+        return self.data
+
+    def update(self,tick):
+        """
+        Apply 1 tick to the data and compute the changes of the figure:
+        - delete: indexes of the traces to delete (Oggy / Jack lines which disappeared)
+        - add: new traces with their index, once deleted traces are removed
+        - extend: points of the new bars, with the index and the number of points of the trace (extendTraces)
+        - points: changed points, with the index of the trace and the position of the point (restyle)
+        - traces: traces changed on most of their points, with their index and arrays
+        - layout: changed annotations, vertical lines and title
+
+        :return: dict with the changes
+        """
+        self.__apply_tick(tick)
+        self.env.set_data(self.data)
+        traces, annotations, shapes = self.__compute()
+        delta = {'date':str(tick['date'].date()),'price':tick['price'],'delete':[],'add':[],
+                 'extend':[],'points':[],'traces':[],'layout':{}}
+
+        new_keys = set([key for key, arrays, spec in traces])
+        delta['delete'] = [index for index, key in enumerate(self.keys) if key not in new_keys]
+        for index, [key, arrays, spec] in enumerate(traces):
+            if key not in self.arrays:
+                delta['add'].append({'index':index,'trace':spec})
+            elif arrays != self.arrays[key]:
+                diff = diff_points(self.arrays[key],arrays)
+                if diff == None or 2*(diff[0]+len(diff[1])) > len(arrays['x']):
+                    delta['traces'].append({'index':index,'data':arrays})
+                    continue
+                nb_new, points = diff
+                if nb_new > 0:
+                    n = len(arrays['x'])
+                    delta['extend'].append({'index':index,'max':n,'data':{name:arrays[name][n-nb_new:] for name in arrays}})
+                for pos, changes in points:
+                    delta['points'].append({'index':index,'pos':pos,'data':changes})
+        if annotations != self.annotations:
+            delta['layout']['annotations'] = self.titles+annotations
+        if shapes != self.shapes:
+            delta['layout']['shapes'] = shapes
+            delta['layout']['title'] = self.title+delta['date']
+        self.__save([traces,annotations,shapes])
+        return delta
+
+    def __save(self,state):
+        traces, self.annotations, self.shapes = state
+        self.keys = [key for key, arrays, spec in traces]
+        self.arrays = {key:arrays for key, arrays, spec in traces}
+        return
+
+    def __apply_tick(self,tick):
+        """ Update the last bar, or add a new bar """
+        date = tick['date']
+        price = tick['price']
+        if date == self.data.index[-1]:
+            i = len(self.data)-1
+            self.data.iloc[i,self.data.columns.get_loc('High')] = max(self.data['High'].iloc[i],price)
+            self.data.iloc[i,self.data.columns.get_loc('Low')] = min(self.data['Low'].iloc[i],price)
+            self.data.iloc[i,self.data.columns.get_loc('Close')] = price
+        elif date > self.data.index[-1]:
+            bar = pd.DataFrame({'Open':[price],'High':[price],'Low':[price],'Close':[price],'Date':[date]},
+                               index=pd.DatetimeIndex([date],name='Date'))
+            self.data = pd.concat([self.data,bar[self.data.columns]])
+        return
+
+    def __compute(self):
+        """
+        Compute all traces in the order of the figure, the annotations and vertical lines
+
+        :return: [list of [key, arrays, trace] for each trace, list of annotations, list of shapes]
+        """
+        traces = []
+        annotations = []
+        shapes = []
+        env = self.env
+        for period in env.periods:
+            df = env.get_ut(period)
+            for key, trace, props in env.get_ut_traces(df,period):
+                traces.append([period+':'+key,{name:to_list(props[name]) for name in TRACE_ARRAYS if name in props},None])
+            if not env.pur: # Oggy / Jack lines, see EnvATSextraUT
+                index = df.tail(25).index
+                xref, yref = env.get_ut_axes(period)
+                for signal in env.signals[period]:
+                    if signal.kind in LINES:
+                        x = index[-min(LINES[signal.kind],index.size):]
+                        arrays = {'x':to_list(x),'y':to_list(np.full(x.size,signal.level))}
+                        spec = dict(type='scatter',mode='lines',line=dict(color=LINE_COLORS[signal.kind],width=2),
+                                    showlegend=False,xaxis=xref,yaxis=yref,**arrays)
+                        traces.append([period+':'+signal.kind,arrays,spec])
+                annotations = annotations+env.get_ut_annotations(period)
+            shapes = shapes+env.get_ut_shapes(df,period)
+        return [traces,annotations,shapes]
@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+
+"""
+File name *loadtest.py*
+
+Load tests of the web application (app.py), without calling the real providers:
+- Stub providers (Yahoo Finance, Alphavantage, Darwinex) serving generated CSV / JSON data,
+  with latency, quota errors and ETags (304 Not Modified, see http_cache.py)
+- Web application started in its own process, in a working folder seeded with the data files,
+  the providers replaced by the stubs (PYATS_URL_* environment variables, see price_data.py)
+- Driver replaying a mix of requests (hot symbols, cold symbols, Alphavantage, Darwinex, intraday)
+  with concurrent clients
+- Report: RPS, p50 / p95 / p99 latency by kind of request, duration of the stages (Server-Timing header)
+- Results appended to cache/loadtest/results.jsonl with the git revision, to compare versions
+
+Usage: python -m pyatsm.loadtest -n 200 -c 8 --latency 0.2 --quota 0.02
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, sys, json, time, random, hashlib, shutil, socket, subprocess, tempfile, threading, zlib
+import pandas as pd
+import numpy as np
+import requests
+from collections import Counter
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from pyatsm.coord import get_cache_folder
+
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIX = {'hot':0.6,'cold':0.15,'av':0.1,'dw':0.05,'intra':0.1} # Share of each kind of request
+HOT_SYMBOLS = ['MC.PA','OR.PA','AI.PA','AAPL','MSFT'] # Yahoo Finance, downloaded once then up to date
+AV_SYMBOLS = ['MC.PAR','OR.PAR','EUR-USD'] # Alphavantage
+INTRA_SYMBOLS = ['AAPL','MC.PA'] # Intraday data seeded in the working folder
+AV_QUOTA_NOTE = {'Note':'Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute and 500 calls per day.'}
+
+
+def aggregate_bars(df,interval,label='start'):
+    """
+    Weekly ('1wk') or monthly ('1mo') bars of daily bars, labelled with the start of the period (YahooFinance)
+    or with its last trading day (label='last', Alphavantage)
+    """
+    periods = df.index.to_period('W' if interval == '1wk' else 'M')
+    bars = df.groupby(periods).agg({'Open':'first','High':'max','Low':'min','Close':'last','Volume':'sum'})
+    if label == 'last':
+        bars.index = pd.DatetimeIndex(df.index.to_series().groupby(periods).max().values,name='Date')
+    else:
+        bars.index = pd.DatetimeIndex(bars.index.start_time,name='Date')
+    return bars
+
+
+def get_etag(body):
+    return '"'+hashlib.sha1(body).hexdigest()[:16]+'"'
+
+
+def get_bars(symbol,freq='D',nb_bars=2000):
+    """
+    Generated OHLCV bars of a symbol until now: random walk, the same for each call (seeded by the symbol)
+    Intraday bars (e.g. freq='5min') are within 09:30 - 16:00 on week days
+
+    :return: DataFrame indexed by Date
+    """
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    now = pd.Timestamp.now()
+    if freq == 'D':
+        dates = pd.bdate_range(end=now.normalize(),periods=nb_bars)
+    else:
+        dates = pd.date_range(end=now.floor(freq),periods=nb_bars*4,freq=freq)
+        tod = dates-dates.normalize()
+        dates = dates[(dates.dayofweek < 5) & (tod >= pd.Timedelta('09:30:00')) & (tod <= pd.Timedelta('16:00:00'))]
+        dates = dates[-nb_bars:]
+    n = len(dates)
+    close = 100*np.exp(np.cumsum(rng.normal(0,0.015,n)))
+    open_ = close*np.exp(rng.normal(0,0.005,n))
+    high = np.maximum(open_,close)*(1+np.abs(rng.normal(0,0.008,n)))
+    low = np.minimum(open_,close)*(1-np.abs(rng.normal(0,0.008,n)))
+    volume = rng.integers(100000,1000000,n)
+    return pd.DataFrame({'Open':open_.round(4),'High':high.round(4),'Low':low.round(4),'Close':close.round(4),
+                         'Volume':volume},index=pd.DatetimeIndex(dates,name='Date'))
+
+
+class StubProviders():
+    """
+    Class emulating the providers on a local HTTP server (1 thread per request):
+    - Yahoo Finance: /v7/finance/download/<symbol> (CSV, daily / weekly / monthly bars with interval)
+    - Alphavantage: /query?function=... (CSV, quota note in JSON as the real API)
+    - Darwinex: /darwininfo/2.1/products/<product>/candles... (JSON)
+
+    :param latency: mean latency of a response in seconds (uniform between 0.5 and 1.5 times)
+    :param quota: probability of a quota error
+    """
+    def __init__(self,latency=0.0,quota=0.0,seed=0,port=0):
+        self.latency = latency
+        self.quota = quota
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter() # Responses by provider and status
+        self.payloads = {} # Payloads already generated: {(provider, symbol, function): bytes}
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, content_type, body = stubs.respond(url.path,parse_qs(url.query),self.headers.get('If-None-Match'))
+                self.send_response(status)
+                self.send_header('Content-Type',content_type)
+                if status == 200:
+                    self.send_header('ETag',get_etag(body))
+                elif status == 304:
+                    self.send_header('ETag',self.headers.get('If-None-Match'))
+                self.send_header('Content-Length',str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self,*args):
+                return
+
+        self.server = ThreadingHTTPServer(('127.0.0.1',port),Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = None
+        return
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def respond(self,path,query,etag=None):
+        """
+        :param etag: ETag of the body already received by the client (If-None-Match)
+        :return: status, content type and body of the response
+        """
+        if path.startswith('/v7/finance/download/'):
+            provider = 'yf'
+        elif path == '/query':
+            provider = 'av'
+        elif path.startswith('/darwininfo/'):
+            provider = 'dw'
+        else:
+            return [404,'text/plain',b'Not Found']
+        with self.lock:
+            delay = self.latency*self.random.uniform(0.5,1.5)
+            quota = self.random.random() < self.quota
+        time.sleep(delay)
+        if quota:
+            status, content_type, body = self.__quota_error(provider)
+        elif provider == 'yf':
+            interval = query.get('interval',['1d'])[0]
+            status, content_type, body = 200, 'text/csv', self.__get_payload('yf',path.split('/')[-1],interval,self.__yf_csv)
+        elif provider == 'av':
+            status, content_type, body = self.__av_response(query)
+        else:
+            parts = path.split('/') # /darwininfo/2.1/products/<product>/candles[/<ALL or 1Y>]
+            product = parts[4] if len(parts) > 4 else ''
+            candles = parts[6] if len(parts) > 6 else 'from='+query.get('from',['0'])[0]
+            status, content_type, body = 200, 'application/json', self.__get_payload('dw',product,candles,self.__dw_json)
+        if status == 200 and etag != None and etag == get_etag(body):
+            status, body = 304, b''
+        with self.lock:
+            self.counts[provider+' '+str(status)] += 1
+        return [status,content_type,body]
+
+    def __quota_error(self,provider):
+        if provider == 'av': # Alphavantage answers 200 with a note instead of the data
+            return [200,'application/json',json.dumps(AV_QUOTA_NOTE).encode()]
+        if provider == 'dw':
+            return [429,'application/json',json.dumps({'error':'Too Many Requests'}).encode()]
+        return [429,'text/plain',b'Too Many Requests']
+
+    def __get_payload(self,provider,symbol,function,build):
+        key = (provider,symbol,function)
+        if key not in self.payloads: # Same payload for concurrent builds, no lock needed
+            self.payloads[key] = build(symbol,function)
+        return self.payloads[key]
+
+    def __yf_csv(self,symbol,interval):
+        df = get_bars(symbol)
+        if interval in ['1wk','1mo']:
+            df = aggregate_bars(df,interval)
+        df.insert(4,'Adj Close',df['Close'])
+        return df.to_csv(date_format='%Y-%m-%d').encode()
+
+    def __av_response(self,query):
+        function = query.get('function',[''])[0]
+        if 'symbol' in query:
+            symbol = query['symbol'][0]
+        else:
+            symbol = query.get('from_symbol',[''])[0]+'-'+query.get('to_symbol',[''])[0]
+        if function not in ['TIME_SERIES_DAILY_ADJUSTED','FX_DAILY','TIME_SERIES_INTRADAY','FX_INTRADAY',
+                            'TIME_SERIES_WEEKLY_ADJUSTED','FX_WEEKLY','TIME_SERIES_MONTHLY_ADJUSTED','FX_MONTHLY']:
+            return [200,'application/json',json.dumps({'Error Message':'Invalid API call.'}).encode()]
+        return [200,'text/csv',self.__get_payload('av',symbol,function,self.__av_csv)]
+
+    def __av_csv(self,symbol,function):
+        intra = function.endswith('INTRADAY')
+        df = get_bars(symbol,'5min' if intra else 'D')
+        if 'WEEKLY' in function or 'MONTHLY' in function:
+            df = aggregate_bars(df,'1wk' if 'WEEKLY' in function else '1mo',label='last')
+        df.columns = ['open','high','low','close','volume']
+        df.index.name = 'timestamp'
+        if function.endswith('_ADJUSTED'):
+            df.insert(4,'adjusted_close',df['close'])
+            df['dividend_amount'] = 0.0
+        if function == 'TIME_SERIES_DAILY_ADJUSTED':
+            df['split_coefficient'] = 1.0
+        if function.startswith('FX'):
+            df = df.drop(columns=['volume'])
+        return df.iloc[::-1].to_csv(date_format='%Y-%m-%d %H:%M:%S' if intra else '%Y-%m-%d').encode() # Last bars first
+
+    def __dw_json(self,product,candles):
+        df = get_bars(product)
+        # Timestamps of the day before (the day is shifted by 1 day in pyatsm.darwinex)
+        timestamps = (df.index-pd.Timedelta(days=1)).values.astype('datetime64[s]').astype('int64')
+        if candles.startswith('from='): # Range of the request
+            keep = timestamps >= int(candles[5:])
+        elif candles == '1Y':
+            keep = df.index >= df.index[-1]-pd.Timedelta(days=365)
+        else:
+            keep = np.ones(len(df),dtype=bool)
+        df = df[keep]
+        timestamps = timestamps[keep]
+        candles = [{'timestamp':int(ts),'candle':{'close':c,'high':h,'low':l,'open':o}}
+                   for ts, o, h, l, c in zip(timestamps,df['Open'],df['High'],df['Low'],df['Close'])]
+        return json.dumps({'candles':candles}).encode()
+
+
+class AppProcess():
+    """
+    Class running the web application in its own process, with the providers replaced by the stubs
+    The working folder is seeded with the data files of the repository and intraday data (INTRA_SYMBOLS)
+    """
+    def __init__(self,providers_url,workdir=None,port=None):
+        self.providers_url = providers_url
+        self.remove = workdir == None
+        if workdir == None:
+            workdir = tempfile.mkdtemp(prefix='pyats_loadtest_')
+        self.workdir = workdir
+        if port == None:
+            with socket.socket() as s:
+                s.bind(('127.0.0.1',0))
+                port = s.getsockname()[1]
+        self.url = 'http://127.0.0.1:%d' % port
+        self.port = port
+        self.process = None
+        self.log = None
+        return
+
+    def __seed(self):
+        data_folder = os.path.join(self.workdir,'data')
+        os.makedirs(data_folder,exist_ok=True)
+        repo_data = os.path.join(REPO_FOLDER,'data')
+        for name in os.listdir(repo_data):
+            if name.endswith('.csv'):
+                shutil.copy(os.path.join(repo_data,name),data_folder)
+        if not os.path.exists(os.path.join(data_folder,'dba_init.csv')):
+            pd.DataFrame(columns=['Date','Open','High','Low','Close']).to_csv(os.path.join(data_folder,'dba_init.csv'),index=False)
+        for symbol in INTRA_SYMBOLS:
+            get_bars(symbol,'5min').to_csv(os.path.join(data_folder,symbol+'_intra.csv'))
+        return
+
+    def start(self,timeout=60):
+        self.__seed()
+        env = dict(os.environ)
+        env['PYATS_URL_YF'] = self.providers_url
+        env['PYATS_URL_AV'] = self.providers_url
+        env['PYATS_URL_DARWINEX'] = self.providers_url
+        # price_data.py imports its siblings from ./pyatsm/ (relative to the working folder)
+        paths = [REPO_FOLDER,os.path.join(REPO_FOLDER,'pyatsm')]
+        env['PYTHONPATH'] = os.pathsep.join(paths+[env['PYTHONPATH']] if env.get('PYTHONPATH') else paths)
+        code = 'import app; app.app.run(host="127.0.0.1",port=%d,debug=False,threaded=True)' % self.port
+        self.log = open(os.path.join(self.workdir,'app.log'),'w')
+        self.process = subprocess.Popen([sys.executable,'-c',code],cwd=self.workdir,env=env,
+                                        stdout=self.log,stderr=subprocess.STDOUT)
+        end = time.time()+timeout
+        while time.time() < end:
+            if self.process.poll() != None:
+                break
+            try:
+                if requests.get(self.url+'/index',timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError('web application not started, see '+os.path.join(self.workdir,'app.log'))
+
+    def stop(self):
+        if self.process != None and self.process.poll() == None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log != None:
+            self.log.close()
+        if self.remove:
+            shutil.rmtree(self.workdir,ignore_errors=True)
+        return
+
+
+def parse_mix(text):
+    """ :return: mix of requests from 'hot=0.6,cold=0.2,...' """
+    mix = {}
+    for item in text.split(','):
+        kind, share = item.split('=')
+        if kind not in MIX:
+            raise ValueError('unknown kind of request: '+kind)
+        mix[kind] = float(share)
+    return mix
+
+
+def get_requests(nb_requests,mix=MIX,seed=0):
+    """
+    Sequence of requests, the same for a seed
+
+    :return: list of [kind, path]
+    """
+    rng = random.Random(seed)
+    kinds = list(mix.keys())
+    weights = [mix[kind] for kind in kinds]
+    reqs = []
+    for i in range(nb_requests):
+        kind = rng.choices(kinds,weights)[0]
+        if kind == 'hot':
+            path = '/ats/'+rng.choice(HOT_SYMBOLS)
+        elif kind == 'cold':
+            path = '/ats/COLD%d.PA' % i # Never requested before: download and full computation
+        elif kind == 'av':
+            path = '/ats/'+rng.choice(AV_SYMBOLS)
+        elif kind == 'dw':
+            path = '/ats/DBA'
+        else:
+            path = '/ats/'+rng.choice(INTRA_SYMBOLS)+'/history?intra=1'
+        reqs.append([kind,path])
+    return reqs
+
+
+def parse_server_timing(header):
+    """ :return: dict {stage: duration in ms} of a Server-Timing header """
+    stages = {}
+    for item in header.split(','):
+        fields = item.strip().split(';')
+        for field in fields[1:]:
+            if field.startswith('dur='):
+                stages[fields[0]] = float(field[4:])
+    return stages
+
+
+def run_load(base_url,reqs,concurrency=8,timeout=120):
+    """
+    Send the requests with concurrent clients (1 session each), in the order of the sequence
+
+    :return: list of [kind, status (-1 if no response), latency in ms, stages], duration in seconds
+    """
+    results = []
+    lock = threading.Lock()
+    position = [0]
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = position[0]
+                position[0] = i+1
+            if i >= len(reqs):
+                break
+            kind, path = reqs[i]
+            start = time.time()
+            try:
+                response = session.get(base_url+path,timeout=timeout)
+                status = response.status_code
+                stages = parse_server_timing(response.headers.get('Server-Timing',''))
+                if status == 200 and kind != 'intra': # Figure loaded by the page, as a browser
+                    response = session.get(base_url+path+'.json',timeout=timeout)
+                    status = response.status_code
+                    stages.update(parse_server_timing(response.headers.get('Server-Timing','')))
+            except requests.RequestException:
+                status = -1
+                stages = {}
+            latency = 1000*(time.time()-start)
+            with lock:
+                results.append([kind,status,latency,stages])
+        session.close()
+
+    start = time.time()
+    clients = [threading.Thread(target=client) for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return [results,time.time()-start]
+
+
+def get_percentiles(values):
+    """ :return: dict of mean, p50, p95 and p99 (ms) """
+    if len(values) == 0:
+        return {'mean':None,'p50':None,'p95':None,'p99':None}
+    p50, p95, p99 = np.percentile(values,[50,95,99])
+    return {'mean':round(float(np.mean(values)),1),'p50':round(float(p50),1),'p95':round(float(p95),1),'p99':round(float(p99),1)}
+
+
+def get_report(results,duration):
+    """
+    :return: dict with RPS, errors, latency of all requests and by kind, duration of the stages
+    """
+    report = {'requests':len(results),
+              'duration':round(duration,2),
+              'rps':round(len(results)/duration,2) if duration > 0 else None,
+              'errors':sum([1 for result in results if result[1] < 0 or result[1] >= 400]),
+              'latency':get_percentiles([result[2] for result in results]),
+              'kinds':{},
+              'stages':{},
+              }
+    for kind in sorted(set([result[0] for result in results])):
+        kind_results = [result for result in results if result[0] == kind]
+        report['kinds'][kind] = dict(get_percentiles([result[2] for result in kind_results]),requests=len(kind_results),
+                                     errors=sum([1 for result in kind_results if result[1] < 0 or result[1] >= 400]))
+    for stage in sorted(set([stage for result in results for stage in result[3]])):
+        report['stages'][stage] = get_percentiles([result[3][stage] for result in results if stage in result[3]])
+    return report
+
+
+def print_report(report):
+    print('INFO: %s requests in %s s - %s RPS - %s errors' % (report['requests'],report['duration'],report['rps'],report['errors']))
+    lat = report['latency']
+    print('INFO: latency (ms) p50 %s - p95 %s - p99 %s' % (lat['p50'],lat['p95'],lat['p99']))
+    for kind, lat in report['kinds'].items():
+        print('   %-6s %5s requests %4s errors - p50 %s - p95 %s - p99 %s' % (kind,lat['requests'],lat['errors'],lat['p50'],lat['p95'],lat['p99']))
+    for stage, lat in report['stages'].items():
+        print('   stage %-9s mean %s - p95 %s' % (stage,lat['mean'],lat['p95']))
+    return
+
+
+def get_revision():
+    """ :return: git revision of the repository, '' if not available """
+    try:
+        return subprocess.check_output(['git','rev-parse','--short','HEAD'],cwd=REPO_FOLDER,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return ''
+
+
+def save_result(report,config,path=None):
+    """ Append the result to the results file (1 JSON per line) """
+    if path == None:
+        path = get_cache_folder('loadtest')+'results.jsonl'
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    result = {'date':datetime.now().isoformat(timespec='seconds'),'revision':get_revision(),
+              'config':config,'report':report}
+    with open(path,'a') as f:
+        f.write(json.dumps(result)+'\n')
+    return path
+
+
+def print_history(path=None):
+    """ Print the results stored, to compare the versions """
+    if path == None:
+        path = get_cache_folder('loadtest')+'results.jsonl'
+    if not os.path.exists(path):
+        print('WARNING: no results in '+path)
+        return
+    print('%-19s %-9s %6s %5s %8s %8s %8s %6s' % ('date','revision','req','conc','RPS','p50','p95','errors'))
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            report = result['report']
+            print('%-19s %-9s %6s %5s %8s %8s %8s %6s' % (result['date'],result['revision'],report['requests'],
+                  result['config'].get('concurrency'),report['rps'],report['latency']['p50'],report['latency']['p95'],report['errors']))
+    return
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n",dest='requests', type=int, default=200, help="Number of requests measured")
+    parser.add_argument("-c",dest='concurrency', type=int, default=8, help="Number of concurrent clients")
+    parser.add_argument("--mix",dest='mix', help="Share of each kind of request, e.g. hot=0.6,cold=0.15,av=0.1,dw=0.05,intra=0.1")
+    parser.add_argument("--latency",dest='latency', type=float, default=0.05, help="Mean latency of the stub providers (s)")
+    parser.add_argument("--quota",dest='quota', type=float, default=0.0, help="Probability of a quota error of the stub providers")
+    parser.add_argument("--warmup",dest='warmup', type=int, default=0, help="Number of requests sent before the measure")
+    parser.add_argument("--seed",dest='seed', type=int, default=0, help="Seed of the sequence of requests")
+    parser.add_argument("--url",dest='url', help="Test a running application (with its own providers) instead of starting one")
+    parser.add_argument("--workdir",dest='workdir', help="Working folder of the application (temporary folder removed by default)")
+    parser.add_argument("--no_save",dest='no_save', action='store_true', help="Do not store the result")
+    parser.add_argument("--history",dest='history', action='store_true', help="Print the results stored and exit")
+    args = parser.parse_args()
+
+    if args.history:
+        print_history()
+        sys.exit(0)
+
+    mix = MIX if args.mix == None else parse_mix(args.mix)
+    reqs = get_requests(args.warmup+args.requests,mix,args.seed)
+    stubs = None
+    app_process = None
+    base_url = args.url
+    if base_url == None:
+        stubs = StubProviders(args.latency,args.quota,args.seed).start()
+        app_process = AppProcess(stubs.url,args.workdir).start()
+        base_url = app_process.url
+        print('INFO: application '+base_url+' in '+app_process.workdir+', stub providers '+stubs.url)
+    try:
+        if args.warmup > 0:
+            run_load(base_url,reqs[:args.warmup],args.concurrency)
+        results, duration = run_load(base_url,reqs[args.warmup:],args.concurrency)
+    finally:
+        if app_process != None:
+            app_process.stop()
+        if stubs != None:
+            stubs.stop()
+    report = get_report(results,duration)
+    print_report(report)
+    if stubs != None:
+        print('INFO: stub providers - '+', '.join([key+': '+str(n) for key, n in sorted(stubs.counts.items())]))
+    if not args.no_save:
+        config = {'requests':args.requests,'concurrency':args.concurrency,'mix':mix,'latency':args.latency,
+                  'quota':args.quota,'warmup':args.warmup,'seed':args.seed,'url':args.url}
+        print('INFO: result saved in '+save_result(report,config))
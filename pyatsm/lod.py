@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+File name *lod.py*
+
+Level of detail (LOD) pyramid of the full history of a symbol, for zoomable charts:
+- Level 0: bars of the data file, level k: OHLC of FACTOR**k consecutive bars (min / max decimation)
+- A window of dates is served at the finest level fitting in a maximum number of bars,
+  so the payload stays constant whatever the zoom
+- Rendered with WebGL traces (scattergl): high-low segments of up / down bars and close line
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+
+from pyatsm.sessions import reduce_ohlc
+
+
+FACTOR = 4 # Number of bars of a level aggregated in one bar of the next level
+MAX_BARS = 500 # Maximum number of bars sent to the browser
+PYRAMIDS = {} # Pyramids already built by this process: {key: [data, LodPyramid]}
+
+
+def get_pyramid(key,data):
+    """
+    :return: LodPyramid of the data, built again only when data changed (new object from the store)
+    """
+    if key in PYRAMIDS and PYRAMIDS[key][0] is data:
+        return PYRAMIDS[key][1]
+    pyramid = LodPyramid(data)
+    PYRAMIDS[key] = [data,pyramid]
+    return pyramid
+
+
+class LodPyramid():
+    """
+    Class building the levels of detail of OHLC bars, and serving windows of dates
+    """
+    def __init__(self,data,factor=FACTOR,max_bars=MAX_BARS):
+        self.factor = factor
+        self.max_bars = max_bars
+        # Each level: [dates (first bar of the group), open, high, low, close]
+        level = [data.index.values.astype('datetime64[ns]'),data['Open'].values,data['High'].values,
+                 data['Low'].values,data['Close'].values]
+        self.levels = [level]
+        while len(level[0]) > max_bars:
+            starts = np.arange(0,len(level[0]),factor)
+            level = [level[0][starts]]+reduce_ohlc(level[1],level[2],level[3],level[4],starts)
+            self.levels.append(level)
+        return
+
+    def get_range(self):
+        """ :return: first and last dates of the history """
+        dates = self.levels[0][0]
+        return [pd.Timestamp(dates[0]),pd.Timestamp(dates[-1])]
+
+    def get_window(self,start=None,end=None,max_bars=None):
+        """
+        Bars between start and end, at the finest level with at most max_bars bars
+        One bar before and after the window are added, for a continuous chart when panning
+
+        :return: level, DataFrame OHLC indexed by Date
+        """
+        if max_bars == None:
+            max_bars = self.max_bars
+        first, last = self.get_range()
+        start = first if start == None else pd.Timestamp(start)
+        end = last if end == None else pd.Timestamp(end)
+        for k, level in enumerate(self.levels):
+            i_start = max(0,np.searchsorted(level[0],start.to_datetime64(),side='left')-1)
+            i_end = min(len(level[0]),np.searchsorted(level[0],end.to_datetime64(),side='right')+1)
+            if i_end-i_start <= max_bars or k == len(self.levels)-1:
+                break
+        df = pd.DataFrame({'Open':level[1][i_start:i_end],'High':level[2][i_start:i_end],
+                           'Low':level[3][i_start:i_end],'Close':level[4][i_start:i_end]},
+                          index=pd.DatetimeIndex(level[0][i_start:i_end],name='Date'))
+        return [k,df]
+
+
+def get_traces(df):
+    """
+    Arrays of the WebGL traces of a window: high-low segments of up bars, of down bars, close line
+
+    :return: list of dict with x and y arrays (JSON compatible)
+    """
+    dates = np.array([ts.isoformat() for ts in df.index],dtype=object)
+    traces = []
+    for bars in [df['Close'].values >= df['Open'].values,df['Close'].values < df['Open'].values]:
+        n = int(bars.sum())
+        x = np.full(3*n,None,dtype=object)
+        y = np.full(3*n,None,dtype=object)
+        x[0::3] = dates[bars]
+        x[1::3] = dates[bars]
+        y[0::3] = df['Low'].values[bars].tolist()
+        y[1::3] = df['High'].values[bars].tolist()
+        traces.append({'x':x.tolist(),'y':y.tolist()})
+    traces.append({'x':dates.tolist(),'y':df['Close'].values.tolist()})
+    return traces
+
+
+def get_figure(title,df):
+    """
+    :return: Plotly figure of a window of the history, with WebGL traces (order of get_traces)
+    """
+    fig = go.Figure()
+    for trace, color in zip(get_traces(df),['green','red','black']):
+        fig.add_trace(go.Scattergl(x=trace['x'],y=trace['y'],mode='lines',line=dict(color=color,width=1),
+                                   showlegend=False,hoverinfo='x+y'))
+    fig.update_layout(title=title,height=800,width=1200,xaxis=dict(type='date'),dragmode='zoom')
+    return fig
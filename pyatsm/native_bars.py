@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+File name *native_bars.py*
+
+Weekly and monthly bars of the providers (YahooFinance 1wk / 1mo, Alphavantage weekly / monthly),
+used for the higher UTs instead of resampling the daily bars:
+- Data files next to the daily data: <symbol>_weekly.csv and <symbol>_monthly.csv
+- Bars labelled as the resampled ones (end of the week / month), whatever the provider
+  (start of the period for YahooFinance, last trading day for Alphavantage)
+- Q, 2Q and Y aggregated from the monthly bars (a few hundred bars for 25 years)
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import os
+import pandas as pd
+
+try:
+    from pyatsm.schema import read_prices, PRICE_COLS
+    from pyatsm.sessions import resample_ohlc
+except ImportError: # Run as a script from pyatsm/ (e.g. price_data.py)
+    from schema import read_prices, PRICE_COLS
+    from sessions import resample_ohlc
+
+
+INTERVAL_SUFFIXES = {'1d':'','1wk':'_weekly','1mo':'_monthly'} # Data file of each interval: <symbol><suffix>.csv
+NATIVE_INTERVALS = {'W':'1wk','1M':'1mo'} # Interval of the providers for each UT
+NATIVE_PERIODS = ['W','1M','Q','2Q','Y'] # UTs available from the native bars (no daily data)
+NATIVE_DISTANCES = [0.5,1,1,1,5]
+
+
+def relabel(data,period):
+    """
+    :return: bars labelled with the end of their week ('W') or month ('1M'), as EnvATS.get_ut
+    """
+    freq = 'W' if period == 'W' else 'M'
+    df = data.copy()
+    df.index = pd.DatetimeIndex(df.index.to_period(freq).end_time.normalize(),name='Date')
+    return df[~df.index.duplicated(keep='last')]
+
+
+class NativeBars():
+    """
+    Class giving the higher UTs of a symbol from the weekly and monthly bars of its provider
+    """
+    def __init__(self,weekly_file,monthly_file):
+        self.status = 0
+        self.uts = {} # Bars of each UT, with Date column
+        self.last_date = None # Last date of the provider
+        if not os.path.exists(weekly_file) or not os.path.exists(monthly_file):
+            return
+        weekly = read_prices(weekly_file)[PRICE_COLS]
+        monthly = read_prices(monthly_file)[PRICE_COLS]
+        if len(weekly) == 0 or len(monthly) == 0:
+            return
+        self.last_date = max(weekly.index[-1],monthly.index[-1])
+        self.uts['W'] = relabel(weekly,'W')
+        self.uts['1M'] = relabel(monthly,'1M')
+        for period in ['Q','2Q','Y']:
+            self.uts[period] = resample_ohlc(self.uts['1M'],period)
+        for period in self.uts:
+            self.uts[period]['Date'] = self.uts[period].index
+        self.status = 1
+        return
+
+    def get_status(self):
+        return self.status
+
+    def covers(self,last_date,period):
+        """
+        :return: True if the bars of the UT include the daily bar of last_date (file not older than the daily data)
+        """
+        if period not in self.uts:
+            return False
+        freq = 'W' if period == 'W' else 'M'
+        return self.uts[period].index[-1] >= pd.Timestamp(last_date).to_period(freq).end_time.normalize()
+
+    def get_ut(self,period):
+        return self.uts[period]
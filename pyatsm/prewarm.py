@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+"""
+File name *prewarm.py*
+
+Prewarm of the data and AT.S views after the close of the exchanges:
+- Closing time of each exchange session (see pyatsm.sessions), in UTC
+- Popularity of the symbols, from the requests of the web application
+- Cache of the figures of the views in JSON, valid while the data file does not change
+- Scheduler warming the symbols of a watchlist after each close, most requested first,
+  with a clock that can be simulated (LocalClock) for tests
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import os, re, time, hashlib
+import pandas as pd
+from collections import Counter
+
+from pyatsm.sessions import get_exchange, get_last_close, get_next_close, PUBLISH_DELAY
+from pyatsm.coord import FileLock, atomic_write_text, get_cache_folder
+from pyatsm.native_bars import INTERVAL_SUFFIXES
+from pyatsm.darwinex import SEED_FILES
+
+
+PREWARM_DELAY = PUBLISH_DELAY # Views prewarmed once the providers published the last bar
+REQUESTS_MAX_SIZE = 1024*1024 # Size of the log of requests before compaction
+
+
+### Clocks
+class Clock():
+    """
+    Class giving the current time in UTC (system clock)
+    """
+    def now(self):
+        return pd.Timestamp.now(tz='UTC')
+
+    def sleep(self,seconds):
+        time.sleep(max(0,seconds))
+        return
+
+
+class LocalClock(Clock):
+    """
+    Class simulating the clock from a start date: sleep moves the time forward without waiting
+    """
+    def __init__(self,start):
+        self.time = pd.Timestamp(start)
+        if self.time.tzinfo == None:
+            self.time = self.time.tz_localize('UTC')
+        return
+
+    def now(self):
+        return self.time
+
+    def sleep(self,seconds):
+        self.time = self.time+pd.Timedelta(seconds=max(0,seconds))
+        return
+
+
+### Popularity of the symbols
+def record_request(symbol,folder=None):
+    """
+    Count a request of the symbol: 1 line appended to the log, shared by the workers of the web application
+    Appended under the lock of compact_requests: no line lost between its read and its rewrite
+    """
+    if folder == None:
+        folder = get_cache_folder('prewarm')
+    os.makedirs(folder,exist_ok=True)
+    path = folder+'requests.log'
+    try:
+        with FileLock('prewarm_requests'):
+            with open(path,'a') as f:
+                f.write(symbol+'\t1\n')
+            if os.path.getsize(path) > REQUESTS_MAX_SIZE:
+                compact_requests(folder)
+    except OSError as e:
+        print('WARNING: request not recorded - '+str(e))
+    return
+
+
+def get_popularity(folder=None):
+    """
+    :return: Counter of the requests of each symbol
+    """
+    if folder == None:
+        folder = get_cache_folder('prewarm')
+    counts = Counter()
+    try:
+        with open(folder+'requests.log') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 2 and fields[1].isdigit():
+                    counts[fields[0]] += int(fields[1])
+    except OSError:
+        pass
+    return counts
+
+
+def compact_requests(folder=None):
+    """ Replace the log of requests by 1 line per symbol, under FileLock('prewarm_requests') (see record_request) """
+    if folder == None:
+        folder = get_cache_folder('prewarm')
+    counts = get_popularity(folder)
+    atomic_write_text(folder+'requests.log',''.join([symbol+'\t'+str(n)+'\n' for symbol, n in counts.items()]))
+    return counts
+
+
+### Watchlist
+def read_watchlist(file=None,data_folder="./data/"):
+    """
+    Read the watchlist: 1 symbol per line, optionally followed by its name (SYMBOL,name), # for comments
+    Without file, symbols of the daily data files of the data folder
+    (not the intraday / weekly / monthly bars of the symbols, nor the seed files of the downloaders)
+
+    :return: list of [symbol, name]
+    """
+    if file == None:
+        if not os.path.exists(data_folder):
+            return []
+        suffixes = ['_intra.csv']+[suffix+'.csv' for suffix in INTERVAL_SUFFIXES.values() if suffix != '']
+        seeds = list(SEED_FILES.values())
+        symbols = [name[:-4] for name in sorted(os.listdir(data_folder))
+                   if name.endswith('.csv') and not name.endswith(tuple(suffixes)) and name not in seeds]
+        return [[symbol,''] for symbol in symbols]
+    watchlist = []
+    with open(file) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            fields = [field.strip() for field in line.split(',',1)]
+            watchlist.append([fields[0],fields[1] if len(fields) > 1 else ''])
+    return watchlist
+
+
+### Cache of the views
+class ViewCache():
+    """
+    Class managing the figures of the AT.S views in JSON, 1 file per symbol
+    A figure is valid while the data file does not change (modification time and size in the file name)
+    The name of the symbol is not in the key: the prewarm and the web requests share the same figure
+    """
+    def __init__(self,cache_folder=None):
+        if cache_folder == None:
+            cache_folder = get_cache_folder('views')
+        self.cache_folder = cache_folder
+        return
+
+    def __get_prefix(self,symbol):
+        return re.sub(r'[^\w.-]','_',symbol)+'_'
+
+    def __get_path(self,symbol,data_file):
+        try:
+            st = os.stat(data_file)
+        except OSError:
+            return None
+        key = repr((symbol,st.st_mtime_ns,st.st_size))
+        return self.cache_folder+self.__get_prefix(symbol)+hashlib.sha1(key.encode()).hexdigest()[:12]+'.json'
+
+    def load(self,symbol,data_file):
+        """ :return: figure in JSON, None if not in cache or the data file changed """
+        path = self.__get_path(symbol,data_file)
+        if path == None:
+            return None
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save(self,symbol,data_file,graph):
+        """ Save the figure in JSON, and remove the figures of the previous data """
+        path = self.__get_path(symbol,data_file)
+        if path == None:
+            return
+        try:
+            atomic_write_text(path,graph)
+        except OSError as e:
+            print('WARNING: view not cached - '+str(e))
+            return
+        pattern = re.compile(re.escape(self.__get_prefix(symbol))+r'[0-9a-f]{12}\.json$')
+        for file in os.listdir(self.cache_folder):
+            if pattern.match(file) and self.cache_folder+file != path:
+                try:
+                    os.remove(self.cache_folder+file)
+                except OSError:
+                    continue # Already removed by another worker
+        return
+
+
+### Scheduler
+class PrewarmScheduler():
+    """
+    Class warming the symbols of a watchlist after each close of their exchange
+
+    :param warm: function(symbol, name) refreshing the data and the views of 1 symbol
+    """
+    def __init__(self,watchlist,warm,clock=None,delay=PREWARM_DELAY):
+        self.watchlist = watchlist
+        self.warm = warm
+        self.clock = clock if clock != None else Clock()
+        self.delay = delay
+        self.done = {} # Last close warmed for each exchange
+        self.exchanges = {} # Symbols of each exchange: {exchange: list of [symbol, name]}
+        for symbol, name in watchlist:
+            self.exchanges.setdefault(get_exchange(symbol),[]).append([symbol,name])
+        return
+
+    def get_due(self):
+        """
+        :return: dict {exchange: last close} of the exchanges closed since they were last warmed
+        (all exchanges at start, so the caches are warm for the last session)
+        """
+        now = self.clock.now()-self.delay
+        due = {}
+        for exchange in self.exchanges:
+            close = get_last_close(exchange,now)
+            if close != None and self.done.get(exchange) != close:
+                due[exchange] = close
+        return due
+
+    def run_pending(self):
+        """
+        Warm the symbols of the exchanges closed, most requested first
+
+        :return: list of the symbols warmed
+        """
+        due = self.get_due()
+        if len(due) == 0:
+            return []
+        popularity = get_popularity()
+        symbols = [item for exchange in due for item in self.exchanges[exchange]]
+        symbols = sorted(symbols,key=lambda item: -popularity[item[0]]) # Stable: watchlist order for ties
+        warmed = []
+        for symbol, name in symbols:
+            try:
+                self.warm(symbol,name)
+                warmed.append(symbol)
+            except Exception as e: # Next symbols are still warmed
+                print('WARNING: prewarm failed for '+symbol+' - '+repr(e))
+        self.done.update(due)
+        return warmed
+
+    def get_next_run(self):
+        """
+        :return: time of the next prewarm (UTC): next close of the exchanges, plus the delay
+        """
+        now = self.clock.now()-self.delay
+        closes = [get_next_close(exchange,now) for exchange in self.exchanges]
+        closes = [close for close in closes if close != None]
+        if len(closes) == 0:
+            return None
+        return min(closes)+self.delay
+
+    def run(self,until=None):
+        """
+        Warm the symbols after each close, until the date (forever by default)
+        """
+        if until != None:
+            until = pd.Timestamp(until)
+            if until.tzinfo == None:
+                until = until.tz_localize('UTC')
+        while True:
+            warmed = self.run_pending()
+            if len(warmed) > 0:
+                print('INFO: prewarm of '+', '.join(warmed)+' at '+str(self.clock.now()))
+            next_run = self.get_next_run()
+            if next_run == None or (until != None and next_run > until):
+                break
+            self.clock.sleep((next_run-self.clock.now()).total_seconds())
+        return
@@ -24,26 +24,39 @@ KEY_DARWINEX = ""
 ##############################################################################
 ### IMPORT SECTION
 ##############################################################################
-import argparse, os, time,datetime
+import argparse, os, io, time,datetime
 import pandas as pd
 from datetime import date, datetime, timedelta
 import sys
 # caution: path[0] is reserved for script path (or '' in REPL)
 sys.path.insert(1, './pyatsm/')
 from taindic import TAindicators
+from coord import atomic_to_csv
+from schema import read_last_date
+from sessions import get_exchange
+from http_cache import HTTP_CACHE, get_expiry
+from native_bars import INTERVAL_SUFFIXES
+from darwinex import DarwinexFeed
 #from cnopy.taindic import TAindicators
 
-#for Darwinex
-import requests
-import json
-from pandas import json_normalize
-
 
 
 ##############################################################################
 ### GLOBAL VARIABLES AND FUNCTIONS
 ##############################################################################
 START_TIME = time.time() # for performance tracking
+# Base URLs of the providers, can be replaced by local stubs (e.g. load tests, see loadtest.py)
+URL_YF = os.environ.get('PYATS_URL_YF','https://query1.finance.yahoo.com')
+URL_AV = os.environ.get('PYATS_URL_AV','https://www.alphavantage.co')
+URL_DARWINEX = os.environ.get('PYATS_URL_DARWINEX','https://api.darwinex.com')
+# Alphavantage functions of each interval (stocks, forex) and their columns
+AV_FUNCTIONS = {'1d':['TIME_SERIES_DAILY_ADJUSTED','FX_DAILY'],
+                '1wk':['TIME_SERIES_WEEKLY_ADJUSTED','FX_WEEKLY'],
+                '1mo':['TIME_SERIES_MONTHLY_ADJUSTED','FX_MONTHLY']}
+AV_COLUMNS = {'1d':["Date","Open","High","Low","Close","AdjustedClose","Volume","Dividend","Split"],
+              '1wk':["Date","Open","High","Low","Close","AdjustedClose","Volume","Dividend"],
+              '1mo':["Date","Open","High","Low","Close","AdjustedClose","Volume","Dividend"]}
+
 def print_duration():
     """      
     :return: Time duration of the script execution, to be printed
@@ -55,24 +68,45 @@ def print_duration():
         string_dur = " --- %s seconds ---" % (round(dur,2))
     return string_dur
 
+def get_periods(years=25):
+    """
+    :return: start and end timestamps (str) of the history requested to the providers,
+    rounded to the day so the same request is cached during the day (see http_cache.py)
+    """
+    presentDate = datetime.combine(date.today()+timedelta(days=1),datetime.min.time())
+    period2=str(int(datetime.timestamp(presentDate)))
+    period1=str(int(datetime.timestamp(presentDate-timedelta(days=years*365+30))))
+    return [period1,period2]
+
+def is_fresh_file(data_file,exchange='US'):
+    """
+    :return: True if the file was written after the last close of the exchange (bars of the current week / month)
+    """
+    fetched = pd.Timestamp(os.path.getmtime(data_file),unit='s',tz='UTC')
+    return pd.Timestamp.now(tz='UTC') < get_expiry(fetched,exchange)
+
+def is_csv(body):
+    """ :return: False for the errors answered in JSON instead of CSV (e.g. Alphavantage quota) """
+    return not body.lstrip().startswith(b'{')
+
 
 class StockYFdata():
     """
     Class which extract Yahoo Finance data for one stock
     """
-    def __init__(self,ticker, daily=True):
+    def __init__(self,ticker, daily=True, interval=None):
         self.ticker = ticker
         self.riskfree_rate = 0
         self.daily = daily
+        if interval == None:
+            interval = '1d' if daily else '1mo'
+        self.interval = interval # 1d, 1wk or 1mo
 
         data_folder = "./data/"
         CURRENT_PATH=os.getcwd()
         if CURRENT_PATH.find('pyatsm')>0:
             data_folder = "../data/"
-        if daily==True:
-            self.yf_path = data_folder+self.ticker+'.csv'
-        else:
-            self.yf_path = data_folder+self.ticker+"_monthly.csv"
+        self.yf_path = data_folder+self.ticker+INTERVAL_SUFFIXES[interval]+'.csv'
         return
         
     def __test_history_file(self):
@@ -83,6 +117,8 @@ class StockYFdata():
         """
         status = -1
         data_file = self.yf_path
+        if os.path.exists(data_file) and self.interval != '1d':
+            return 0 if is_fresh_file(data_file,get_exchange(self.ticker)) else -1
         if os.path.exists(data_file):
             data = pd.read_csv(data_file,index_col='Date',parse_dates=['Date'])
             data['Date'] = data.index
@@ -107,9 +143,7 @@ class StockYFdata():
         """
         yf_path = self.yf_path
         year_current, month = time.strftime("%Y,%m").split(',')
-        presentDate = datetime.today()
-        period2=str(int(datetime.timestamp(presentDate)))
-        period1=str(int(datetime.timestamp(presentDate-timedelta(days=25*365+30))))
+        period1, period2 = get_periods()
         
         if daily==True:
             url="https://finance.yahoo.com/quote/"+self.ticker+"/history?period1="+period1+"&period2="+period2+"&interval=1d&filter=history&frequency=1d&includeAdjustedClose=true"
@@ -118,11 +152,11 @@ class StockYFdata():
      
         #Download 
         if self.__test_history_file() < 0:
-            query_string = "https://query1.finance.yahoo.com/v7/finance/download/"+self.ticker+"?period1="+period1+"&period2="+period2+"&interval=1d&events=history&includeAdjustedClose=true"
+            query_string = URL_YF+"/v7/finance/download/"+self.ticker+"?period1="+period1+"&period2="+period2+"&interval="+self.interval+"&events=history&includeAdjustedClose=true"
             #print(query_string)
-            df=pd.read_csv(query_string)
+            df=pd.read_csv(io.BytesIO(HTTP_CACHE.get(query_string,exchange=get_exchange(self.ticker))))
             df.set_index("Date")
-            df.to_csv(self.yf_path,index=False)
+            atomic_to_csv(df,self.yf_path,index=False)
             print("Downloading "+str(len(df))+" data for "+self.ticker+" in file "+self.yf_path+print_duration())
             print('Waiting period (s): '+str(wait))
             time.sleep(wait)
@@ -141,16 +175,17 @@ class AlphaVantageData():
     """
     Class which extract Alphavantage.co data for one stock
     """
-    def __init__(self,ticker,intra=False):
+    def __init__(self,ticker,intra=False,interval='1d'):
         self.key_av = KEY_AV
         self.ticker = ticker
+        self.interval = interval # 1d, 1wk or 1mo (not intraday)
 
         data_folder = "./data/"
         CURRENT_PATH=os.getcwd()
         if CURRENT_PATH.find('pyatsm')>0:
             data_folder = "../data/"
         if intra==False:
-            self.av_path = data_folder+self.ticker+'.csv'
+            self.av_path = data_folder+self.ticker+INTERVAL_SUFFIXES[interval]+'.csv'
         else:           
             self.av_path = data_folder+self.ticker+'_intra.csv'
         return
@@ -163,11 +198,13 @@ class AlphaVantageData():
         """
         status = -1
         data_file = self.av_path
+        if os.path.exists(data_file) and self.interval != '1d':
+            return 0 if is_fresh_file(data_file,get_exchange(self.ticker)) else -1
         if os.path.exists(data_file):
-            data = pd.read_csv(data_file,index_col='Date',parse_dates=['Date'])
-            data['Date'] = data.index
-            self.data = data.copy()
-            last_date = data.tail(1).index.item()
+            # Last date only, read from the end of the file (intraday histories can be too large to be loaded)
+            last_date = read_last_date(data_file)
+            if last_date == None:
+                return status
             last_date = last_date.date()
             presentDate = date.today()
             if (presentDate-last_date).days <2:
@@ -183,7 +220,7 @@ class AlphaVantageData():
     
     def av_daily_download(self,wait=0):
         """
-        Download Alphavantage data from Symbol
+        Download Alphavantage data from Symbol (daily, or weekly / monthly bars with interval)
         """
         
         if self.__test_history_file() == 0:
@@ -193,19 +230,19 @@ class AlphaVantageData():
         symbol = self.ticker
         symbol_query = 'symbol='+symbol
         #function_query='TIME_SERIES_DAILY' => became premium
-        function_query='TIME_SERIES_DAILY_ADJUSTED'
+        function_query=AV_FUNCTIONS[self.interval][0]
         #new_cols = ["Date","Open","High","Low","Close","Volume"]
-        new_cols = ["Date","Open","High","Low","Close","AdjustedClose","Volume","Dividend","Split"]
+        new_cols = AV_COLUMNS[self.interval]
         if symbol.find('-')>0:
             symbol_query='from_symbol='+symbol.split('-')[0]+'&to_symbol='+symbol.split('-')[1]
-            function_query='FX_DAILY'
+            function_query=AV_FUNCTIONS[self.interval][1]
             new_cols = ["Date","Open","High","Low","Close"]
        
-        url = 'https://www.alphavantage.co/query?function='+function_query+'&'+symbol_query+'&outputsize=full&apikey='+self.key_av
+        url = URL_AV+'/query?function='+function_query+'&'+symbol_query+'&outputsize=full&apikey='+self.key_av
         url_csv = url+'&datatype=csv'
         #print(url_csv)
         try:
-            df=pd.read_csv(url_csv)
+            df=pd.read_csv(io.BytesIO(HTTP_CACHE.get(url_csv,exchange=get_exchange(symbol),valid=is_csv)))
             #print(df.head(10))
         except:
             print("ERROR: issue with download for: "+self.ticker)
@@ -221,7 +258,7 @@ class AlphaVantageData():
        
         #print(df)
         df.set_index("Date")
-        df.to_csv(self.av_path,index=False)
+        atomic_to_csv(df,self.av_path,index=False)
         print("Downloading "+str(len(df))+" data for "+self.ticker+" in file "+self.av_path+print_duration())
         if wait>0:
             print('Waiting period (s): '+str(wait))
@@ -247,15 +284,15 @@ class AlphaVantageData():
             function_query='FX_INTRADAY'
             new_cols = ["Date","Open","High","Low","Close"]
             
-        url = 'https://www.alphavantage.co/query?function='+function_query+'&'+symbol_query+'&interval=5min&outputsize=full&apikey='+self.key_av
+        url = URL_AV+'/query?function='+function_query+'&'+symbol_query+'&interval=5min&outputsize=full&apikey='+self.key_av
         url_csv = url+'&datatype=csv'
         
-        df=pd.read_csv(url_csv)
+        df=pd.read_csv(io.BytesIO(HTTP_CACHE.get(url_csv,exchange=get_exchange(symbol),intra=True,valid=is_csv)))
         #print(df)
         df.columns = new_cols
         df = df.sort_values(by="Date")
         df.set_index("Date")
-        df.to_csv(self.av_path,index=False)
+        atomic_to_csv(df,self.av_path,index=False)
         print("Downloading "+str(len(df))+" data for "+self.ticker+" in file "+self.av_path)
         return
 
@@ -278,90 +315,27 @@ class Darwinex():
         if CURRENT_PATH.find('pyatsm')>0:
             self.dba_folder = "../data/"
             #print(self.dba_folder)
+        self.feed = DarwinexFeed(HTTP_CACHE,self.token,self.dba_folder,url=URL_DARWINEX)
         return
     
     def download_dba(self,product="DBA"):
-        
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": "Bearer "+self.token,
-            #'authorization': self.token,
-        }
-        
-        year_current, month = time.strftime("%Y,%m").split(',')
-        presentDate = datetime.today()
-        period2=str(int(datetime.timestamp(presentDate)))
-        period1=str(int(datetime.timestamp(presentDate-timedelta(days=25*365+30))))
-        url = f'https://api.darwinex.com/darwininfo/2.1/products/{product}/candles?resolution=1d&from='+period1+'&to='+period2
-        #url = f'https://api.darwinex.com/darwininfo/2.1/products/{product}/candles/ALL?resolution=1d'
-        print(url)
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        #print(data)
-        #if 'Invalid Credentials' in data.values():
-        #    print('WARNING: Invalid Credentials')
-        df = pd.DataFrame(data['candles'])
-        values = json_normalize(df['candle'])
-        values['timestamp'] = df['timestamp']
-        #values['Date'] = pd.to_datetime(values['timestamp'], unit='s').dt.date
-        values['Date'] = pd.to_datetime(values['timestamp'], unit='s')
-        values['DateNew'] = (values['Date']+ pd.Timedelta('1 day')).dt.date
-        values = values.drop(columns=['timestamp','Date'],axis=1)
-        values.columns = ['Close','High','Low','Open','Date']
-        values = values[["Date","Open","High","Low","Close"]]
-        values = values.iloc[1:, :]
-        
-        
-        dba_init = pd.read_csv(self.dba_folder+"dba_init.csv", delimiter=',', on_bad_lines='skip')
-        if product=="DBA":
-            values = dba_init.append(values,ignore_index=True)
-        
-        values.set_index("Date")
-        values.to_csv(self.dba_folder+product.lower()+'.csv',index=False)
-        
+        """ Candles of the product: seed history (dba_init.csv and range of the API) once, then the new candles only """
+        self.feed.refresh(product)
         return
 
     def download_jtl(self,product="JTL"):
-        
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": "Bearer "+self.token,
-            #'authorization': self.token,
-        }
-        dfs = []
-        # Collect data for ALL and 1Y
-        for dur in ['ALL','1Y']:
-            url = f'https://api.darwinex.com/darwininfo/2.1/products/{product}/candles/{dur}?resolution=1d'
-            print(url)
-            response = requests.get(url, headers=headers)
-            data = response.json()
-            #Convert Json into Dataframe
-            df = pd.DataFrame(data['candles'])
-            values = json_normalize(df['candle'])
-            values['timestamp'] = df['timestamp']
-            values['Date'] = pd.to_datetime(values['timestamp'], unit='s')
-            values['DateNew'] = (values['Date']+ pd.Timedelta('1 day')).dt.date
-            values = values.drop(columns=['timestamp','Date'],axis=1)
-            values.columns = ['Close','High','Low','Open','Date']
-            values = values[["Date","Open","High","Low","Close"]]
-            values = values.iloc[1:, :]
-
-            values.set_index("Date")
-            values.to_csv(self.dba_folder+product+'_'+dur+'.csv',index=False)
-            dfs.append(values)
-
-        #Concatenate Dataframes to create 1 csv file only, removing duplicates
-        df = pd.concat(dfs)
-        df = df.sort_values(by="Date",ascending=True)
-        df = df.drop_duplicates(subset='Date', keep="last")
-        df.set_index("Date")
-        df.to_csv(self.dba_folder+product.lower()+'.csv',index=False) # save into a csv file
-
+        """ Candles of the product: seed history (ALL and 1Y candle sets) once, then the new candles only """
+        self.feed.refresh(product)
         return 0
 
+    def download_products(self,products):
+        """
+        Refresh several products in 1 batch, on the same pooled session
+
+        :return: dict {product: number of candles added, None if failed}
+        """
+        return self.feed.refresh_all(products)
+
 
 
 
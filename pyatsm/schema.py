@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+File name *schema.py*
+
+Unified schema of price data, whatever the source (YahooFinance, Alphavantage, Darwinex):
+- OHLCV columns in float64, indexed by a sorted and unique DatetimeIndex 'Date'
+- Split / dividend adjustment, vectorized on the whole history
+- Merge of several sources of the same instrument, with precedence rules
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os
+import pandas as pd
+import numpy as np
+
+
+PRICE_COLS = ['Open','High','Low','Close']
+SCHEMA_COLS = PRICE_COLS+['Volume']
+# Columns of the sources, renamed into the schema (or used for adjustment)
+COLUMN_ALIASES = {'open':'Open','high':'High','low':'Low','close':'Close','volume':'Volume',
+                  'Adj Close':'AdjClose','AdjustedClose':'AdjClose',
+                  'dividend':'Dividend','split':'Split','date':'Date','timestamp':'Date'}
+
+
+def get_adjust_factors(close,dividend=None,split=None):
+    """
+    Backward adjustment factors: prices of a bar are multiplied by the events after it
+    - Split s (e.g. 2.0 for 2:1) on its date: prices before divided by s
+    - Dividend d on its ex-date: prices before multiplied by 1-d/previous close
+
+    :return: factors of the prices (numpy array), and of the volumes (splits only)
+    """
+    n = len(close)
+    event = np.ones(n)
+    event_split = np.ones(n)
+    if split is not None:
+        split = np.where(np.isnan(split) | (split <= 0),1.0,split)
+        event_split = 1/split
+        event = event*event_split
+    if dividend is not None and n > 1:
+        prev_close = np.append(np.nan,close[:-1])
+        ratio = 1-np.nan_to_num(dividend)/prev_close
+        event = event*np.where(np.isnan(ratio) | (ratio <= 0),1.0,ratio)
+    # Product of the events strictly after each bar
+    factors = np.append(np.cumprod(event[::-1])[::-1][1:],1.0)
+    volume_factors = np.append(np.cumprod(event_split[::-1])[::-1][1:],1.0)
+    return [factors,1/volume_factors]
+
+
+def normalize(data,adjust=False):
+    """
+    Normalize price data of any source into the schema
+
+    :param data: DataFrame read from the source (Date as column or index)
+    :param adjust: True to adjust prices for splits and dividends (Split / Dividend columns,
+                   or Adj Close ratio when only the adjusted close is available)
+    :return: DataFrame with SCHEMA_COLS in float64 (Volume NaN if not available), indexed by Date
+    """
+    df = data.rename(columns=COLUMN_ALIASES)
+    if 'Date' in df.columns:
+        df = df.set_index('Date')
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index),name='Date')
+
+    values = {}
+    for col in SCHEMA_COLS+['AdjClose','Dividend','Split']:
+        if col in df.columns:
+            values[col] = pd.to_numeric(df[col],errors='coerce').values.astype('float64')
+        else:
+            values[col] = np.full(len(df),np.nan)
+    prices = np.column_stack([values[col] for col in SCHEMA_COLS])
+
+    # Sorted dates, last bar kept for duplicates, bars without any price dropped
+    index = df.index.values
+    order = np.argsort(index,kind='stable')
+    index = index[order]
+    keep = np.append(index[1:] != index[:-1],True) & ~np.isnan(prices[order,:4]).all(axis=1)
+    order = order[keep]
+    index = index[keep]
+    prices = prices[order]
+
+    if adjust and len(prices) > 0:
+        if 'Split' in df.columns or 'Dividend' in df.columns:
+            split = values['Split'][order] if 'Split' in df.columns else None
+            dividend = values['Dividend'][order] if 'Dividend' in df.columns else None
+            factors, volume_factors = get_adjust_factors(prices[:,3],dividend,split)
+        elif 'AdjClose' in df.columns:
+            factors = values['AdjClose'][order]/prices[:,3]
+            factors = np.where(np.isfinite(factors),factors,1.0)
+            volume_factors = np.ones(len(prices))
+        else:
+            factors = volume_factors = np.ones(len(prices))
+        prices[:,:4] = prices[:,:4]*factors[:,None]
+        prices[:,4] = prices[:,4]*volume_factors
+
+    return pd.DataFrame(prices,index=pd.DatetimeIndex(index,name='Date'),columns=SCHEMA_COLS)
+
+
+def read_prices(data_file,adjust=False):
+    """
+    :return: DataFrame of the CSV file, normalized into the schema
+    """
+    return normalize(pd.read_csv(data_file),adjust=adjust)
+
+
+def read_last_date(data_file,block=4096):
+    """
+    Last date of a CSV file (dates in the first column, sorted), read from the end of the file
+
+    :return: Timestamp, None if the file has no data row
+    """
+    with open(data_file,'rb') as f:
+        f.seek(0,os.SEEK_END)
+        end = f.tell()
+        start = end
+        lines = []
+        while start > 0 and len(lines) < 3:
+            start = max(0,start-block)
+            f.seek(start)
+            lines = f.read(end-start).splitlines()
+        for line in reversed(lines[1:] if start > 0 else lines):
+            field = line.split(b',')[0].strip().decode(errors='ignore')
+            if field == '':
+                continue
+            try:
+                return pd.Timestamp(field)
+            except ValueError:
+                continue # Header or empty line
+    return None
+
+
+def merge_sources(frames,precedence=None):
+    """
+    Merge several sources of the same instrument, aligned on the union of their dates
+    Each bar comes from the first source (in precedence order) having a Close for that date,
+    Volume comes from the first source having a Volume
+
+    :param frames: dict {source: normalized DataFrame}
+    :param precedence: list of sources, first one wins (default: order of frames)
+    :return: normalized DataFrame
+    """
+    if precedence == None:
+        precedence = list(frames.keys())
+    sources = [frames[source] for source in precedence if source in frames]
+    if len(sources) == 0:
+        return pd.DataFrame(columns=SCHEMA_COLS,index=pd.DatetimeIndex([],name='Date'),dtype='float64')
+    index = sources[0].index
+    for df in sources[1:]:
+        index = index.union(df.index)
+    # Array (sources, dates, columns) of all sources aligned on the same dates
+    stack = np.stack([df[SCHEMA_COLS].reindex(index).values for df in sources])
+    dates = np.arange(len(index))
+
+    valid = ~np.isnan(stack[:,:,3])
+    first = np.argmax(valid,axis=0)
+    merged = stack[first,dates,:]
+    valid_volume = ~np.isnan(stack[:,:,4])
+    merged[:,4] = stack[np.argmax(valid_volume,axis=0),dates,4]
+
+    keep = valid.any(axis=0)
+    return pd.DataFrame(merged[keep],index=index[keep],columns=SCHEMA_COLS)
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f",dest='files', nargs='+', help="CSV files of the same instrument, by order of precedence")
+    parser.add_argument("-o",dest='output', help="Save the normalized (merged) data in a CSV file")
+    parser.add_argument("--adjust",dest='adjust', action='store_true', help="Adjust prices for splits and dividends")
+    args = parser.parse_args()
+
+    if args.files != None:
+        frames = {data_file:read_prices(data_file,adjust=args.adjust) for data_file in args.files}
+        data = merge_sources(frames)
+        print(data.tail(10))
+        if args.output != None:
+            data.to_csv(args.output)
+            print('INFO: '+str(len(data))+' bars saved in '+args.output)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""
+File name *sessions.py*
+
+Exchange sessions, used to aggregate intraday data:
+- Opening / closing time of each exchange (PAR, BRU, AMS, BSE, US, FX)
+- Aggregation of intraday bars within the sessions only (no empty overnight buckets)
+- Closing times of the exchanges (prewarm of the views, freshness of the provider responses)
+- Aggregation of daily bars in weeks, months, quarters, years: buckets found by searchsorted
+  on labels shared by the symbols of the same dates, same result as resample(closed='right', label='right')
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import threading
+import pandas as pd
+import numpy as np
+from pandas.tseries.frequencies import to_offset
+
+
+# Regular session of each exchange, in local time of the exchange (time of the intraday data)
+EXCHANGES = pd.DataFrame({
+    'Exchange':['PAR','BRU','AMS','BSE','US','FX'],
+    'Open':['09:00','09:00','09:00','09:15','09:30','00:00'],
+    'Close':['17:30','17:30','17:30','15:30','16:00','24:00'],
+    'TimeZone':['Europe/Paris','Europe/Brussels','Europe/Amsterdam','Asia/Kolkata','America/New_York','UTC'],
+    }).set_index('Exchange')
+
+# Yahoo Finance suffixes of the exchanges
+YF_SUFFIXES = {'PA':'PAR','BR':'BRU','AS':'AMS','BO':'BSE','NS':'BSE'}
+
+PUBLISH_DELAY = pd.Timedelta(minutes=30) # After the close, time for the providers to publish the last bar
+LOGIC = {'Open':'first','High':'max','Low':'min','Close':'last'} # Aggregation of the bars of a bucket
+PERIOD_LABELS = {} # Labels of the buckets: {(period, first day, last day): labels}, shared by the symbols
+PERIOD_LABELS_LOCK = threading.Lock()
+MAX_PERIOD_LABELS = 1000
+
+
+def get_exchange(symbol):
+    """
+    :return: Exchange of the symbol (PAR, BRU, AMS, BSE, US or FX)
+    """
+    if symbol.find('-') > 0:
+        return 'FX'
+    if symbol.find('.') > 0:
+        suffix = symbol.split('.')[1]
+        if suffix in EXCHANGES.index:
+            return suffix
+        if suffix in YF_SUFFIXES:
+            return YF_SUFFIXES[suffix]
+    return 'US'
+
+
+def get_session(exchange):
+    """
+    :return: Opening and closing time of the exchange, as Timedelta since midnight
+    """
+    if exchange not in EXCHANGES.index:
+        exchange = 'US'
+    open_time = pd.Timedelta(EXCHANGES['Open'].loc[exchange]+':00')
+    close_hour, close_min = EXCHANGES['Close'].loc[exchange].split(':')
+    close_time = pd.Timedelta(hours=int(close_hour),minutes=int(close_min))
+    return [open_time,close_time]
+
+
+def reduce_ohlc(open_, high, low, close, starts):
+    """
+    Aggregate bars in OHLC buckets, in one pass
+
+    :param starts: positions of the first bar of each bucket (sorted)
+    :return: open, high, low and close arrays of the buckets
+    """
+    ends = np.append(starts[1:],len(close))-1
+    return [open_[starts],
+            np.maximum.reduceat(high,starts),
+            np.minimum.reduceat(low,starts),
+            close[ends]]
+
+
+def get_session_labels(index, period, exchange='US'):
+    """
+    Bucket of each intraday bar, within the sessions of the exchange
+    The label of a bar only depends on its own date, so bars can be labelled chunk by chunk
+
+    :param index: dates of the bars (datetime64 array)
+    :param period: '15min', '1H' etc... or 'D' for one bucket per session
+    :return: mask of the bars in the session, and labels (start of the bucket) of these bars
+    """
+    open_time, close_time = get_session(exchange)
+    index = index.astype('datetime64[ns]')
+    days = index.astype('datetime64[D]').astype('datetime64[ns]')
+    tod = index-days
+    keep = (tod >= open_time.to_timedelta64()) & (tod <= close_time.to_timedelta64())
+    days = days[keep]
+    tod = tod[keep]
+
+    if period == 'D':
+        return [keep,days]
+    freq = pd.Timedelta(period).to_timedelta64()
+    open_td = open_time.to_timedelta64()
+    nb_buckets = max(1,int(np.ceil((close_time-open_time)/pd.Timedelta(period))))
+    bucket = (tod-open_td)//freq
+    bucket = np.minimum(bucket,nb_buckets-1) # The closing bar belongs to the last bucket
+    return [keep,days+open_td+bucket*freq]
+
+
+def aggregate_labels(data, labels):
+    """
+    Aggregate consecutive bars with the same label in OHLC buckets
+
+    :return: DataFrame of the aggregated bars, labelled with the start of the bucket
+    """
+    if len(labels) == 0:
+        return pd.DataFrame(columns=['Open','High','Low','Close','Date'],index=pd.DatetimeIndex([],name='Date'))
+    starts = np.flatnonzero(np.append(True,labels[1:] != labels[:-1]))
+    o, h, l, c = reduce_ohlc(data['Open'].values,data['High'].values,data['Low'].values,data['Close'].values,starts)
+    df = pd.DataFrame({'Open':o,'High':h,'Low':l,'Close':c},index=pd.DatetimeIndex(labels[starts],name='Date'))
+    df['Date'] = df.index
+    return df
+
+
+def aggregate_session(data, period, exchange='US'):
+    """
+    Aggregate intraday bars into the period, within the sessions of the exchange only
+    Buckets start at the opening of the session, bars out of the session are dropped
+    and there is no empty bucket (nights, week-ends, holidays)
+
+    :param data: DataFrame of intraday bars (Open, High, Low, Close), with a DatetimeIndex
+    :param period: '15min', '1H' etc... or 'D' for one bucket per session
+    :return: DataFrame of the aggregated bars, labelled with the start of the bucket
+    """
+    keep, labels = get_session_labels(data.index.values,period,exchange)
+    if not keep.all():
+        data = data[keep]
+    return aggregate_labels(data,labels)
+
+
+def get_close(exchange,day):
+    """
+    :return: Closing time of the session of the exchange on the day (UTC), None on week-ends
+    """
+    day = pd.Timestamp(day).normalize()
+    if day.dayofweek >= 5: # No holiday calendar
+        return None
+    if exchange not in EXCHANGES.index:
+        exchange = 'US'
+    close = (day+get_session(exchange)[1]).tz_localize(EXCHANGES['TimeZone'].loc[exchange])
+    return close.tz_convert('UTC')
+
+
+def get_last_close(exchange,now):
+    """
+    :return: Last closing time of the exchange before now (UTC)
+    """
+    if exchange not in EXCHANGES.index:
+        exchange = 'US'
+    local_day = now.tz_convert(EXCHANGES['TimeZone'].loc[exchange]).tz_localize(None).normalize()
+    for i in range(8):
+        close = get_close(exchange,local_day-pd.Timedelta(days=i))
+        if close != None and close <= now:
+            return close
+    return None
+
+
+def get_next_close(exchange,now):
+    """
+    :return: Next closing time of the exchange after now (UTC)
+    """
+    if exchange not in EXCHANGES.index:
+        exchange = 'US'
+    local_day = now.tz_convert(EXCHANGES['TimeZone'].loc[exchange]).tz_localize(None).normalize()
+    for i in range(8):
+        close = get_close(exchange,local_day+pd.Timedelta(days=i))
+        if close != None and close > now:
+            return close
+    return None
+
+
+def get_period_labels(first, last, period):
+    """
+    Labels of the buckets of the period covering the dates, as resample(closed='right', label='right'):
+    end of each bucket (e.g. Sunday of the week, last day of the month)
+
+    :param period: 'W', '1M', 'Q', '2Q', 'Y' etc... (the first date sets the buckets of multiples, e.g. 2Q)
+    :return: datetime64 array of the labels
+    """
+    first = pd.Timestamp(first).normalize()
+    last = pd.Timestamp(last).normalize()
+    key = (period,first,last)
+    with PERIOD_LABELS_LOCK:
+        if key in PERIOD_LABELS:
+            return PERIOD_LABELS[key]
+    offset = to_offset(period)
+    # Same range as resample: from 1 period before the first date to 1 period after the last one
+    labels = pd.date_range(first-offset,last+offset,freq=offset).values.astype('datetime64[ns]')[1:]
+    with PERIOD_LABELS_LOCK:
+        if len(PERIOD_LABELS) >= MAX_PERIOD_LABELS:
+            PERIOD_LABELS.clear()
+        PERIOD_LABELS[key] = labels
+    return labels
+
+
+def resample_ohlc(data, period):
+    """
+    Aggregate daily bars into the period, identical to resample(period, closed='right', label='right').apply(LOGIC):
+    bucket of each bar by searchsorted on the labels, OHLC of all the buckets in one pass (reduce_ohlc),
+    empty buckets between 2 bars are NaN
+
+    :param data: DataFrame of bars (Open, High, Low, Close), with a sorted DatetimeIndex
+    :return: DataFrame OHLC of the buckets, labelled with the end of the bucket
+    """
+    cols = list(LOGIC.keys())
+    prices = data[cols].values
+    if len(data) == 0 or data.index.tz != None or np.isnan(prices).any():
+        # NaN prices are skipped by resample (first / last valid value)
+        return data[cols].resample(period,convention='end',closed='right',label='right').apply(LOGIC)
+    dates = data.index.values.astype('datetime64[ns]')
+    labels = get_period_labels(dates[0],dates[-1],period)
+    # Buckets (previous label, label], until the end of the label day (as resample for periods of days or more)
+    edges = labels+(np.timedelta64(1,'D')-np.timedelta64(1,'ns'))
+    bucket = np.searchsorted(edges,dates,side='left')
+    starts = np.flatnonzero(np.append(True,bucket[1:] != bucket[:-1]))
+    o, h, l, c = reduce_ohlc(prices[:,0],prices[:,1],prices[:,2],prices[:,3],starts)
+    ohlc = np.full((bucket[-1]+1,4),np.nan)
+    ohlc[bucket[starts]] = np.column_stack([o,h,l,c])
+    return pd.DataFrame(ohlc,columns=cols,index=pd.DatetimeIndex(labels[:len(ohlc)],name=data.index.name))
+
+
+def get_rangebreaks(exchange='US',intraday=True):
+    """
+    :return: Plotly rangebreaks hiding the periods without session
+    """
+    rangebreaks = [dict(bounds=["sat", "mon"])]
+    if intraday and exchange != 'FX':
+        open_time, close_time = get_session(exchange)
+        rangebreaks.append(dict(bounds=[close_time/pd.Timedelta('1H'),open_time/pd.Timedelta('1H')],pattern="hour"))
+    return rangebreaks
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""
+File name *signal_index.py*
+
+Index of the indicators of all symbols, for cross-symbol screens ("who is near support right now"):
+- 1 row per symbol and UT: last close, distances (%) to M7, M20, Bollinger bands and PSAR, trend flags
+- Stored in SQLite (standard library), with indexes on the UT, trend and distances,
+  so range queries answer in milliseconds on tens of thousands of rows
+- Refreshed incrementally: symbols whose data file did not change are skipped,
+  and UTs whose bars did not change are not computed again
+
+Usage: python -m pyatsm.signal_index --screen m20 -p W -d 0.5 --trend up
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, time, sqlite3
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from pyatsm.coord import get_cache_folder
+from pyatsm.alerts import get_changed_uts, get_changed_view
+
+
+# Columns of the index, besides symbol and timeframe
+# dist_low: % from the Low to M (support), dist_high: % from M to the High (resistance), trend: 1 up, -1 down
+# boll_dist_u / boll_dist_l: % of the Close from the upper / lower band, psar_dist: % of the Close from the SAR
+INDEX_COLS = ['date','close',
+              'm7','m7_dist_low','m7_dist_high','m7_trend',
+              'm20','m20_dist_low','m20_dist_high','m20_trend',
+              'boll_u','boll_l','boll_dist_u','boll_dist_l','boll_trend_u','boll_trend_l',
+              'psar','psar_dist','psar_trend']
+# Distance and trend columns of each screen: {indicator: {side: [distance, trend]}}
+SCREENS = {'m7':{'low':['m7_dist_low','m7_trend'],'high':['m7_dist_high','m7_trend']},
+           'm20':{'low':['m20_dist_low','m20_trend'],'high':['m20_dist_high','m20_trend']},
+           'boll':{'low':['boll_dist_l','boll_trend_l'],'high':['boll_dist_u','boll_trend_u']},
+           'psar':{'low':['psar_dist','psar_trend'],'high':['psar_dist','psar_trend']}}
+
+
+def get_index_file():
+    """
+    :return: SQLite file of the index, consistent with the data folder
+    """
+    return get_cache_folder('index')+"signals.db"
+
+
+def last_value(df,col):
+    """ :return: last value of a column as float, None if not available """
+    if df is None or col not in df.columns or len(df) == 0:
+        return None
+    value = df[col].values[-1]
+    if value is None or (isinstance(value,float) and np.isnan(value)):
+        return None
+    return float(value)
+
+
+def get_row(data,ind):
+    """
+    Row of the index for 1 UT, from its bars and indicators (see EnvATS.get_indicators)
+
+    :return: dict of INDEX_COLS
+    """
+    close = float(data['Close'].values[-1])
+    m7, m20, boll, psar = ind['m7'], ind['m20'], ind['boll'], ind.get('psar')
+    row = {'date':str(data.index[-1]),'close':close}
+    for name, sma in [['m7',m7],['m20',m20]]:
+        row[name] = last_value(sma,'sma')
+        row[name+'_dist_low'] = last_value(sma,'distLow')
+        row[name+'_dist_high'] = last_value(sma,'distHigh')
+        row[name+'_trend'] = last_value(sma,'tendance')
+    row['boll_u'] = last_value(boll,'U')
+    row['boll_l'] = last_value(boll,'L')
+    row['boll_dist_u'] = None if not row['boll_u'] else 100*(close/row['boll_u']-1)
+    row['boll_dist_l'] = None if not row['boll_l'] else 100*(close/row['boll_l']-1)
+    row['boll_trend_u'] = last_value(boll,'tendance')
+    row['boll_trend_l'] = last_value(boll,'tendanceL')
+    row['psar'] = last_value(psar,'psar')
+    row['psar_dist'] = last_value(psar,'distPSAR')
+    row['psar_trend'] = last_value(psar,'tendance')
+    return row
+
+
+class SignalIndex():
+    """
+    Class managing the index of the indicators of all symbols, in SQLite
+    Connections are opened for each operation (threads of the web application, several processes)
+
+    :param get_env: function(symbol, intra) returning the EnvATS of the symbol, for on_event (no figure needed)
+    """
+    def __init__(self,path=None,get_env=None):
+        if path == None:
+            path = get_index_file()
+        self.path = path
+        self.get_env = get_env
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with self.__connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL') # Readers are not blocked by the refresh
+            conn.execute('CREATE TABLE IF NOT EXISTS signals (symbol TEXT, timeframe TEXT, '
+                         +', '.join([col+(' TEXT' if col == 'date' else ' REAL') for col in INDEX_COLS])
+                         +', hash TEXT, updated REAL, PRIMARY KEY (symbol, timeframe))')
+            conn.execute('CREATE TABLE IF NOT EXISTS files (symbol TEXT PRIMARY KEY, mtime INTEGER, size INTEGER)')
+            # Screens of 1 UT use the first index, screens of all UTs the second one (distance range only)
+            for dist, trend in set([tuple(cols) for indicator in SCREENS for cols in SCREENS[indicator].values()]):
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_'+dist+' ON signals (timeframe, '+trend+', '+dist+')')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_'+dist+'_all ON signals ('+dist+')')
+        return
+
+    @contextmanager
+    def __connect(self):
+        """ Connection in a transaction (committed at the end), then closed """
+        conn = sqlite3.connect(self.path,timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def update(self,symbol,env):
+        """
+        Refresh the rows of the symbol, only for the UTs whose bars changed
+
+        :param env: EnvATS of the symbol
+        :return: list of the UTs refreshed
+        """
+        return self.__update(symbol,env,get_changed_uts(env,self.__get_hashes(symbol).get))
+
+    def __get_hashes(self,symbol):
+        """ :return: dict {UT: hash of the bars indexed} of the symbol """
+        with self.__connect() as conn:
+            return dict(conn.execute('SELECT timeframe, hash FROM signals WHERE symbol = ?',(symbol,)).fetchall())
+
+    def __update(self,symbol,env,changed):
+        """ Store the rows of the changed UTs (see pyatsm.alerts.get_changed_uts) """
+        rows = []
+        for period, data, digest in changed:
+            row = get_row(data,env.get_indicators(data,period))
+            rows.append([symbol,period]+[row[col] for col in INDEX_COLS]+[digest,time.time()])
+        if len(rows) > 0:
+            with self.__connect() as conn:
+                conn.executemany('INSERT OR REPLACE INTO signals VALUES ('+', '.join(['?']*(len(INDEX_COLS)+4))+')',rows)
+        return [row[1] for row in rows]
+
+    def on_event(self,event):
+        """
+        Refresh the symbol of a DataEvent (see pyatsm.alerts), when its data file changed
+
+        :return: list of the UTs refreshed
+        """
+        if event.intra: # Index of the daily UTs only
+            return []
+        with self.__connect() as conn:
+            known = conn.execute('SELECT mtime, size FROM files WHERE symbol = ?',(event.symbol,)).fetchone()
+        view = get_changed_view(event,None if known == None else [known['mtime'],known['size']],
+                                self.get_env,self.__get_hashes(event.symbol).get)
+        if view == None:
+            return []
+        fp, env, changed = view
+        periods = self.__update(event.symbol,env,changed)
+        with self.__connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)',[event.symbol]+fp)
+        return periods
+
+    def subscribe(self,bus):
+        bus.subscribe(self.on_event)
+        return self
+
+    def remove(self,symbol):
+        with self.__connect() as conn:
+            conn.execute('DELETE FROM signals WHERE symbol = ?',(symbol,))
+            conn.execute('DELETE FROM files WHERE symbol = ?',(symbol,))
+        return
+
+    def screen(self,indicator='m20',timeframe=None,max_dist=0.5,trend=None,side='low',limit=None):
+        """
+        Symbols near an indicator, e.g. within 0.5% of an up-trending weekly M20:
+        screen('m20','W',0.5,'up')
+
+        :param side: 'low' for supports (distance from the Low, or Close under the lower band),
+                     'high' for resistances
+        :param trend: 'up', 'down' or None
+        :return: list of dict (symbol, timeframe and INDEX_COLS), nearest first
+        """
+        if trend not in [None,'up','down']:
+            raise ValueError('unknown trend: '+str(trend))
+        dist, trend_col = SCREENS[indicator][side]
+        where = [dist+' BETWEEN ? AND ?']
+        params = [-max_dist,max_dist]
+        if timeframe != None:
+            where.append('timeframe = ?')
+            params.append(timeframe)
+        if trend != None:
+            where.append(trend_col+' = ?')
+            params.append(1 if trend == 'up' else -1)
+        query = 'SELECT * FROM signals WHERE '+' AND '.join(where)+' ORDER BY abs('+dist+')'
+        if limit != None:
+            query = query+' LIMIT '+str(int(limit))
+        with self.__connect() as conn:
+            return [dict(row) for row in conn.execute(query,params).fetchall()]
+
+    def get_rows(self,symbol):
+        """ :return: rows of the symbol (1 per UT) """
+        with self.__connect() as conn:
+            return [dict(row) for row in conn.execute('SELECT * FROM signals WHERE symbol = ?',(symbol,)).fetchall()]
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screen",dest='indicator', choices=list(SCREENS.keys()), help="Symbols near the indicator (m7, m20, boll, psar)")
+    parser.add_argument("-p",dest='timeframe', help="UT of the screen (D, W, 1M, Q, 2Q, Y), all by default")
+    parser.add_argument("-d",dest='max_dist', type=float, default=0.5, help="Maximum distance (%%)")
+    parser.add_argument("--trend",dest='trend', choices=['up','down'], help="Trend of the indicator")
+    parser.add_argument("--side",dest='side', choices=['low','high'], default='low', help="low: supports, high: resistances")
+    parser.add_argument("--symbol",dest='symbol', help="Print the rows of a symbol")
+    args = parser.parse_args()
+
+    index = SignalIndex()
+    if args.symbol != None:
+        print(pd.DataFrame(index.get_rows(args.symbol)).to_string())
+    elif args.indicator != None:
+        start = time.time()
+        rows = index.screen(args.indicator,args.timeframe,args.max_dist,args.trend,args.side)
+        print(pd.DataFrame(rows,columns=['symbol','timeframe']+INDEX_COLS).to_string())
+        print('INFO: %s symbols in %s ms' % (len(rows),round(1000*(time.time()-start),1)))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+File name *signals.py*
+
+AT.S signals of one UT (Timeframe in French), evaluated on the last bar:
+- Supports / resistances on M7 and M20
+- Support on Parabolic SAR
+- Last close in between Oggy (close 8 periods ago) or Jack (close 21 periods ago)
+
+Signals are records, independent of the Plotly figure which only renders them
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+from collections import namedtuple
+
+
+# kind: M7_SUP, M7_RES, M20_SUP, M20_RES, PSAR_SUP, OGGY, OGGY_1, JACK, JACK_1
+# level: price of the support / resistance / line, distance: in % from the last bar
+Signal = namedtuple('Signal',['kind','timeframe','level','distance','date'])
+
+SUPPORTS = ['M7_SUP','M20_SUP','PSAR_SUP']
+RESISTANCES = ['M7_RES','M20_RES']
+LINES = {'OGGY':8,'OGGY_1':7,'JACK':21,'JACK_1':20} # Number of periods of the line, until the last bar
+LABELS = {'M7_SUP':'M7 support','M7_RES':'M7 resistance','M20_SUP':'M support','M20_RES':'M resistance','PSAR_SUP':'P support',
+          'OGGY':'Oggy','OGGY_1':'Oggy+1','JACK':'Jack','JACK_1':'Jack+1'}
+
+
+def last_value(df,col):
+    """ Return the last value of a column, in O(1) """
+    return df[col].values[-1]
+
+
+class SignalEngine():
+    """
+    Class evaluating the AT.S signals of one UT, from the indicators already computed
+    """
+    def __init__(self,timeframe,distance):
+        self.timeframe = timeframe
+        self.distance = distance # Maximum distance (%) to report a support / resistance
+        return
+
+    def evaluate(self,data,m7=None,m20=None,psar=None):
+        """
+        Evaluate all signals on the last bar
+
+        :param data: DataFrame OHLC of the UT
+        :param m7, m20: DataFrames returned by TAindicators.get_sma
+        :param psar: DataFrame returned by TAindicators.get_psar (None if not available)
+        :return: list of Signal
+        """
+        signals = []
+        if len(data) == 0:
+            return signals
+        for name, sma in [['M7',m7],['M20',m20]]:
+            if sma is not None:
+                signals = signals+self.__eval_sma(name,sma)
+        if psar is not None:
+            signals = signals+self.__eval_psar(psar)
+        signals = signals+self.__eval_lines(data['Close'].values,data.index)
+        return signals
+
+    def __eval_sma(self,name,sma):
+        """ Support when SMA is going up and near the Low, resistance when going down and near the High """
+        signals = []
+        level = last_value(sma,'sma')
+        date = sma['Date'].iloc[-1]
+        dist_low = last_value(sma,'distLow')
+        dist_high = last_value(sma,'distHigh')
+        if last_value(sma,'up')>0 and abs(dist_low)<self.distance:
+            signals.append(Signal(name+'_SUP',self.timeframe,level,dist_low,date))
+        if last_value(sma,'dn')>0 and abs(dist_high)<self.distance:
+            signals.append(Signal(name+'_RES',self.timeframe,level,dist_high,date))
+        return signals
+
+    def __eval_psar(self,psar):
+        """ Support when the SAR (of previous period) is bullish and near the Close """
+        signals = []
+        level = last_value(psar,'psarbull-1')
+        dist = last_value(psar,'distPSAR')
+        if level>0 and abs(dist)<self.distance:
+            signals.append(Signal('PSAR_SUP',self.timeframe,level,dist,psar.index[-1]))
+        return signals
+
+    def __eval_lines(self,close,dates):
+        """ Oggy and Jack lines, when the last close is in between O and O+1 (or J and J+1) """
+        signals = []
+        last = close[-1]
+        for kind, kind_1 in [['OGGY','OGGY_1'],['JACK','JACK_1']]:
+            i = -min(LINES[kind],len(close))
+            i_1 = -min(LINES[kind_1],len(close))
+            level = close[i]
+            level_1 = close[i_1]
+            if min(level,level_1) < last < max(level,level_1):
+                signals.append(Signal(kind,self.timeframe,level,100*(last/level-1),dates[i]))
+                signals.append(Signal(kind_1,self.timeframe,level_1,100*(last/level_1-1),dates[i_1]))
+        return signals
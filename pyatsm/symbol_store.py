@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+File name *symbol_store.py*
+
+Memory-mapped store of price data, shared by all the Flask workers:
+- The CSV file of a symbol is parsed once, by the first worker reading it (or by this script)
+- Dates and prices are published as numpy files, mapped read-only by every worker
+- Each publication is a new version, the CURRENT pointer is swapped atomically
+  when a fresh download changes the CSV file
+
+"""
+
+__author__ = "Fabrice F."
+__copyright__ = "Copyright 2023, PyAT.S Project"
+__credits__ = ["Fabrice F.","TBC Eric, AT.S Association etc..."]
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Fabrice F."
+__email__ = ""
+__status__ = "Development"
+
+
+import argparse, os, json, shutil, tempfile, hashlib, threading
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+try:
+    from pyatsm.coord import FileLock, atomic_write_text, get_cache_folder
+    from pyatsm.schema import read_prices, PRICE_COLS
+except ImportError: # Run as a script from pyatsm/
+    from coord import FileLock, atomic_write_text, get_cache_folder
+    from schema import read_prices, PRICE_COLS
+
+
+STORE_COLS = PRICE_COLS
+MAPPED_MAX = 64 # Symbols kept mapped by the process
+# Symbols mapped by this process, least recently used first: {key: [version, DataFrame]}
+# An evicted mapping (and its file descriptor) is released with the last DataFrame using it
+MAPPED = OrderedDict()
+MAPPED_LOCK = threading.Lock()
+
+
+class SymbolStore():
+    """
+    Class publishing and mapping price data of symbols, without parsing the CSV files again
+    """
+    def __init__(self,store_folder=None,columns=STORE_COLS):
+        if store_folder == None:
+            store_folder = get_cache_folder('store')
+        self.store_folder = store_folder
+        self.columns = columns
+        return
+
+    def load(self,symbol,data_file):
+        """
+        Return price data of the symbol, mapped from the store
+        The data is published first if the CSV file changed since the last publication
+
+        :return: DataFrame (read-only prices) indexed by Date, with a Date column, None if data file does not exist
+        """
+        version = self.__get_version(data_file)
+        if version == None:
+            return None
+        key = self.__get_key(symbol,data_file)
+        with MAPPED_LOCK:
+            if key in MAPPED and MAPPED[key][0] == version:
+                MAPPED.move_to_end(key)
+                return MAPPED[key][1]
+
+        if self.__get_current(key) != version:
+            self.publish(symbol,data_file,version)
+        data = self.__map(key,version)
+        if data is None: # Version removed by a more recent publication, read again
+            self.publish(symbol,data_file,version)
+            data = self.__map(key,version)
+        with MAPPED_LOCK:
+            MAPPED[key] = [version,data]
+            MAPPED.move_to_end(key)
+            while len(MAPPED) > MAPPED_MAX:
+                MAPPED.popitem(last=False)
+        return data
+
+    def publish(self,symbol,data_file,version=None):
+        """
+        Parse the CSV file and publish its arrays as a new version, then swap the CURRENT pointer
+        """
+        if version == None:
+            version = self.__get_version(data_file)
+        key = self.__get_key(symbol,data_file)
+        key_folder = self.store_folder+key+"/"
+        os.makedirs(key_folder,exist_ok=True)
+
+        with FileLock('store_'+key): # One worker parses the CSV file, the others wait and map it
+            if self.__get_current(key) == version and os.path.exists(key_folder+version):
+                return version
+            if not os.path.exists(key_folder+version):
+                data = read_prices(data_file) # Normalized: sorted dates, float64 prices
+                columns = [col for col in self.columns if col in data.columns]
+                tmp_folder = tempfile.mkdtemp(dir=key_folder,prefix='.tmp')
+                np.save(tmp_folder+"/dates.npy",data.index.values.astype('datetime64[ns]'))
+                np.save(tmp_folder+"/prices.npy",np.ascontiguousarray(data[columns].values,dtype='float64'))
+                with open(tmp_folder+"/meta.json",'w') as f:
+                    json.dump({'symbol':symbol,'data_file':data_file,'columns':columns},f)
+                os.rename(tmp_folder,key_folder+version)
+
+            atomic_write_text(key_folder+"CURRENT",version)
+            self.__remove_old_versions(key_folder,version)
+        return version
+
+    def __map(self,key,version):
+        """ Map the arrays of one version, without copy """
+        folder = self.store_folder+key+"/"+version+"/"
+        try:
+            with open(folder+"meta.json") as f:
+                meta = json.load(f)
+            dates = np.load(folder+"dates.npy",mmap_mode='r')
+            prices = np.load(folder+"prices.npy",mmap_mode='r')
+        except (OSError,ValueError):
+            return None
+        index = pd.DatetimeIndex(dates,name='Date')
+        data = pd.DataFrame(prices,index=index,columns=meta['columns'],copy=False)
+        data['Date'] = data.index
+        return data
+
+    def __get_version(self,data_file):
+        """ Version of the CSV file: modification time and size """
+        try:
+            st = os.stat(data_file)
+        except OSError:
+            return None
+        return "v"+str(st.st_mtime_ns)+"-"+str(st.st_size)
+
+    def __get_key(self,symbol,data_file):
+        if symbol != "":
+            return symbol
+        return hashlib.sha1(os.path.abspath(data_file).encode()).hexdigest()
+
+    def __get_current(self,key):
+        try:
+            with open(self.store_folder+key+"/CURRENT") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def __remove_old_versions(self,key_folder,version):
+        """ Keep the current version and the previous one (still mapped by some workers) """
+        versions = [name for name in os.listdir(key_folder) if name.startswith('v') and name != version]
+        versions = sorted(versions,key=lambda name: os.path.getmtime(key_folder+name))
+        for name in versions[:-1]:
+            shutil.rmtree(key_folder+name,ignore_errors=True)
+        return
+
+
+##############################################################################
+### Main section
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t",dest='ticker', nargs='+', help="Publish data of the tickers in the store")
+    args = parser.parse_args()
+
+    store = SymbolStore()
+    data_folder = "./data/"
+    if os.getcwd().find('pyatsm')>0:
+        data_folder = "../data/"
+    for ticker in args.ticker or []:
+        print('Publishing '+ticker+' - '+str(store.publish(ticker,data_folder+ticker+'.csv')))
@@ -8,6 +8,7 @@ Main class to retrieve Technical Analysis Indicators:
 - Bollinger
 - SAR
 - etc...
+- IndicatorGraph: indicators as nodes of a graph, shared intermediates computed once
 
 """
 
@@ -23,6 +24,30 @@ __status__ = "Development"
 
 import pandas as pd
 import numpy as np
+from collections import namedtuple
+
+
+def shift(values,k):
+    """ Shift an array by k positions (NaN filled), like pandas shift """
+    out = np.full(len(values),np.nan)
+    if k > 0 and k < len(values):
+        out[k:] = values[:-k]
+    elif k < 0 and -k < len(values):
+        out[:k] = values[-k:]
+    return out
+
+
+def get_trend_segments(values,tendance,tendance_prev,tendance_next):
+    """
+    Split values in segments going up / down, and reversal points (vectorized)
+
+    :return: up, dn, upRev, dnRev arrays (NaN out of the segment)
+    """
+    up = ((tendance==1) & (tendance_prev==1)) | ((tendance==1) & (tendance_next==1))
+    dn = ((tendance==-1) & (tendance_prev==-1)) | ((tendance==-1) & (tendance_next==-1))
+    up_rev = ((tendance==-1) & (tendance_next==1)) | ((tendance==1) & (tendance_prev==-1))
+    dn_rev = ((tendance==1) & (tendance_next==-1)) | ((tendance==-1) & (tendance_prev==1))
+    return [np.where(up,values,np.nan),np.where(dn,values,np.nan),np.where(up_rev,values,np.nan),np.where(dn_rev,values,np.nan)]
 
 
 class TAindicators():
@@ -47,68 +72,14 @@ class TAindicators():
         """ 
         Return data linked with Simple Moving Average, with given period 
         """
-        sma = self.data.copy()
-        # Generate the moving average data
-        sma['sma'] = self.data['Close'].rolling(window=period).mean()
-        # Check if the SMA is increasing or decreasing
-        sma['sma-1'] = sma['sma'].shift(1)
-        #sma = sma.tail(30)
-        #print(sma)
-
-        sma['tendance'] = [1 if sma.loc[ei,'sma']> sma.loc[ei,'sma-1'] else -1 for ei in sma.index]
-        sma['tendance+1'] = sma['tendance'].shift(-1)
-        sma['tendance-1'] = sma['tendance'].shift(1)
-        #sma['up'] = [sma.loc[ei,'sma'] if sma.loc[ei,'sma']> sma.loc[ei,'sma-1'] else np.nan for ei in sma.index]
-        #sma['dn'] = [sma.loc[ei,'sma'] if sma.loc[ei,'sma']< sma.loc[ei,'sma-1'] else np.nan for ei in sma.index]
-        sma['up'] = [sma.loc[ei,'sma'] if (sma.loc[ei,'tendance']==1 and sma.loc[ei,'tendance-1']==1) or (sma.loc[ei,'tendance']==1 and sma.loc[ei,'tendance+1']==1) else np.nan for ei in sma.index]
-        sma['dn'] = [sma.loc[ei,'sma'] if (sma.loc[ei,'tendance']==-1 and sma.loc[ei,'tendance-1']==-1) or (sma.loc[ei,'tendance']==-1 and sma.loc[ei,'tendance+1']==-1) else np.nan for ei in sma.index]
-        sma['upRev'] = [sma.loc[ei,'sma'] if (sma.loc[ei,'tendance']==-1 and sma.loc[ei,'tendance+1']==1) or (sma.loc[ei,'tendance']==1 and sma.loc[ei,'tendance-1']==-1) else np.nan for ei in sma.index]
-        sma['dnRev'] = [sma.loc[ei,'sma'] if (sma.loc[ei,'tendance']==1 and sma.loc[ei,'tendance+1']==-1) or (sma.loc[ei,'tendance']==-1 and sma.loc[ei,'tendance-1']==1) else np.nan for ei in sma.index]
-         # Check if price is near the SMA
-        sma['distLow'] = (100*(sma['Low']/sma['sma']-1))
-        sma['distHigh'] = (100*(sma['sma']/sma['High']-1))
-        sma = sma.drop(['Open','High','Low'],axis=1)
-        pente_period = 1
-        if period>5:
-            pente_period = 5
-        sma['Pente'] = 100*(sma['sma'].div(sma['sma'].shift(pente_period))-1)
-        return sma
-    
+        return IndicatorGraph(self.data,limit=None).get(('sma',period))
+
     def get_bollinger(self,period=20,dev=2.0):
         """
         Return a DataFrame with the Bollinger Up / Middle / Low elements
         """
-        u = self.data.copy()
-        u['TP'] = (u['Low']+u['High']+u['Close'])/3 
-        u['std'] = u['TP'].rolling(20).std(ddof=0)
-        u['MA-TP'] = u['TP'].rolling(20).mean()
-        u['U'] = u['MA-TP'] + dev*u['std']
-        u['U-1'] = u['U'].shift(1)
-        u['tendance'] = [1 if u.loc[ei,'U']> u.loc[ei,'U-1'] else -1 for ei in u.index]
-        u['tendance+1'] = u['tendance'].shift(-1)
-        u['tendance-1'] = u['tendance'].shift(1)
-        #u['Uup'] = [u.loc[ei,'U'] if u.loc[ei,'U']> u.loc[ei,'U-1'] else np.nan for ei in u.index]
-        #u['Udn'] = [u.loc[ei,'U'] if u.loc[ei,'U']< u.loc[ei,'U-1'] else np.nan for ei in u.index]
-        u['Uup'] = [u.loc[ei,'U'] if (u.loc[ei,'tendance']==1 and u.loc[ei,'tendance-1']==1) or (u.loc[ei,'tendance']==1 and u.loc[ei,'tendance+1']==1) else np.nan for ei in u.index]
-        u['Udn'] = [u.loc[ei,'U'] if (u.loc[ei,'tendance']==-1 and u.loc[ei,'tendance-1']==-1) or (u.loc[ei,'tendance']==-1 and u.loc[ei,'tendance+1']==-1) else np.nan for ei in u.index]
-        u['UupRev'] = [u.loc[ei,'U'] if (u.loc[ei,'tendance']==-1 and u.loc[ei,'tendance+1']==1) or (u.loc[ei,'tendance']==1 and u.loc[ei,'tendance-1']==-1) else np.nan for ei in u.index]
-        u['UdnRev'] = [u.loc[ei,'U'] if (u.loc[ei,'tendance']==1 and u.loc[ei,'tendance+1']==-1) or (u.loc[ei,'tendance']==-1 and u.loc[ei,'tendance-1']==1) else np.nan for ei in u.index]
-        
-        u['L'] = u['MA-TP'] - dev*u['std']
-        u['L-1'] = u['L'].shift(1)
-        u['tendanceL'] = [1 if u.loc[ei,'L']> u.loc[ei,'L-1'] else -1 for ei in u.index]
-        u['tendanceL+1'] = u['tendanceL'].shift(-1)
-        u['tendanceL-1'] = u['tendanceL'].shift(1)
-        #u['Lup'] = [u.loc[ei,'L'] if u.loc[ei,'L']> u.loc[ei,'L-1'] else np.nan for ei in u.index]
-        #u['Ldn'] = [u.loc[ei,'L'] if u.loc[ei,'L']< u.loc[ei,'L-1'] else np.nan for ei in u.index]
-        u['Lup'] = [u.loc[ei,'L'] if (u.loc[ei,'tendanceL']==1 and u.loc[ei,'tendanceL-1']==1) or (u.loc[ei,'tendanceL']==1 and u.loc[ei,'tendanceL+1']==1) else np.nan for ei in u.index]
-        u['Ldn'] = [u.loc[ei,'L'] if (u.loc[ei,'tendanceL']==-1 and u.loc[ei,'tendanceL-1']==-1) or (u.loc[ei,'tendanceL']==-1 and u.loc[ei,'tendanceL+1']==-1) else np.nan for ei in u.index]
-        u['LupRev'] = [u.loc[ei,'L'] if (u.loc[ei,'tendanceL']==-1 and u.loc[ei,'tendanceL+1']==1) or (u.loc[ei,'tendanceL']==1 and u.loc[ei,'tendanceL-1']==-1) else np.nan for ei in u.index]
-        u['LdnRev'] = [u.loc[ei,'L'] if (u.loc[ei,'tendanceL']==1 and u.loc[ei,'tendanceL+1']==-1) or (u.loc[ei,'tendanceL']==-1 and u.loc[ei,'tendanceL-1']==1) else np.nan for ei in u.index]
-
-        u = u.drop(['Open','High','Low','TP','std','MA-TP'],axis=1)
-        return u      
-    
+        return IndicatorGraph(self.data,limit=None).get(('bollinger',period,dev))
+
     def get_psar(self, iaf = 0.02, maxaf = 0.2):
         """
         Return the Parabolic SAR, with 1 period of shift (as per AT.S environment)
@@ -175,8 +146,8 @@ class TAindicators():
         
         psar = pd.DataFrame({"Date":dates,"Close":close,"tmpSAR":tmpSAR,'tendance':tendance})  
         psar['psar'] = psar['tmpSAR']
-        psar['psarbull'] = [psar.loc[ei,'psar'] if psar.loc[ei,'tendance']==1 else np.nan for ei in psar.index]
-        psar['psarbear'] = [psar.loc[ei,'psar'] if psar.loc[ei,'tendance']==-1 else np.nan for ei in psar.index]
+        psar['psarbull'] = np.where(psar['tendance']==1,psar['psar'],np.nan)
+        psar['psarbear'] = np.where(psar['tendance']==-1,psar['psar'],np.nan)
         
         psar['psarbear-1'] = psar['psarbear'].shift(1)
         psar['psarbull-1'] = psar['psarbull'].shift(1)
@@ -187,6 +158,117 @@ class TAindicators():
         return psar
 
 
+#######################################################################################
+# Indicator graph: nodes (kind, parameters / inputs), each node computed once
+#######################################################################################
+# inputs: function of the parameters returning the input nodes, compute: function(graph, params, inputs)
+Node = namedtuple('Node',['inputs','compute'])
+
+
+def sma_output(graph,params,inputs):
+    """ Output node of the SMA: DataFrame with the bars (Close), SMA, trend and distances """
+    mean, mean_1, tendance, tendance_prev, tendance_next, segments, dist_low, dist_high, pente = inputs
+    sma = graph.get_base()
+    sma['sma'] = mean
+    sma['sma-1'] = mean_1
+    sma['tendance'] = tendance
+    sma['tendance+1'] = tendance_next
+    sma['tendance-1'] = tendance_prev
+    sma['up'], sma['dn'], sma['upRev'], sma['dnRev'] = segments
+    sma['distLow'] = dist_low
+    sma['distHigh'] = dist_high
+    sma['Pente'] = pente
+    return sma
+
+
+def bollinger_output(graph,params,inputs):
+    """ Output node of Bollinger: DataFrame with the bars (Close), upper and lower bands with their trends """
+    u = graph.get_base()
+    for band, suffix in [[inputs[0:6],''],[inputs[6:12],'L']]:
+        values, values_1, tendance, tendance_prev, tendance_next, segments = band
+        name = 'U' if suffix == '' else 'L'
+        u[name] = values
+        u[name+'-1'] = values_1
+        u['tendance'+suffix] = tendance
+        u['tendance'+suffix+'+1'] = tendance_next
+        u['tendance'+suffix+'-1'] = tendance_prev
+        u[name+'up'], u[name+'dn'], u[name+'upRev'], u[name+'dnRev'] = segments
+    return u
+
+
+def trend_inputs(src):
+    """ Input nodes of a value with its trend: value, previous value, tendance (current, previous, next), segments """
+    trend = ('trend',src)
+    return [src,('shift',src,1),trend,('shift',trend,1),('shift',trend,-1),('segments',src)]
+
+
+NODES = {
+    # Intermediates, on numpy arrays aligned with the bars
+    'col':Node(lambda name: [],
+               lambda graph, params, inputs: graph.data[params[0]].values),
+    'tp':Node(lambda: [('col','Low'),('col','High'),('col','Close')], # Typical price
+              lambda graph, params, inputs: (inputs[0]+inputs[1]+inputs[2])/3),
+    'mean':Node(lambda src, n: [src],
+                lambda graph, params, inputs: pd.Series(inputs[0]).rolling(params[1]).mean().values),
+    'std':Node(lambda src, n: [src],
+               lambda graph, params, inputs: pd.Series(inputs[0]).rolling(params[1]).std(ddof=0).values),
+    'band':Node(lambda src, n, dev: [('mean',src,n),('std',src,n)], # Mean +/- dev standard deviations
+                lambda graph, params, inputs: inputs[0]+params[2]*inputs[1]),
+    'shift':Node(lambda src, k: [src],
+                 lambda graph, params, inputs: shift(inputs[0],params[1])),
+    'trend':Node(lambda src: [src,('shift',src,1)], # 1 going up, -1 otherwise
+                 lambda graph, params, inputs: np.where(inputs[0]>inputs[1],1,-1)),
+    'segments':Node(lambda src: [src,('trend',src),('shift',('trend',src),1),('shift',('trend',src),-1)],
+                    lambda graph, params, inputs: get_trend_segments(*inputs)),
+    'dist':Node(lambda a, b: [a,b], # Distance in % of a from b
+                lambda graph, params, inputs: 100*(inputs[0]/inputs[1]-1)),
+    # Indicators of the AT.S view
+    'sma':Node(lambda period: trend_inputs(('mean',('col','Close'),period))+[
+                   ('dist',('col','Low'),('mean',('col','Close'),period)),
+                   ('dist',('mean',('col','Close'),period),('col','High')),
+                   ('dist',('mean',('col','Close'),period),('shift',('mean',('col','Close'),period),5 if period > 5 else 1))],
+               sma_output),
+    'bollinger':Node(lambda period, dev: trend_inputs(('band',('tp',),period,dev))+trend_inputs(('band',('tp',),period,-dev)),
+                     bollinger_output),
+    'psar':Node(lambda iaf, maxaf: [],
+                lambda graph, params, inputs: TAindicators(graph.data).get_psar(*params)),
+    }
+
+
+class IndicatorGraph():
+    """
+    Class evaluating indicators declared as nodes of a graph (see NODES), on the same bars:
+    intermediates shared by several indicators (columns, rolling means, shifts, trends) are computed once,
+    so a new indicator only costs its own nodes
+
+    Usage: graph = IndicatorGraph(data); m7, m20 = graph.evaluate([('sma',7),('sma',20)])
+    """
+    def __init__(self,data,limit=400):
+        if limit != None:
+            data = data.tail(limit) # As TAindicators, the last periods are enough
+        self.data = data
+        self.values = {} # Nodes already computed: {node: value}
+        return
+
+    def get_base(self):
+        """ :return: copy of the bars without Open / High / Low, base of the output DataFrames """
+        return self.data.drop(['Open','High','Low'],axis=1)
+
+    def get(self,node):
+        """ :return: value of the node, its inputs are computed first (once) """
+        if node in self.values:
+            return self.values[node]
+        kind = node[0]
+        params = node[1:]
+        inputs = [self.get(dep) for dep in NODES[kind].inputs(*params)]
+        self.values[node] = NODES[kind].compute(self,params,inputs)
+        return self.values[node]
+
+    def evaluate(self,nodes):
+        """ :return: list of the values of the nodes """
+        return [self.get(node) for node in nodes]
+
+
 
 
 ##############################################################################